@@ -0,0 +1,3 @@
+"""
+Benchmarks for happy, run against a local fake Heroku API.
+"""
@@ -0,0 +1,121 @@
+"""
+How long the happy command takes to start.
+
+Runs ``python -X importtime`` on ``happy.cli`` several times and checks the
+median import time against a budget, and that modules only needed for API
+calls, like requests, aren't imported at all. Run it from the root of the
+repo::
+
+    python -m benchmarks.startup
+
+The exit status is 1 if the budget is exceeded or a deferred module is
+imported.
+"""
+import os
+import subprocess
+import sys
+import time
+
+import click
+
+#: Most milliseconds importing ``happy.cli`` should take, click included
+BUDGET_MS = 90
+
+#: Modules that should only be imported once a command calls the API
+DEFERRED_MODULES = ('requests', 'urllib3', 'tarfile', 'concurrent.futures')
+
+#: Runs the command-line tool's help, the cheapest thing it can do
+HELP_COMMAND = 'from happy.cli import cli; cli(["--help"])'
+
+
+def median(values):
+    """Returns the median of some values."""
+    values = sorted(values)
+    middle = len(values) // 2
+
+    if len(values) % 2:
+        return values[middle]
+
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def import_times():
+    """Imports ``happy.cli`` in a new interpreter.
+
+    :returns: A dict of cumulative import times in microseconds, by module.
+    """
+    output = subprocess.check_output(
+        [sys.executable, '-X', 'importtime', '-c', 'import happy.cli'],
+        stderr=subprocess.STDOUT,
+    ).decode('utf-8')
+
+    times = {}
+
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+
+        self_time_, cumulative, name = line[len('import time:'):].split('|')
+
+        try:
+            times[name.strip()] = int(cumulative)
+        except ValueError:  # The header
+            continue
+
+    return times
+
+
+def help_time():
+    """Returns seconds taken to run ``happy --help`` in a new interpreter."""
+    start = time.time()
+
+    with open(os.devnull, 'w') as devnull:
+        subprocess.check_call(
+            [sys.executable, '-c', HELP_COMMAND],
+            stdout=devnull,
+        )
+
+    return time.time() - start
+
+
+@click.command()
+@click.option('--runs', default=10, help='Number of times to start happy.')
+@click.option('--budget-ms', default=BUDGET_MS,
+              help='Most milliseconds importing happy.cli may take.')
+def main(runs, budget_ms):
+    """Checks how long the happy command takes to start."""
+    if sys.version_info < (3, 7):
+        click.echo('python -X importtime needs Python 3.7 or later.')
+        sys.exit(1)
+
+    runs_times = [import_times() for index_ in range(runs)]
+    import_ms = median([
+        times['happy.cli'] / 1000.0 for times in runs_times
+    ])
+    help_ms = median([help_time() * 1000 for index_ in range(runs)])
+
+    click.echo('Import happy.cli: %.1f ms (budget %d ms)' % (
+        import_ms, budget_ms,
+    ))
+    click.echo('Run happy --help: %.1f ms, interpreter included' % help_ms)
+
+    failed = False
+
+    if import_ms > budget_ms:
+        click.echo('Importing happy.cli is over budget.')
+        failed = True
+
+    imported = sorted(
+        name for name in DEFERRED_MODULES if name in runs_times[0]
+    )
+
+    if imported:
+        click.echo('Imported at startup: %s' % ', '.join(imported))
+        failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
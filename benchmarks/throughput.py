@@ -0,0 +1,262 @@
+"""
+How fast happy brings apps up and down, at increasing concurrency.
+
+Every concurrency level brings up a batch of apps with ``Happy.create_many``
+against a fresh :class:`~happy.testing.FakeHeroku`, then brings them down
+with ``Happy.delete_many``, through the same client code the CLI uses. Run
+it from the root of the repo::
+
+    python -m benchmarks.throughput
+
+Results are compared with ``benchmarks/baselines/throughput.json``, and the
+exit status is 1 if anything got worse by more than the tolerance. Pass
+``--save-baseline`` to record a new baseline after an intended change.
+"""
+import json
+import math
+import os
+import sys
+import time
+
+import click
+from concurrent.futures import wait as wait_futures
+
+from happy import Happy
+from happy.heroku import Heroku
+from happy.testing import FakeHeroku, lognormal
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+#: Default path of the stored baseline
+BASELINE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'baselines', 'throughput.json',
+)
+
+#: Results compared with the baseline, and whether bigger is better
+COMPARED = [
+    ('up_per_sec', True),
+    ('ttr_p50', False),
+    ('ttr_p95', False),
+    ('ttr_p99', False),
+    ('api_rps', True),
+    ('calls_per_build', False),
+    ('down_per_sec', True),
+    ('peak_rss_mb', False),
+]
+
+
+def percentile(values, percent):
+    """Returns a nearest-rank percentile of some values."""
+    values = sorted(values)
+    rank = int(math.ceil(percent / 100.0 * len(values)))
+
+    return values[max(rank - 1, 0)]
+
+
+def peak_rss_mb():
+    """Returns this process's peak resident set size in megabytes."""
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux counts kilobytes, macOS counts bytes
+    if sys.platform == 'darwin':
+        peak /= 1024.0
+
+    return round(peak / 1024.0, 1)
+
+
+def run_level(concurrency, apps, build_time, latency, max_poll_rate, seed):
+    """Brings a batch of apps up and down, and measures how it went.
+
+    :returns: A dict of results.
+    """
+    fake = FakeHeroku(
+        build_time=build_time,
+        latency=lognormal(latency, 0.3, seed=seed) if latency else 0,
+        seed=seed,
+    )
+
+    with fake:
+        api = Heroku(
+            auth_token='benchmark',
+            api_root=fake.url,
+            pool_size=concurrency,
+        )
+        happy = Happy(api=api, max_poll_rate=max_poll_rate)
+
+        # When each app's app-setup was created and when it was up, so time
+        # to ready doesn't include time spent queued behind other apps
+        seen_at = {}
+
+        def on_status(build_id, app_name, status):
+            seen_at[(app_name, status)] = time.time()
+
+        up_start = time.time()
+
+        futures = happy.create_many(
+            'https://example.com/app.tar.gz',
+            count=apps,
+            max_workers=concurrency,
+            on_status=on_status,
+        )
+
+        wait_futures(futures)
+        up_time = time.time() - up_start
+
+        app_names = [future.result()[1] for future in futures]
+        up_calls = sum(fake.request_counts.values())
+
+        down_start = time.time()
+
+        for future in happy.delete_many(app_names, max_workers=concurrency):
+            future.result()
+
+        down_time = time.time() - down_start
+
+        calls = sum(fake.request_counts.values())
+
+        happy.close()
+        api.close()
+
+    times_to_ready = [
+        seen_at[(app_name, 'up')] - seen_at[(app_name, 'building')]
+        for app_name in app_names
+    ]
+
+    return {
+        'concurrency': concurrency,
+        'up_per_sec': round(apps / up_time, 2),
+        'ttr_p50': round(percentile(times_to_ready, 50), 3),
+        'ttr_p95': round(percentile(times_to_ready, 95), 3),
+        'ttr_p99': round(percentile(times_to_ready, 99), 3),
+        'api_rps': round(calls / (up_time + down_time), 1),
+        'calls_per_build': round(float(up_calls) / apps, 2),
+        'down_per_sec': round(apps / down_time, 2),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Prints how results changed from a baseline.
+
+    :returns: A list of ``(concurrency, name)`` tuples that got worse by
+        more than ``tolerance``.
+    """
+    regressions = []
+    levels = dict(
+        (level['concurrency'], level) for level in baseline['results']
+    )
+
+    click.echo('%-12s %-16s %10s %10s %8s' % (
+        'Concurrency', 'Result', 'Baseline', 'Current', 'Change',
+    ))
+
+    for result in results:
+        before = levels.get(result['concurrency'])
+
+        if before is None:
+            continue
+
+        for name, bigger_is_better in COMPARED:
+            old, new = before.get(name), result.get(name)
+
+            if not old or new is None:
+                continue
+
+            change = (new - old) / float(old)
+            worse = -change if bigger_is_better else change
+            flag = ''
+
+            if worse > tolerance:
+                regressions.append((result['concurrency'], name))
+                flag = '  WORSE'
+
+            click.echo('%-12d %-16s %10s %10s %+7.0f%%%s' % (
+                result['concurrency'], name, old, new, change * 100, flag,
+            ))
+
+    return regressions
+
+
+@click.command()
+@click.option('--concurrency', 'levels', default='1,4,16',
+              help='Comma-separated concurrency levels to run.')
+@click.option('--apps', default=16, help='Apps brought up at each level.')
+@click.option('--build-time', default=1.0,
+              help='Seconds each fake app-setup takes.')
+@click.option('--latency', default=0.02,
+              help='Median seconds each fake API request takes.')
+@click.option('--max-poll-rate', default=5.0,
+              help='Most build status checks per second.')
+@click.option('--seed', default=1, help='Seed for the fake latency.')
+@click.option('--baseline', default=BASELINE, type=click.Path(),
+              help='Path of the baseline to compare with.')
+@click.option('--tolerance', default=0.25,
+              help='How much worse a result can get, e.g. 0.25 for 25%.')
+@click.option('--save-baseline', is_flag=True,
+              help='Save the results as the new baseline.')
+def main(levels, apps, build_time, latency, max_poll_rate, seed, baseline,
+         tolerance, save_baseline):
+    """Benchmarks bringing apps up and down against a fake Heroku API."""
+    settings = {
+        'apps': apps,
+        'build_time': build_time,
+        'latency': latency,
+        'max_poll_rate': max_poll_rate,
+        'seed': seed,
+    }
+    results = []
+
+    for level in [int(level) for level in levels.split(',')]:
+        click.echo('Running %d apps at concurrency %d... ' % (apps, level),
+                   nl=False)
+
+        result = run_level(level, **settings)
+        results.append(result)
+
+        click.echo('%.2f up/s, p95 time to ready %.2fs' % (
+            result['up_per_sec'], result['ttr_p95'],
+        ))
+
+    click.echo('')
+
+    if save_baseline:
+        with open(baseline, 'w') as f:
+            json.dump({'settings': settings, 'results': results}, f,
+                      indent=2, sort_keys=True)
+            f.write('\n')
+
+        click.echo('Saved baseline to %s.' % baseline)
+        return
+
+    if not os.path.exists(baseline):
+        click.echo(json.dumps(results, indent=2, sort_keys=True))
+        click.echo('No baseline at %s to compare with.' % baseline)
+        return
+
+    with open(baseline) as f:
+        stored = json.load(f)
+
+    if stored['settings'] != settings:
+        click.echo(json.dumps(results, indent=2, sort_keys=True))
+        click.echo('The baseline was run with different settings: %s' % (
+            json.dumps(stored['settings'], sort_keys=True),
+        ))
+        return
+
+    regressions = compare(results, stored, tolerance)
+
+    if regressions:
+        click.echo('\n%d results got worse by more than %d%%.' % (
+            len(regressions), tolerance * 100,
+        ))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,149 @@
 """
 Quickly set up and tear down Heroku apps!
+
+Modules only some commands need, like packaging source code and polling lots
+of builds at once, are imported where they're used to keep startup fast.
 """
-from .heroku import Heroku
+from .heroku import APIError, BuildError, BuildTimeout, Heroku, parse_time
+from .hooks import Hooks
+from .polling import Backoff
+from .profile import build_phase
 
+import threading
+import time
+from contextlib import contextmanager
+from fnmatch import fnmatchcase
 from time import sleep
 
 
+@contextmanager
+def _null_context():
+    """A context manager that does nothing."""
+    yield
+
+
 class Happy(object):
     """The happiest interface of all."""
-    def __init__(self, auth_token=None):
+    def __init__(self, auth_token=None, api=None, max_poll_rate=5.0,
+                 rate_limiter=None, profiler=None, hooks=None, tracer=None,
+                 list_cache=None):
         """Initializes the class.
 
         :param auth_token: A Heroku API auth token.
+        :param api: (optional) A ``Heroku`` client to share with other
+            ``Happy`` instances. If this is given, ``auth_token`` and
+            ``rate_limiter`` are ignored and closing this instance leaves the
+            client open.
+        :param max_poll_rate: (optional) Most build status checks sent per
+            second by :meth:`watch`, across all builds.
+        :param rate_limiter: (optional) A ``RateLimiter`` for API requests.
+        :param profiler: (optional) A ``Profiler`` that records how long each
+            phase of :meth:`create`, :meth:`wait` and :meth:`stream` takes,
+            and every API call if ``api`` isn't given.
+        :param hooks: (optional) ``Hooks`` to fire ``build_status_change``
+            events on, and request events too if ``api`` isn't given.
+            Defaults to new ones, found on the ``hooks`` attribute.
+        :param tracer: (optional) A ``Tracer`` that records spans for each
+            app and operation, and every API call if ``api`` isn't given.
+        :param list_cache: (optional) An ``AppListCache`` whose list of the
+            account's apps is dropped whenever :meth:`create` or
+            :meth:`delete` changes them.
+        """
+        self._profiler = profiler
+        self._tracer = tracer
+        self.hooks = Hooks() if hooks is None else hooks
+
+        if profiler is not None:
+            profiler.subscribe(self.hooks)
+
+        if tracer is not None:
+            tracer.subscribe(self.hooks)
+
+        if api is None:
+            self._api = Heroku(
+                auth_token=auth_token,
+                rate_limiter=rate_limiter,
+                hooks=self.hooks,
+            )
+            self._owns_api = True
+        else:
+            self._api = api
+            self._owns_api = False
+
+        self._list_cache = list_cache
+        self._max_poll_rate = max_poll_rate
+        self._watcher = None
+        self._watcher_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def watcher(self):
+        """The shared ``BuildWatcher``, created on first use."""
+        if self._watcher is None:
+            from .watcher import BuildWatcher
+
+            with self._watcher_lock:
+                if self._watcher is None:
+                    self._watcher = BuildWatcher(
+                        self._check_build,
+                        max_rate=self._max_poll_rate,
+                    )
+
+        return self._watcher
+
+    def close(self):
+        """Stops watching builds and closes the Heroku client, unless it was
+        passed in.
         """
-        self._api = Heroku(auth_token=auth_token)
+        with self._watcher_lock:
+            watcher, self._watcher = self._watcher, None
+
+        if watcher is not None:
+            watcher.close()
+
+        if self._owns_api:
+            self._api.close()
+
+    def upload(self, path, cache=None):
+        """Uploads a directory as a source tarball.
+
+        The tarball is streamed straight from the files, respecting
+        ``.gitignore``, without a temporary file.
+
+        :param path: Path of the directory to upload.
+        :param cache: (optional) A ``SourceCache``. If the same files were
+            uploaded recently, that upload is reused.
+        :returns: A tarball URL to pass to :meth:`create`.
+        """
+        with self._phase('upload', path=path):
+            return self._upload(path, cache)
+
+    def _upload(self, path, cache):
+        """Uploads a directory as a source tarball, without profiling."""
+        from .source import Tarball
+
+        tarball = Tarball(path)
+
+        if cache is not None:
+            digest = tarball.digest()
+            url = cache.get(digest)
+
+            if url:
+                return url
+
+        source = self._api.create_source()
+
+        self._api.upload_source(source['put_url'], tarball)
+
+        if cache is not None:
+            cache.put(digest, source['get_url'], size=len(tarball))
+
+        return source['get_url']
 
     def create(self, tarball_url, env=None, app_name=None):
         """Creates a Heroku app-setup build.
@@ -23,27 +153,447 @@ class Happy(object):
         :param app_name: (optional) Name of the Heroku app to create.
         :returns: A tuple with ``(build_id, app_name)``.
         """
-        data = self._api.create_build(
-            tarball_url=tarball_url,
-            env=env,
-            app_name=app_name,
-        )
+        with self._phase('create', app=app_name):
+            data = self._api.create_build(
+                tarball_url=tarball_url,
+                env=env,
+                app_name=app_name,
+            )
+
+        self._forget_app_list()
 
         return (data['id'], data['app']['name'])
 
-    def wait(self, build_id):
+    def app_exists(self, app_name):
+        """Checks whether a Heroku app exists.
+
+        :param app_name: Name of the Heroku app.
+        :returns: ``True`` if it exists, ``False`` if it doesn't.
+        """
+        try:
+            self._api.get_app(app_name)
+        except APIError as exc:
+            if exc.status_code == 404:
+                return False
+            raise
+
+        return True
+
+    def rebuild(self, app_name, tarball_url, env=None):
+        """Builds new code on an existing app, without setting up a new
+        app and its addons like :meth:`create` does.
+
+        :param app_name: Name of the Heroku app.
+        :param tarball_url: URL of a tarball of the app's code.
+        :param env: (optional) Dict of environment variables to set first,
+            in one request.
+        :returns: The ID of the build, to pass to :meth:`wait` or
+            :meth:`stream` along with ``app_name``.
+        """
+        if env:
+            self.configure(app_name=app_name, env=env)
+
+        with self._phase('rebuild', app=app_name):
+            data = self._api.create_app_build(
+                app_name=app_name,
+                tarball_url=tarball_url,
+            )
+
+        return data['id']
+
+    @contextmanager
+    def _phase(self, name, **attributes):
+        """Times a phase, if profiling, and traces it as a span."""
+        with self._span(name, **attributes):
+            if self._profiler is None:
+                yield
+            else:
+                with self._profiler.phase(name):
+                    yield
+
+    def _span(self, name, **attributes):
+        """Returns a context manager tracing a span, if tracing.
+
+        The context manager gives the ``Span``, or ``None``.
+        """
+        if self._tracer is None:
+            return _null_context()
+
+        return self._tracer.span(name, **attributes)
+
+    def _get_build(self, build_id, previous=None, app_name=None):
+        """Fetches an app-setup build, firing ``build_status_change`` if its
+        status has changed.
+
+        The status is the app-setup's phase while it's pending (see
+        :func:`~happy.profile.build_phase`), then ``succeeded`` or
+        ``failed``.
+
+        :param build_id: ID of the app-setup build.
+        :param previous: (optional) The status last seen.
+        :param app_name: (optional) Name of the app, if ``build_id`` is a
+            build from :meth:`rebuild` rather than an app-setup. Its status
+            is ``build`` while it's pending.
+        :returns: A tuple with ``(data, status)``.
+        """
+        if app_name is None:
+            data = self._api.get_build(build_id)
+            status = build_phase(data) or data.get('status')
+        else:
+            data = self._api.get_app_build(app_name, build_id)
+            status = data.get('status')
+
+            if status == 'pending':
+                status = 'build'
+
+        if status != previous:
+            self.hooks.fire(
+                'build_status_change',
+                build_id=build_id,
+                status=status,
+                previous=previous,
+                data=data,
+            )
+
+        return (data, status)
+
+    def _check_build(self, build_id, previous=None):
+        """Checks on an app-setup build once, for the watcher.
+
+        :param build_id: ID of the app-setup build.
+        :param previous: (optional) The status last seen.
+        :returns: A tuple with ``(done, status)``.
+        """
+        data, status = self._get_build(build_id, previous)
+
+        return (self._api.build_status(data), status)
+
+    def wait(self, build_id, timeout=None, policy=None, app_name=None):
         """Waits for an app-setup build to finish.
 
         :param build_id: ID of the app-setup build for which to wait.
+        :param timeout: (optional) Seconds to wait before giving up.
+        :param policy: (optional) Polling policy, e.g. a ``Backoff``. If this
+            is given, ``timeout`` is ignored in favor of the policy's own.
+        :param app_name: (optional) Name of the app, if ``build_id`` is a
+            build from :meth:`rebuild`.
+        :raises BuildTimeout: If the build isn't done in time.
         """
+        delays = (policy or Backoff(timeout=timeout)).delays()
+
+        with self._span('wait', build_id=build_id):
+            self._poll(build_id, delays, app_name=app_name)
+
+    def _poll(self, build_id, delays, status=None, app_name=None):
+        """Polls an app-setup build until it's done or ``delays`` runs out."""
         while True:
-            if self._api.check_build_status(build_id):
+            data, status = self._get_build(build_id, status, app_name)
+
+            if self._api.build_status(data):
                 break
-            sleep(3)
+
+            delay = next(delays, None)
+
+            if delay is None:
+                raise BuildTimeout(
+                    'Timed out waiting for build %s.' % build_id
+                )
+
+            sleep(delay)
+
+    def stream(self, build_id, callback, timeout=None, app_name=None):
+        """Waits for an app-setup build, passing along its output as it's
+        written.
+
+        The end of the build is found from its output stream rather than by
+        polling. The app-setup is only polled until the build starts, and
+        once more after it ends, since addons and postdeploy scripts can
+        still be running.
+
+        :param build_id: ID of the app-setup build for which to wait.
+        :param callback: Called with each chunk of build output text.
+        :param timeout: (optional) Seconds to spend polling before giving up.
+        :param app_name: (optional) Name of the app, if ``build_id`` is a
+            build from :meth:`rebuild`.
+        :raises BuildTimeout: If the build isn't done in time.
+        """
+        with self._span('stream', build_id=build_id):
+            self._stream(build_id, callback, timeout, app_name)
+
+    def _stream(self, build_id, callback, timeout, app_name=None):
+        """Waits for an app-setup build with its output, without tracing."""
+        delays = Backoff(timeout=timeout).delays()
+        status = None
+
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        while True:
+            data, status = self._get_build(build_id, status, app_name)
+
+            if self._api.build_status(data):
+                return
+
+            # An app-setup's build is inside it, once it's started
+            build = data if app_name else data.get('build') or {}
+
+            if build.get('output_stream_url'):
+                break
+
+            delay = next(delays, None)
+
+            if delay is None:
+                raise BuildTimeout(
+                    'Timed out waiting for build %s.' % build_id
+                )
+
+            sleep(delay)
+
+        remaining = None
+
+        if timeout is not None:
+            remaining = deadline - time.time()
+
+            if remaining <= 0:
+                raise BuildTimeout(
+                    'Timed out waiting for build %s.' % build_id
+                )
+
+        for chunk in self._api.stream_build_output(
+            build['output_stream_url'],
+            timeout=remaining,
+        ):
+            callback(chunk)
+
+        self._poll(build_id, delays, status, app_name)
+
+    def watch(self, build_id, timeout=None, policy=None, callback=None):
+        """Waits for an app-setup build in the background.
+
+        Every build watched by this instance is polled from one shared
+        thread, so the number of API calls stays bounded however many builds
+        are in flight.
+
+        :param build_id: ID of the app-setup build for which to wait.
+        :param timeout: (optional) Seconds to wait before giving up.
+        :param policy: (optional) Polling policy, e.g. a ``Backoff``.
+        :param callback: (optional) Called with the ``Future`` when the build
+            is done.
+        :returns: A ``Future`` that resolves when the build is done, or
+            raises ``BuildError`` or ``BuildTimeout``.
+        """
+        return self.watcher.watch(
+            build_id,
+            timeout=timeout,
+            policy=policy,
+            callback=callback,
+        )
+
+    def create_many(self, tarball_url, count, env=None, envs=None,
+                    app_names=None, max_workers=8, timeout=None,
+                    delete_on_timeout=False, on_status=None):
+        """Creates several app-setup builds at once and waits for them.
+
+        :param tarball_url: URL of a tarball containing an ``app.json``.
+        :param count: Number of apps to create.
+        :param env: (optional) Dict of environment variable overrides for
+            every app.
+        :param envs: (optional) List of per-app override dicts, merged over
+            ``env``.
+        :param app_names: (optional) List of names of the apps to create.
+        :param max_workers: (optional) Maximum number of apps set up at once.
+        :param timeout: (optional) Seconds to wait for each build.
+        :param delete_on_timeout: (optional) Delete apps whose builds time
+            out.
+        :param on_status: (optional) Called with ``(build_id, app_name,
+            status)`` as each app's status changes: ``building`` as soon as
+            its app-setup is created, then ``up``, ``failed``, or
+            ``deleted`` if it timed out and was deleted.
+        :returns: A list of ``Future`` objects in submission order. Each one
+            resolves to ``(build_id, app_name)`` when its build is done.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        futures = []
+
+        for index in range(count):
+            app_env = dict(env or {})
+            app_env.update(envs[index] if envs else {})
+
+            futures.append(executor.submit(
+                self._create_and_wait,
+                tarball_url=tarball_url,
+                env=app_env or None,
+                app_name=app_names[index] if app_names else None,
+                timeout=timeout,
+                delete_on_timeout=delete_on_timeout,
+                on_status=on_status,
+            ))
+
+        executor.shutdown(wait=False)
+
+        return futures
+
+    def _create_and_wait(self, tarball_url, env=None, app_name=None,
+                         timeout=None, delete_on_timeout=False,
+                         on_status=None):
+        """Creates an app-setup build and waits for it to finish."""
+        with self._span('app', app=app_name) as span:
+            build_id, app_name = self.create(
+                tarball_url=tarball_url,
+                env=env,
+                app_name=app_name,
+            )
+
+            if span is not None:
+                span.attributes['app'] = app_name
+
+            def report(status):
+                if on_status is not None:
+                    on_status(build_id, app_name, status)
+
+            report('building')
+
+            try:
+                with self._span('wait', build_id=build_id):
+                    self.watch(build_id, timeout=timeout).result()
+            except BuildTimeout:
+                if delete_on_timeout:
+                    self.delete(app_name=app_name)
+                    report('deleted')
+                raise
+            except BuildError:
+                report('failed')
+                raise
+
+            report('up')
+
+        return (build_id, app_name)
+
+    def configure(self, app_name, env):
+        """Updates a Heroku app's environment variables.
+
+        :param app_name: Name of the Heroku app to update.
+        :param env: Dict containing environment variables to set.
+        """
+        with self._span('configure', app=app_name):
+            self._api.update_config(app_name=app_name, env=env)
 
     def delete(self, app_name):
         """Deletes a Heroku app.
 
         :param app_name: Name of the Heroku app to delete.
         """
-        self._api.delete_app(app_name=app_name)
+        with self._span('delete', app=app_name):
+            self._api.delete_app(app_name=app_name)
+
+        self._forget_app_list()
+
+    def delete_many(self, app_names, max_workers=8):
+        """Deletes several Heroku apps at once.
+
+        :param app_names: List of names of the Heroku apps to delete.
+        :param max_workers: (optional) Maximum number of apps deleted at once.
+        :returns: A list of ``Future`` objects in the same order as
+            ``app_names``. Each one resolves when its app is deleted.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        futures = [
+            executor.submit(self.delete, app_name=app_name)
+            for app_name in app_names
+        ]
+
+        executor.shutdown(wait=False)
+
+        return futures
+
+    def find_apps(self, pattern):
+        """Finds the names of the account's apps matching a glob pattern.
+
+        :param pattern: A glob pattern, e.g. ``ci-*``.
+        :returns: A list of matching app names.
+        """
+        return [
+            app['name'] for app in self._api.iter_apps()
+            if fnmatchcase(app['name'], pattern)
+        ]
+
+    def _forget_app_list(self):
+        """Drops the cached list of apps, since it's changed."""
+        if self._list_cache is not None:
+            self._list_cache.invalidate(self._api.account_key)
+
+    def iter_apps(self, cache=None):
+        """Lists the account's apps a page at a time, as they're needed.
+
+        :param cache: (optional) An ``AppListCache`` to reuse a recent list
+            from. Otherwise, the list is saved in it once it's all been
+            read.
+        :returns: A generator of app ``dict`` objects, ordered by name. Apps
+            from the cache only have a ``name`` and ``created_at``.
+        """
+        if cache is None:
+            for app in self._api.iter_apps():
+                yield app
+            return
+
+        key = self._api.account_key
+        apps = cache.get(key)
+
+        if apps is not None:
+            for app in apps:
+                yield app
+            return
+
+        apps = []
+
+        for app in self._api.iter_apps():
+            apps.append({'name': app['name'], 'created_at': app['created_at']})
+            yield app
+
+        cache.put(key, apps)
+
+    def find_expired_apps(self, max_age, prefixes=None, app_names=None):
+        """Finds the account's apps that have been around too long.
+
+        Only apps whose names start with one of ``prefixes``, or are in
+        ``app_names``, can expire, so apps that happy didn't bring up are
+        left alone. The account's apps are listed a page at a time.
+
+        :param max_age: Seconds after its creation that an app expires.
+        :param prefixes: (optional) List of prefixes of app names, e.g.
+            ``['ci-']``.
+        :param app_names: (optional) List of app names, e.g. the ones
+            recorded in a ``State``.
+        :returns: A list of ``(app_name, age)`` tuples, oldest first, with
+            ages in seconds.
+        :raises ValueError: If a prefix is empty, since it would match every
+            app.
+        """
+        prefixes = tuple(prefixes or ())
+
+        if not all(prefixes):
+            raise ValueError("Prefixes can't be empty.")
+
+        app_names = set(app_names or ())
+        now = time.time()
+        expired = []
+
+        for app in self._api.iter_apps():
+            app_name = app['name']
+
+            if app_name not in app_names and \
+                    not (prefixes and app_name.startswith(prefixes)):
+                continue
+
+            age = now - parse_time(app['created_at'])
+
+            if age > max_age:
+                expired.append((app_name, age))
+
+        return sorted(expired, key=lambda item: -item[1])
@@ -0,0 +1,144 @@
+"""
+Asyncio interfaces for happy.
+
+These wrap the blocking :class:`~happy.heroku.Heroku` client, so requests and
+responses are handled exactly the same way. API calls run on a small thread
+pool sized to the client's connection pool, while all the waiting between
+them happens on the event loop. One loop can drive hundreds of app setups.
+
+This module needs Python 3.7 or newer.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from .heroku import BuildTimeout, Heroku
+from .polling import Backoff
+
+
+class AsyncHeroku(object):
+    """Asyncio methods for interacting with the Heroku API."""
+    def __init__(self, auth_token=None, pool_size=10, api=None):
+        """Initializes the class.
+
+        :param auth_token: A Heroku API auth token.
+        :param pool_size: (optional) Maximum number of API requests in flight
+            at once.
+        :param api: (optional) A ``Heroku`` client to wrap. If this is given,
+            ``auth_token`` is ignored and closing this instance leaves the
+            client open.
+        """
+        if api is None:
+            self._api = Heroku(auth_token=auth_token, pool_size=pool_size)
+            self._owns_api = True
+        else:
+            self._api = api
+            self._owns_api = False
+
+        self._executor = ThreadPoolExecutor(max_workers=pool_size)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _call(self, func, *args, **kwargs):
+        """Runs a blocking client method on the thread pool."""
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(
+            self._executor,
+            functools.partial(func, *args, **kwargs),
+        )
+
+    async def close(self):
+        """Shuts down the thread pool and closes the client, if it's ours."""
+        self._executor.shutdown(wait=False)
+
+        if self._owns_api:
+            self._api.close()
+
+    async def api_request(self, method, endpoint, data=None, *args, **kwargs):
+        """Sends an API request to Heroku. See :meth:`Heroku.api_request`."""
+        return await self._call(
+            self._api.api_request, method, endpoint, data, *args, **kwargs
+        )
+
+    async def create_build(self, tarball_url, env=None, app_name=None):
+        """Creates an app-setups build. See :meth:`Heroku.create_build`."""
+        return await self._call(
+            self._api.create_build,
+            tarball_url=tarball_url,
+            env=env,
+            app_name=app_name,
+        )
+
+    async def check_build_status(self, build_id):
+        """Checks an app-setups build. See :meth:`Heroku.check_build_status`.
+        """
+        return await self._call(self._api.check_build_status, build_id)
+
+    async def delete_app(self, app_name):
+        """Deletes an app. See :meth:`Heroku.delete_app`."""
+        return await self._call(self._api.delete_app, app_name=app_name)
+
+
+class AsyncHappy(object):
+    """The happiest interface of all, now with asyncio."""
+    def __init__(self, auth_token=None, api=None):
+        """Initializes the class.
+
+        :param auth_token: A Heroku API auth token.
+        :param api: (optional) An ``AsyncHeroku`` client to share with other
+            ``AsyncHappy`` instances. If this is given, ``auth_token`` is
+            ignored and closing this instance leaves the client open.
+        """
+        if api is None:
+            self._api = AsyncHeroku(auth_token=auth_token)
+            self._owns_api = True
+        else:
+            self._api = api
+            self._owns_api = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Closes the Heroku client, unless it was passed in."""
+        if self._owns_api:
+            await self._api.close()
+
+    async def create(self, tarball_url, env=None, app_name=None):
+        """Creates a Heroku app-setup build. See :meth:`Happy.create`."""
+        data = await self._api.create_build(
+            tarball_url=tarball_url,
+            env=env,
+            app_name=app_name,
+        )
+
+        return (data['id'], data['app']['name'])
+
+    async def wait(self, build_id, timeout=None, policy=None):
+        """Waits for an app-setup build to finish. See :meth:`Happy.wait`."""
+        delays = (policy or Backoff(timeout=timeout)).delays()
+
+        while True:
+            if await self._api.check_build_status(build_id):
+                break
+
+            delay = next(delays, None)
+
+            if delay is None:
+                raise BuildTimeout(
+                    'Timed out waiting for build %s.' % build_id
+                )
+
+            await asyncio.sleep(delay)
+
+    async def delete(self, app_name):
+        """Deletes a Heroku app. See :meth:`Happy.delete`."""
+        await self._api.delete_app(app_name=app_name)
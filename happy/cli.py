@@ -5,10 +5,27 @@ import json
 import os
 import subprocess
 import sys
+import time
+from fnmatch import fnmatchcase
 
 import click
 
 from happy import Happy
+from happy.heroku import BuildError, BuildTimeout, parse_time
+from happy.listing import LIST_TTL, AppListCache
+from happy.metrics import Metrics
+from happy.pool import DEFAULT_STATE_FILE as DEFAULT_POOL_FILE, Pool
+from happy.profile import Profiler
+from happy.ratelimit import RateLimiter
+from happy.state import DEFAULT_STATE_FILE, State
+from happy.trace import FORMATS as TRACE_FORMATS, Tracer
+
+
+def _app_list_cache():
+    """Returns the app list cache used by ``happy ls`` by default, so it can
+    be dropped when apps are created or deleted.
+    """
+    return AppListCache(os.environ.get('HAPPY_LIST_CACHE'))
 
 
 def _infer_tarball_url():
@@ -29,27 +46,111 @@ def _infer_tarball_url():
         return app_json.get('repository') + '/tarball/master/'
 
 
-def _write_app_name(app_name):
-    """Writes the app name to the .happy file."""
-    with click.open_file('.happy', 'w') as f:
-        f.write(str(app_name))
+def _parse_env(env):
+    """Splits ["KEY=value", ...] into {"KEY": "value", ...}."""
+    return {
+        arg.split('=')[0]: arg.split('=')[1]
+        for arg in env
+    }
 
 
-def _read_app_name():
-    """Reads the app name from the .happy file."""
-    try:
-        with click.open_file('.happy', 'r') as f:
-            return f.read().strip()
-    except IOError:
-        return None
+def _format_bytes(size):
+    """Formats a number of bytes for humans."""
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return '%.1f %s' % (size, unit)
+        size /= 1024.0
+
+    return '%.1f GB' % size
 
 
-def _delete_app_name_file():
-    """Deletes the .happy file. :("""
+def _parse_duration(duration):
+    """Parses a duration like ``90``, ``30m``, ``6h`` or ``2d`` to seconds.
+
+    :raises ValueError: If the duration can't be parsed.
+    """
+    units = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+    duration = duration.strip().lower()
+
+    if duration[-1:] in units:
+        return float(duration[:-1]) * units[duration[-1]]
+
+    return float(duration)
+
+
+def _validate_duration(ctx, param, value):
+    """Parses a duration option to seconds."""
+    if value is None:
+        return None
+
     try:
-        os.remove('.happy')
-    except (IOError, OSError):
-        pass
+        return _parse_duration(value)
+    except ValueError:
+        raise click.BadParameter('Expected a duration like 30m, 6h or 2d.')
+
+
+def _validate_prefixes(ctx, param, value):
+    """Rejects empty prefixes, which would match every app."""
+    if any(not prefix.strip() for prefix in value):
+        raise click.BadParameter("Prefixes can't be empty.")
+
+    return value
+
+
+def _format_age(seconds):
+    """Formats a number of seconds for humans."""
+    for unit, size in (('s', 60), ('m', 60), ('h', 24)):
+        if seconds < size:
+            return '%.0f%s' % (seconds, unit)
+        seconds /= float(size)
+
+    return '%.1fd' % seconds
+
+
+def _is_glob(app_name):
+    """Returns True if an app name is a glob pattern."""
+    return any(char in app_name for char in '*?[')
+
+
+rate_limit_file_option = click.option(
+    '--rate-limit-file',
+    envvar='HAPPY_RATE_LIMIT_FILE',
+    help='File for sharing the API rate limit between processes.',
+)
+
+trace_file_option = click.option(
+    '--trace-file',
+    type=click.Path(dir_okay=False),
+    help='Write a timeline of the run to a JSON file.',
+)
+
+trace_format_option = click.option(
+    '--trace-format',
+    type=click.Choice(TRACE_FORMATS),
+    default='chrome',
+    help='Format of --trace-file: Chrome trace events or OTLP/JSON.',
+)
+
+metrics_file_option = click.option(
+    '--metrics-file',
+    envvar='HAPPY_METRICS_FILE',
+    type=click.Path(dir_okay=False),
+    help='Prometheus textfile to add metrics to when done.',
+)
+
+pool_file_option = click.option(
+    '--pool-file',
+    default=DEFAULT_POOL_FILE,
+    help='File tracking the warm pool of apps.',
+)
+
+
+state_file_option = click.option(
+    '--state-file',
+    envvar='HAPPY_STATE_FILE',
+    default=DEFAULT_STATE_FILE,
+    help='File recording the apps brought up from here.',
+)
 
 
 @click.group(name='happy')
@@ -59,25 +160,143 @@ def cli():
 
 @cli.command(name='up')
 @click.option('--tarball-url', help='URL of the tarball containing app.json.')
+@click.option('--source', type=click.Path(exists=True, file_okay=False),
+              help='Directory to upload instead of using a tarball URL.')
+@click.option('--source-cache', envvar='HAPPY_SOURCE_CACHE',
+              help='Index of recently uploaded sources to reuse.')
+@click.option('--no-source-cache', is_flag=True,
+              help='Always upload the source, even if it was just uploaded.')
 @click.option('--auth-token', help='Heroku API auth token.')
 @click.option('--env', multiple=True, help='Env override, e.g. KEY=value.')
+@click.option('--count', default=1, help='Number of apps to bring up.')
+@click.option('--concurrency', default=8,
+              help='Maximum number of apps brought up at once.')
+@click.option('--timeout', type=float,
+              help='Seconds to wait for the build before giving up.')
+@click.option('--delete-on-timeout', is_flag=True,
+              help='Bring the app down if the build times out.')
+@click.option('--stream', is_flag=True,
+              help='Print the build output as it happens.')
+@click.option('--from-pool', is_flag=True,
+              help='Claim a ready app from the warm pool, if there is one.')
+@click.option('--resume', is_flag=True,
+              help='Wait for a recorded build instead, if one is unfinished.')
+@click.option('--reuse', is_flag=True,
+              help='Build the new code on the app if it already exists.')
+@click.option('--profile', is_flag=True,
+              help='Print how long each phase and API call took.')
+@click.option('--profile-json', type=click.Path(dir_okay=False),
+              help='Write phase and API call timings to a JSON file.')
+@click.option('--tag', 'tags', multiple=True,
+              help='Tag to record the app with, for finding it later.')
+@trace_file_option
+@trace_format_option
+@metrics_file_option
+@pool_file_option
+@state_file_option
+@rate_limit_file_option
 @click.argument('app_name', required=False)
-def up(tarball_url, auth_token, env, app_name):
+def up(tarball_url, source, source_cache, no_source_cache, auth_token, env,
+       count, concurrency, timeout, delete_on_timeout, stream, from_pool,
+       resume, reuse, profile, profile_json, tags, trace_file, trace_format,
+       metrics_file, pool_file, state_file, rate_limit_file, app_name):
     """Brings up a Heroku app."""
-    tarball_url = tarball_url or _infer_tarball_url()
+    state = State(state_file)
 
-    if not tarball_url:
+    tarball_url = tarball_url or (None if source else _infer_tarball_url())
+
+    if not tarball_url and not source:
         click.echo('No tarball URL found.')
         sys.exit(1)
 
     if env:
-        # Split ["KEY=value", ...] into {"KEY": "value", ...}
-        env = {
-            arg.split('=')[0]: arg.split('=')[1]
-            for arg in env
-        }
+        env = _parse_env(env)
 
-    happy = Happy(auth_token=auth_token)
+    profiler = None
+
+    if profile or profile_json:
+        profiler = Profiler()
+        click.get_current_context().call_on_close(
+            lambda: _report_profile(profiler, profile, profile_json)
+        )
+
+    happy = Happy(
+        auth_token=auth_token,
+        rate_limiter=RateLimiter(state_file=rate_limit_file),
+        profiler=profiler,
+        tracer=_start_trace(trace_file, trace_format, 'happy up'),
+        list_cache=_app_list_cache(),
+    )
+
+    _start_metrics(happy, metrics_file)
+
+    if resume and count == 1:
+        record = _find_unfinished(state, app_name, tarball_url)
+
+        if record:
+            click.echo('Resuming app %s' % record['name'])
+            _wait_for_app(
+                happy, state, record['build_id'], record['name'],
+                stream=stream,
+                timeout=timeout,
+                delete_on_timeout=delete_on_timeout,
+                app_build=record.get('build_type') == 'build',
+            )
+            return
+
+    if source:
+        from happy.source import SourceCache
+
+        cache = None if no_source_cache else SourceCache(source_cache)
+
+        click.echo('Uploading source... ', nl=False)
+        tarball_url = happy.upload(source, cache=cache)
+        click.echo('done')
+
+        if cache is not None:
+            stats = cache.stats()
+            click.echo('Source cache: %d%% hit rate, %s saved' % (
+                stats['hit_rate'] * 100,
+                _format_bytes(stats['bytes_saved']),
+            ))
+
+    if reuse and count == 1:
+        finished = [
+            record for record in state.apps()
+            if record['status'] != 'building'
+        ]
+        reuse_name = app_name or (finished[-1]['name'] if finished else None)
+
+        if reuse_name and happy.app_exists(reuse_name):
+            _rebuild(happy, state, reuse_name, tarball_url, env, tags,
+                     stream=stream, timeout=timeout)
+            return
+
+        click.echo('No app to reuse.')
+
+    if from_pool:
+        click.echo('Claiming app from pool... ', nl=False)
+
+        pool = Pool(happy, tarball_url, state_file=pool_file)
+        pool_app_name = pool.claim(env=env)
+
+        if pool_app_name:
+            state.add(pool_app_name, tarball_url=tarball_url, tags=tags)
+
+            click.echo(pool_app_name)
+            click.echo("It's up! :) https://%s.herokuapp.com" % pool_app_name)
+            return
+
+        click.echo('none ready')
+
+    if count > 1:
+        _up_many(
+            happy, state, tarball_url, env, count, concurrency, app_name,
+            tags=tags,
+            timeout=timeout,
+            delete_on_timeout=delete_on_timeout,
+        )
+        return
 
     click.echo('Creating app... ', nl=False)
 
@@ -87,49 +306,570 @@ def up(tarball_url, auth_token, env, app_name):
         app_name=app_name,
     )
 
+    state.add(app_name, build_id=build_id, tarball_url=tarball_url,
+              status='building', tags=tags)
+
     click.echo(app_name)
 
-    click.echo('Building... ', nl=False)
+    _wait_for_app(
+        happy, state, build_id, app_name,
+        stream=stream,
+        timeout=timeout,
+        delete_on_timeout=delete_on_timeout,
+    )
+
 
-    happy.wait(build_id)
+def _rebuild(happy, state, app_name, tarball_url, env=None, tags=None,
+             stream=False, timeout=None):
+    """Builds new code on an existing app and waits for it."""
+    click.echo('Rebuilding app %s' % app_name)
 
-    _write_app_name(app_name)
+    build_id = happy.rebuild(app_name, tarball_url, env=env)
+    record = state.get(app_name)
+
+    if record is None:
+        state.add(app_name, build_id=build_id, tarball_url=tarball_url,
+                  status='building', tags=tags, build_type='build')
+    else:
+        state.update(
+            app_name,
+            build_id=build_id,
+            build_type='build',
+            tarball_url=tarball_url,
+            status='building',
+            tags=sorted(set(record['tags']) | set(tags or [])),
+        )
+
+    _wait_for_app(
+        happy, state, build_id, app_name,
+        stream=stream,
+        timeout=timeout,
+        app_build=True,
+    )
+
+
+def _record_status(state, build_id, app_name, status, tarball_url=None,
+                   tags=None):
+    """Records a change in an app's status reported by
+    ``Happy.create_many``.
+    """
+    if status == 'building':
+        state.add(app_name, build_id=build_id, tarball_url=tarball_url,
+                  status=status, tags=tags)
+    elif status == 'deleted':
+        state.remove([app_name])
+    else:
+        state.update(app_name, status=status)
+
+
+def _find_unfinished(state, app_name=None, tarball_url=None):
+    """Finds the newest recorded app whose build may not be done.
+
+    :param state: The ``State`` to look in.
+    :param app_name: (optional) Only consider the app with this name.
+    :param tarball_url: (optional) Only consider apps built from this
+        tarball.
+    :returns: The app's record, or ``None``.
+    """
+    for record in reversed(state.apps(status='building')):
+        if not record['build_id']:
+            continue
+        elif app_name and record['name'] != app_name:
+            continue
+        elif tarball_url and record['tarball_url'] != tarball_url:
+            continue
+
+        return record
+
+    return None
+
+
+def _wait_for_app(happy, state, build_id, app_name, stream=False,
+                  timeout=None, delete_on_timeout=False, app_build=False):
+    """Waits for an app's build, recording how it went, and exits with an
+    error if it failed or timed out.
+
+    Apps being rebuilt with ``app_build`` were there before the build, so
+    they aren't deleted when it times out.
+    """
+    kwargs = {'app_name': app_name} if app_build else {}
+
+    try:
+        if stream:
+            click.echo('Building...')
+            happy.stream(
+                build_id,
+                callback=lambda chunk: click.echo(chunk, nl=False),
+                timeout=timeout,
+                **kwargs
+            )
+        else:
+            click.echo('Building... ', nl=False)
+            happy.wait(build_id, timeout=timeout, **kwargs)
+    except BuildTimeout:
+        click.echo('timed out after %g seconds' % timeout)
+
+        if delete_on_timeout and not app_build:
+            click.echo('Destroying app %s... ' % app_name, nl=False)
+            happy.delete(app_name=app_name)
+            state.remove([app_name])
+            click.echo('done')
+
+        sys.exit(1)
+    except BuildError as exc:
+        state.update(app_name, status='failed')
+        click.echo('failed: %s' % exc)
+        sys.exit(1)
+
+    state.update(app_name, status='up')
 
     click.echo('done')
     click.echo("It's up! :) https://%s.herokuapp.com" % app_name)
 
 
+def _start_trace(trace_file, trace_format, command):
+    """Starts tracing a command, if a trace file was given.
+
+    The command's span is ended and the trace written when the command is
+    done, even if it fails.
+
+    :returns: A ``Tracer``, or ``None``.
+    """
+    if not trace_file:
+        return None
+
+    tracer = Tracer()
+    span = tracer.start_span(command)
+
+    def finish():
+        tracer.end_span(span)
+        tracer.write(trace_file, format=trace_format)
+
+    click.get_current_context().call_on_close(finish)
+
+    return tracer
+
+
+def _start_metrics(happy, metrics_file):
+    """Starts collecting metrics, if a metrics file was given.
+
+    The metrics are written when the command is done, even if it fails.
+
+    :returns: A ``Metrics`` instance, or ``None``.
+    """
+    if not metrics_file:
+        return None
+
+    metrics = Metrics()
+    metrics.subscribe(happy.hooks)
+
+    click.get_current_context().call_on_close(
+        lambda: metrics.write(metrics_file)
+    )
+
+    return metrics
+
+
+def _report_profile(profiler, summary, json_path):
+    """Prints and/or saves a profiler's timings."""
+    if summary:
+        click.echo('')
+        click.echo(profiler.summary())
+
+    if json_path:
+        profiler.write_json(json_path)
+
+
+def _up_many(happy, state, tarball_url, env, count, concurrency, prefix,
+             tags=None, timeout=None, delete_on_timeout=False):
+    """Brings up several apps, printing each one as soon as it's up."""
+    from concurrent.futures import as_completed
+
+    click.echo('Creating %d apps...' % count)
+
+    futures = happy.create_many(
+        tarball_url=tarball_url,
+        count=count,
+        env=env,
+        app_names=[
+            '%s-%d' % (prefix, index + 1) for index in range(count)
+        ] if prefix else None,
+        max_workers=concurrency,
+        timeout=timeout,
+        delete_on_timeout=delete_on_timeout,
+        on_status=lambda build_id, app_name, status: _record_status(
+            state, build_id, app_name, status, tarball_url, tags,
+        ),
+    )
+    numbers = {future: index + 1 for index, future in enumerate(futures)}
+
+    app_names = []
+
+    for future in as_completed(futures):
+        try:
+            build_id_, app_name = future.result()
+        except Exception as exc:
+            click.echo('App #%d failed: %s' % (numbers[future], exc))
+        else:
+            app_names.append(app_name)
+            click.echo("It's up! :) https://%s.herokuapp.com" % app_name)
+
+    failed = count - len(app_names)
+
+    click.echo('%d up, %d failed.' % (len(app_names), failed))
+
+    if failed:
+        sys.exit(1)
+
+
+@cli.command(name='wait')
+@click.option('--auth-token', help='Heroku API auth token.')
+@click.option('--timeout', type=float,
+              help='Seconds to wait for the build before giving up.')
+@click.option('--delete-on-timeout', is_flag=True,
+              help='Bring the app down if the build times out.')
+@click.option('--stream', is_flag=True,
+              help='Print the build output as it happens.')
+@trace_file_option
+@trace_format_option
+@metrics_file_option
+@state_file_option
+@rate_limit_file_option
+@click.argument('app_name', required=False)
+def wait(auth_token, timeout, delete_on_timeout, stream, trace_file,
+         trace_format, metrics_file, state_file, rate_limit_file, app_name):
+    """Waits for a recorded app's build to finish.
+
+    APP_NAME defaults to the newest app whose build hasn't finished.
+    """
+    state = State(state_file)
+
+    if app_name:
+        record = state.get(app_name)
+    else:
+        record = _find_unfinished(state)
+
+    if not record or not record['build_id']:
+        click.echo('No build recorded for %s.' % (app_name or 'any app'))
+        sys.exit(1)
+
+    happy = Happy(
+        auth_token=auth_token,
+        rate_limiter=RateLimiter(state_file=rate_limit_file),
+        tracer=_start_trace(trace_file, trace_format, 'happy wait'),
+        list_cache=_app_list_cache(),
+    )
+
+    _start_metrics(happy, metrics_file)
+
+    click.echo('Waiting for app %s' % record['name'])
+
+    _wait_for_app(
+        happy, state, record['build_id'], record['name'],
+        stream=stream,
+        timeout=timeout,
+        delete_on_timeout=delete_on_timeout,
+        app_build=record.get('build_type') == 'build',
+    )
+
+
+@cli.group(name='pool')
+def pool_group():
+    """Manages a warm pool of ready apps."""
+
+
+@pool_group.command(name='fill')
+@click.option('--tarball-url', help='URL of the tarball containing app.json.')
+@click.option('--auth-token', help='Heroku API auth token.')
+@click.option('--env', multiple=True, help='Env override, e.g. KEY=value.')
+@click.option('--size', default=1, help='Number of apps to keep ready.')
+@click.option('--timeout', type=float,
+              help='Seconds to wait for each build before giving up.')
+@click.option('--watch', type=float,
+              help='Keep refilling the pool every so many seconds.')
+@metrics_file_option
+@pool_file_option
+@rate_limit_file_option
+def pool_fill(tarball_url, auth_token, env, size, timeout, watch,
+              metrics_file, pool_file, rate_limit_file):
+    """Fills the warm pool with ready apps."""
+    tarball_url = tarball_url or _infer_tarball_url()
+
+    if not tarball_url:
+        click.echo('No tarball URL found.')
+        sys.exit(1)
+
+    happy = Happy(
+        auth_token=auth_token,
+        rate_limiter=RateLimiter(state_file=rate_limit_file),
+        list_cache=_app_list_cache(),
+    )
+
+    metrics = _start_metrics(happy, metrics_file)
+
+    pool = Pool(
+        happy,
+        tarball_url,
+        size=size,
+        env=_parse_env(env) if env else None,
+        state_file=pool_file,
+    )
+
+    while True:
+        click.echo('Filling pool... ', nl=False)
+
+        refilled = pool.refill(timeout=timeout)
+
+        click.echo('%d new, %d ready' % (
+            len(refilled),
+            len(pool.apps('ready')),
+        ))
+
+        failed = pool.apps('failed')
+
+        if failed:
+            click.echo('Failed to delete: %s' % ', '.join(sorted(failed)))
+
+        if not watch:
+            break
+
+        if metrics is not None:
+            metrics.write(metrics_file)
+
+        time.sleep(watch)
+
+
+@pool_group.command(name='status')
+@click.option('--tarball-url', help='URL of the tarball containing app.json.')
+@pool_file_option
+def pool_status(tarball_url, pool_file):
+    """Shows how many apps in the warm pool are ready."""
+    tarball_url = tarball_url or _infer_tarball_url()
+
+    if not tarball_url:
+        click.echo('No tarball URL found.')
+        sys.exit(1)
+
+    pool = Pool(None, tarball_url, state_file=pool_file)
+
+    for status in ('ready', 'building', 'failed'):
+        click.echo('%s: %d' % (status, len(pool.apps(status))))
+
+
 @cli.command(name='down')
 @click.option('--auth-token', help='Heroku API auth token.')
 @click.option('--force', is_flag=True, help='Force deletion without input.')
-@click.argument('app_name', required=False)
-def down(auth_token, force, app_name):
-    """Brings down a Heroku app."""
-    if not app_name:
+@click.option('--all', 'all_apps', is_flag=True,
+              help='Bring down every app recorded in the state file.')
+@click.option('--tag',
+              help='Bring down the recorded apps with this tag.')
+@click.option('--concurrency', default=8,
+              help='Maximum number of apps brought down at once.')
+@trace_file_option
+@trace_format_option
+@metrics_file_option
+@state_file_option
+@rate_limit_file_option
+@click.argument('app_names', nargs=-1)
+def down(auth_token, force, all_apps, tag, concurrency, trace_file,
+         trace_format, metrics_file, state_file, rate_limit_file, app_names):
+    """Brings down Heroku apps.
+
+    APP_NAMES can be app names or glob patterns like 'ci-*'.
+    """
+    if not app_names and not all_apps and not tag:
         click.echo(
             'WARNING: Inferring the app name when deleting is deprecated. '
             'Starting with happy 2.0, the app_name parameter will be required.'
         )
 
-    app_name = app_name or _read_app_name()
+    happy = Happy(
+        auth_token=auth_token,
+        rate_limiter=RateLimiter(state_file=rate_limit_file),
+        tracer=_start_trace(trace_file, trace_format, 'happy down'),
+        list_cache=_app_list_cache(),
+    )
 
-    if not app_name:
+    _start_metrics(happy, metrics_file)
+
+    state = State(state_file)
+    names = []
+
+    for app_name in app_names:
+        if _is_glob(app_name):
+            names.extend(happy.find_apps(app_name))
+        else:
+            names.append(app_name)
+
+    if tag:
+        names.extend(record['name'] for record in state.apps(tag=tag))
+    elif all_apps:
+        names.extend(record['name'] for record in state.apps())
+    elif not app_names:
+        # Only the newest app, as before apps were recorded; bringing down
+        # more takes --all or --tag
+        names.extend(record['name'] for record in state.apps()[-1:])
+
+    # Drop duplicates, keeping the order
+    names = [
+        app_name for index, app_name in enumerate(names)
+        if app_name not in names[:index]
+    ]
+
+    if not names:
         click.echo('No app name given.')
         sys.exit(1)
 
     if not force:
         click.confirm(
-            'Are you sure you want to delete %s?' % app_name,
+            'Are you sure you want to delete %s?' % ', '.join(names),
             abort=True,
         )
 
-    happy = Happy(auth_token=auth_token)
+    if len(names) > 1:
+        _down_many(happy, state, names, concurrency)
+        return
+
+    app_name = names[0]
 
     click.echo('Destroying app %s... ' % app_name, nl=False)
 
     happy.delete(app_name=app_name)
 
-    _delete_app_name_file()
+    state.remove([app_name])
 
     click.echo('done')
     click.echo("It's down. :(")
+
+
+@cli.command(name='ls')
+@click.option('--auth-token', help='Heroku API auth token.')
+@click.option('--older-than', callback=_validate_duration,
+              help='Only list apps older than this, e.g. 30m, 6h or 2d.')
+@click.option('--newer-than', callback=_validate_duration,
+              help='Only list apps newer than this, e.g. 30m, 6h or 2d.')
+@click.option('--long', '-l', 'long_format', is_flag=True,
+              help="Show each app's age too.")
+@click.option('--cache-file', envvar='HAPPY_LIST_CACHE',
+              help='File keeping the last list of apps.')
+@click.option('--cache-ttl', default=LIST_TTL,
+              help='Seconds to reuse the last list of apps for, or 0.')
+@rate_limit_file_option
+@click.argument('patterns', nargs=-1)
+def ls(auth_token, older_than, newer_than, long_format, cache_file,
+       cache_ttl, rate_limit_file, patterns):
+    """Lists the account's apps.
+
+    PATTERNS are glob patterns like 'ci-*'. If any are given, only apps
+    matching one of them are listed.
+    """
+    happy = Happy(
+        auth_token=auth_token,
+        rate_limiter=RateLimiter(state_file=rate_limit_file),
+    )
+
+    cache = AppListCache(cache_file, ttl=cache_ttl) if cache_ttl > 0 \
+        else None
+    now = time.time()
+
+    for app in happy.iter_apps(cache=cache):
+        if patterns and not any(
+            fnmatchcase(app['name'], pattern) for pattern in patterns
+        ):
+            continue
+
+        age = now - parse_time(app['created_at'])
+
+        if older_than is not None and age <= older_than:
+            continue
+        elif newer_than is not None and age >= newer_than:
+            continue
+
+        if long_format:
+            click.echo('%s\t%s' % (app['name'], _format_age(age)))
+        else:
+            click.echo(app['name'])
+
+
+@cli.command(name='gc')
+@click.option('--auth-token', help='Heroku API auth token.')
+@click.option('--older-than', required=True, callback=_validate_duration,
+              help='Age at which apps expire, e.g. 30m, 6h or 2d.')
+@click.option('--prefix', 'prefixes', multiple=True,
+              callback=_validate_prefixes,
+              help='Also bring down expired apps named with this prefix.')
+@click.option('--dry-run', is_flag=True,
+              help='Only list the expired apps.')
+@click.option('--concurrency', default=8,
+              help='Maximum number of apps brought down at once.')
+@trace_file_option
+@trace_format_option
+@metrics_file_option
+@state_file_option
+@rate_limit_file_option
+def gc(auth_token, older_than, prefixes, dry_run, concurrency, trace_file,
+       trace_format, metrics_file, state_file, rate_limit_file):
+    """Brings down apps that have been up too long.
+
+    Apps recorded in the state file, and apps whose names start with a
+    --prefix, expire once they're older than --older-than. Other apps are
+    never touched.
+    """
+    state = State(state_file)
+
+    happy = Happy(
+        auth_token=auth_token,
+        rate_limiter=RateLimiter(state_file=rate_limit_file),
+        tracer=_start_trace(trace_file, trace_format, 'happy gc'),
+        list_cache=_app_list_cache(),
+    )
+
+    _start_metrics(happy, metrics_file)
+
+    expired = happy.find_expired_apps(
+        older_than,
+        prefixes=prefixes,
+        app_names=[record['name'] for record in state.apps()],
+    )
+
+    if not expired:
+        click.echo('No expired apps.')
+        return
+
+    click.echo('%d expired apps:' % len(expired))
+
+    for app_name, age in expired:
+        click.echo('%s (%s old)' % (app_name, _format_age(age)))
+
+    if dry_run:
+        return
+
+    _down_many(happy, state, [app_name for app_name, age_ in expired],
+               concurrency)
+
+
+def _down_many(happy, state, app_names, concurrency):
+    """Brings down several apps at once, printing a summary."""
+    click.echo('Destroying %d apps...' % len(app_names))
+
+    futures = happy.delete_many(app_names, max_workers=concurrency)
+
+    deleted = []
+
+    for app_name, future in zip(app_names, futures):
+        try:
+            future.result()
+        except Exception as exc:
+            click.echo('%s... failed: %s' % (app_name, exc))
+        else:
+            deleted.append(app_name)
+            click.echo('%s... done' % app_name)
+
+    state.remove(deleted)
+
+    failed = len(app_names) - len(deleted)
+
+    click.echo('%d down, %d failed.' % (len(deleted), failed))
+
+    if failed:
+        sys.exit(1)
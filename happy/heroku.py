@@ -1,32 +1,203 @@
 """
 Heroku API helpers.
 """
+import calendar
+import codecs
+import hashlib
 import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from time import sleep
 
-from requests import Session
+from .hooks import Hooks
+from .polling import Backoff
+
+#: Base URL of the Heroku API
+API_ROOT = 'https://api.heroku.com'
+
+#: Methods that are safe to send again after a failure
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+
+#: Response statuses worth retrying
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+#: Names imported from requests the first time they're needed, since
+#: importing it takes longer than everything else the CLI does before its
+#: first API call
+_REQUESTS_NAMES = ('HTTPAdapter', 'Session', 'exceptions', 'get_netrc_auth')
+
+
+def _import_requests():
+    """Imports what's needed from requests into this module.
+
+    Names that are already set, e.g. patched by a test, are left alone.
+    """
+    module = globals()
+
+    if all(name in module for name in _REQUESTS_NAMES):
+        return
+
+    import requests
+    from requests.adapters import HTTPAdapter
+    from requests.utils import get_netrc_auth
+
+    for name, value in (('HTTPAdapter', HTTPAdapter),
+                        ('Session', requests.Session),
+                        ('exceptions', requests.exceptions),
+                        ('get_netrc_auth', get_netrc_auth)):
+        module.setdefault(name, value)
+
+
+def __getattr__(name):
+    """Imports requests when one of its names is looked up from outside."""
+    if name in _REQUESTS_NAMES:
+        _import_requests()
+        return globals()[name]
+
+    raise AttributeError(
+        'module %r has no attribute %r' % (__name__, name)
+    )
+
+
+if sys.version_info < (3, 7):  # No module __getattr__, so import up front
+    _import_requests()
+
+
+def parse_time(timestamp):
+    """Parses one of Heroku's ISO 8601 UTC timestamps to a Unix time."""
+    return calendar.timegm(time.strptime(timestamp, '%Y-%m-%dT%H:%M:%SZ'))
 
 
 class APIError(Exception):
     """A Heroku API error!!! Oh no!!!!!!!"""
+    def __init__(self, message, status_code=None):
+        """Initializes the class.
+
+        :param message: The error message.
+        :param status_code: (optional) The response's HTTP status code.
+        """
+        super(APIError, self).__init__(message)
+        self.status_code = status_code
+
+
+class RateLimitError(APIError):
+    """Too many requests!!!!!!!!! Slow down!!!!"""
 
 
 class BuildError(Exception):
     """Something went wrong with the build!!!!!"""
 
 
+class BuildTimeout(BuildError):
+    """The build took too long!!!!!!!!"""
+
+
 class Heroku(object):
-    """Methods for interacting with the Heroku API."""
-    def __init__(self, auth_token=None):
+    """Methods for interacting with the Heroku API.
+
+    A single ``Heroku`` instance keeps one pooled, keep-alive HTTP session
+    for its whole lifetime and is safe to share between threads and
+    ``Happy`` instances. Call :meth:`close` (or use it as a context manager)
+    to release its connections.
+    """
+    def __init__(self, auth_token=None, pool_size=10, rate_limiter=None,
+                 retries=3, retry_timeout=60, profiler=None, hooks=None,
+                 api_root=None, cache_size=128):
         """Intialize the class.
 
         :param auth_token: A Heroku API auth token.
+        :param pool_size: (optional) Maximum number of connections kept alive
+            to the API at once.
+        :param rate_limiter: (optional) A ``RateLimiter`` that every request
+            waits on, kept in step with the ``RateLimit-Remaining`` header.
+        :param retries: (optional) Most times to retry a request after a 429,
+            a 5xx, or a connection error. Only 429s are retried for methods
+            that aren't idempotent, since nothing was done on Heroku's side.
+        :param retry_timeout: (optional) Most seconds to spend retrying one
+            request.
+        :param profiler: (optional) A ``Profiler`` that records every API
+            call.
+        :param hooks: (optional) ``Hooks`` to fire request events on, e.g. to
+            share them with a ``Happy`` instance. Defaults to new ones, found
+            on the ``hooks`` attribute.
+        :param api_root: (optional) Base URL of the API, e.g. to point at a
+            :class:`~happy.testing.FakeHeroku`. Defaults to the
+            ``HAPPY_API_ROOT`` environment variable, or :data:`API_ROOT`.
+        :param cache_size: (optional) Most GET responses kept with their
+            ``ETag``. Getting one again sends ``If-None-Match``, and a ``304
+            Not Modified`` reuses the parsed body instead of downloading and
+            parsing it. ``0`` turns this off.
         """
+        self.api_root = (
+            api_root or os.environ.get('HAPPY_API_ROOT') or API_ROOT
+        ).rstrip('/')
         self._auth_token = auth_token
+        self._pool_size = pool_size
+        self._rate_limiter = rate_limiter
+        self._retries = retries
+        self._retry_timeout = retry_timeout
+        self.hooks = Hooks() if hooks is None else hooks
+        self.rate_limit_remaining = None
+        self._cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._session = None
+        self._session_lock = threading.Lock()
+
+        if profiler is not None:
+            profiler.subscribe(self.hooks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def session(self):
+        """The shared ``Session``, created on first use."""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self._get_session()
+
+        return self._session
+
+    @property
+    def account_key(self):
+        """A hash of the API root and auth token, identifying the account
+        this client acts as, e.g. to keep cached data apart, without
+        revealing the token.
+        """
+        return hashlib.sha256(
+            ('%s %s' % (self.api_root, self._auth_token or '')).encode('utf-8')
+        ).hexdigest()
+
+    def close(self):
+        """Closes the shared session and its pooled connections."""
+        with self._session_lock:
+            session, self._session = self._session, None
+
+        if session is not None:
+            session.close()
 
     def _get_session(self):
         """Returns a prepared ``Session`` instance."""
+        _import_requests()
+
         session = Session()
 
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self._pool_size,
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+
         session.headers = {
             'Content-type': 'application/json',
             'Accept': 'application/vnd.heroku+json; version=3',
@@ -35,6 +206,9 @@ class Heroku(object):
         if self._auth_token:
             session.trust_env = False  # Effectively disable netrc auth
             session.headers['Authorization'] = 'Bearer %s' % self._auth_token
+        else:
+            # Read netrc once here, rather than on every request
+            session.auth = get_netrc_auth(self.api_root)
 
         return session
 
@@ -44,17 +218,111 @@ class Heroku(object):
         :param method: HTTP method.
         :param endpoint: API endpoint, e.g. ``/apps``.
         :param data: A dict sent as JSON in the body of the request.
-        :returns: A dict represntation of the JSON response.
+        :returns: A dict represntation of the JSON response. GET responses
+            can be shared between calls through the cache, so they shouldn't
+            be modified.
         """
-        session = self._get_session()
+        return self._request(method, endpoint, data, *args, **kwargs)[0]
+
+    def _request(self, method, endpoint, data=None, *args, **kwargs):
+        """Sends an API request to Heroku, like :meth:`api_request`.
 
-        api_root = 'https://api.heroku.com'
-        url = api_root + endpoint
+        GET requests for a ``Range`` of a list aren't cached, since every
+        page of a list has the same URL.
+
+        :returns: A tuple with the JSON response and the ``Response``.
+        """
+        session = self.session
+
+        url = self.api_root + endpoint
 
         if data:
             data = json.dumps(data)
 
-        response = session.request(method, url, data=data, *args, **kwargs)
+        cacheable = method == 'GET' and \
+            'Range' not in (kwargs.get('headers') or {})
+        cached = self._cache_get(url) if cacheable else None
+
+        if cached is not None:
+            headers = dict(kwargs.get('headers') or {})
+            headers['If-None-Match'] = cached[0]
+            kwargs['headers'] = headers
+
+        delays = Backoff(initial=0.5, maximum=8.0, factor=2.0).delays()
+        deadline = time.time() + self._retry_timeout
+        attempt = 0
+
+        while True:
+            if self._rate_limiter is not None:
+                self._rate_limiter.acquire()
+
+            self.hooks.fire(
+                'before_request',
+                method=method,
+                endpoint=endpoint,
+                attempt=attempt,
+            )
+
+            start = time.time()
+
+            try:
+                response = session.request(
+                    method, url, data=data, *args, **kwargs
+                )
+            except (exceptions.ConnectionError, exceptions.Timeout) as exc:
+                self.hooks.fire(
+                    'on_error',
+                    method=method,
+                    endpoint=endpoint,
+                    attempt=attempt,
+                    exception=exc,
+                    start=start,
+                    latency=time.time() - start,
+                )
+
+                delay = self._retry_delay(method, attempt, delays, deadline)
+
+                if delay is None:
+                    raise
+            else:
+                latency = time.time() - start
+                result = None
+
+                # Parsed here, once, so handlers can use it too
+                if response.ok and response.status_code != 304:
+                    try:
+                        result = response.json()
+                    except ValueError:
+                        pass  # Raised again below, after the event
+
+                self.hooks.fire(
+                    'after_response',
+                    method=method,
+                    endpoint=endpoint,
+                    attempt=attempt,
+                    response=response,
+                    data=result,
+                    start=start,
+                    latency=latency,
+                )
+
+                self._update_rate_limit(response)
+
+                if response.status_code not in RETRY_STATUSES:
+                    break
+
+                delay = self._retry_delay(
+                    method, attempt, delays, deadline, response,
+                )
+
+                if delay is None:
+                    break
+
+            sleep(delay)
+            attempt += 1
+
+        if response.status_code == 304 and cached is not None:
+            return (cached[1], response)
 
         if not response.ok:
             try:
@@ -62,9 +330,80 @@ class Heroku(object):
             except ValueError:
                 message = response.content
 
-            raise APIError(message)
+            if response.status_code == 429:
+                raise RateLimitError(message, response.status_code)
+
+            raise APIError(message, response.status_code)
+
+        if result is None:
+            result = response.json()
+
+        if cacheable:
+            self._cache_put(url, response.headers.get('ETag'), result)
+
+        return (result, response)
 
-        return response.json()
+    def _cache_get(self, url):
+        """Returns a cached ``(etag, data)`` tuple for a URL, or ``None``."""
+        with self._cache_lock:
+            entry = self._cache.pop(url, None)
+
+            if entry is not None:
+                self._cache[url] = entry  # Now the most recently used
+
+        return entry
+
+    def _cache_put(self, url, etag, data):
+        """Caches a GET response, evicting the least recently used ones
+        past the cache's size.
+        """
+        with self._cache_lock:
+            self._cache.pop(url, None)
+
+            if not etag or self._cache_size <= 0:
+                return
+
+            self._cache[url] = (etag, data)
+
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+    def _retry_delay(self, method, attempt, delays, deadline, response=None):
+        """Returns seconds to wait before retrying a request, or ``None`` to
+        give up.
+        """
+        if attempt >= self._retries:
+            return None
+
+        rate_limited = response is not None and response.status_code == 429
+
+        if method.upper() not in IDEMPOTENT_METHODS and not rate_limited:
+            return None
+
+        delay = next(delays)
+
+        if response is not None:
+            try:
+                delay = max(delay, float(response.headers['Retry-After']))
+            except (KeyError, TypeError, ValueError):
+                pass
+
+        if time.time() + delay > deadline:
+            return None
+
+        return delay
+
+    def _update_rate_limit(self, response):
+        """Records the ``RateLimit-Remaining`` header from a response."""
+        try:
+            remaining = int(response.headers['RateLimit-Remaining'])
+        except (KeyError, TypeError, ValueError):
+            return
+
+        self.rate_limit_remaining = remaining
+
+        if self._rate_limiter is not None:
+            self._rate_limiter.update(remaining)
 
     def create_build(self, tarball_url, env=None, app_name=None):
         """Creates an app-setups build. Returns response data as a dict.
@@ -88,14 +427,54 @@ class Heroku(object):
 
         return self.api_request('POST', '/app-setups', data=data)
 
+    def get_build(self, build_id):
+        """Gets an app-setups build.
+
+        :param build_id: ID of the build to get.
+        :returns: Response data as a ``dict``.
+        """
+        return self.api_request('GET', '/app-setups/%s' % build_id)
+
+    def create_app_build(self, app_name, tarball_url):
+        """Builds new code on an existing app, without setting it up again.
+
+        :param app_name: Name of the app.
+        :param tarball_url: URL of a tarball of the app's code.
+        :returns: Response data as a ``dict``.
+        """
+        return self.api_request('POST', '/apps/%s/builds' % app_name, data={
+            'source_blob': {
+                'url': tarball_url
+            }
+        })
+
+    def get_app_build(self, app_name, build_id):
+        """Gets a build of an existing app.
+
+        :param app_name: Name of the app.
+        :param build_id: ID of the build to get.
+        :returns: Response data as a ``dict``.
+        """
+        return self.api_request(
+            'GET', '/apps/%s/builds/%s' % (app_name, build_id),
+        )
+
     def check_build_status(self, build_id):
         """Checks the status of an app-setups build.
 
         :param build_id: ID of the build to check.
         :returns: ``True`` if succeeded, ``False`` if pending.
         """
-        data = self.api_request('GET', '/app-setups/%s' % build_id)
+        return self.build_status(self.get_build(build_id))
+
+    @staticmethod
+    def build_status(data):
+        """Checks the status in an app-setups build's data.
 
+        :param data: Response data from :meth:`get_build` or
+            :meth:`get_app_build`.
+        :returns: ``True`` if succeeded, ``False`` if pending.
+        """
         status = data.get('status')
 
         if status == 'pending':
@@ -103,7 +482,142 @@ class Heroku(object):
         elif status == 'succeeded':
             return True
         else:
-            raise BuildError(str(data))
+            raise BuildError('Build %s: %s' % (
+                status,
+                data.get('failure_message') or 'no reason given',
+            ))
+
+    def stream_build_output(self, output_stream_url, timeout=None):
+        """Follows a build's output as it's written.
+
+        :param output_stream_url: The build's ``output_stream_url``.
+        :param timeout: (optional) Seconds to follow the output for before
+            raising ``BuildTimeout``. This is also the longest the stream can
+            go quiet for.
+        :returns: A generator of text chunks, which ends when the build does.
+        """
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        # The stream URL is signed, so none of the API headers are wanted
+        response = self.session.get(output_stream_url, stream=True, headers={
+            'Accept': None,
+            'Authorization': None,
+            'Content-type': None,
+        }, timeout=timeout)
+
+        if not response.ok:
+            raise APIError(response.content, response.status_code)
+
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+
+        try:
+            chunks = iter(response.iter_content(chunk_size=None))
+
+            while True:
+                try:
+                    data = next(chunks)
+                except StopIteration:
+                    break
+                except (exceptions.ConnectionError, exceptions.Timeout):
+                    # A read timeout surfaces as a connection error here
+                    if timeout is None or time.time() < deadline:
+                        raise
+
+                    data = None
+
+                if data is not None:
+                    text = decoder.decode(data)
+
+                    if text:
+                        yield text
+
+                if timeout is not None and time.time() >= deadline:
+                    raise BuildTimeout('Timed out following build output.')
+
+            text = decoder.decode(b'', final=True)
+
+            if text:
+                yield text
+        finally:
+            response.close()
+
+    def create_source(self):
+        """Creates a place to upload source code to.
+
+        :returns: A ``dict`` with a ``put_url`` to upload a tarball to, and a
+            ``get_url`` to pass to :meth:`create_build`.
+        """
+        return self.api_request('POST', '/sources')['source_blob']
+
+    def upload_source(self, put_url, data):
+        """Uploads a source tarball.
+
+        :param put_url: The ``put_url`` from :meth:`create_source`.
+        :param data: The tarball, as bytes or an iterable of chunks with a
+            length.
+        """
+        # The upload URL is signed, so none of the API headers are wanted
+        response = self.session.put(put_url, data=data, headers={
+            'Accept': None,
+            'Authorization': None,
+            'Content-type': None,
+        })
+
+        if not response.ok:
+            raise APIError(response.content, response.status_code)
+
+    def update_config(self, app_name, env):
+        """Updates an app's config vars in one request.
+
+        :param app_name: Name of the app to update.
+        :param env: Dict of config vars to set. ``None`` values unset them.
+        :returns: The app's config vars as a ``dict``.
+        """
+        return self.api_request(
+            'PATCH',
+            '/apps/%s/config-vars' % app_name,
+            data=env,
+        )
+
+    def get_app(self, app_name):
+        """Gets an app.
+
+        :param app_name: Name of the app.
+        :returns: Response data as a ``dict``.
+        """
+        return self.api_request('GET', '/apps/%s' % app_name)
+
+    def list_apps(self):
+        """Lists the account's apps.
+
+        :returns: A list of app ``dict`` objects.
+        """
+        return list(self.iter_apps())
+
+    def iter_apps(self, page_size=1000):
+        """Lists the account's apps a page at a time, as they're needed.
+
+        Pages are requested with a ``Range`` header, following each
+        response's ``Next-Range`` until there are no more, so only one page
+        is held at a time.
+
+        :param page_size: (optional) Most apps requested at once. Heroku
+            allows up to 1000.
+        :returns: A generator of app ``dict`` objects, ordered by name.
+        """
+        next_range = 'name ..; max=%d' % page_size
+
+        while next_range:
+            apps, response = self._request(
+                'GET', '/apps', headers={'Range': next_range},
+            )
+
+            for app in apps:
+                yield app
+
+            next_range = response.headers.get('Next-Range') \
+                if response.status_code == 206 else None
 
     def delete_app(self, app_name):
         """Deletes an app.
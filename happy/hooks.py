@@ -0,0 +1,74 @@
+"""
+Hooks for watching what happy does, e.g. to collect metrics or traces.
+"""
+import threading
+
+#: Events that can be hooked, and the keyword arguments handlers get
+EVENTS = {
+    # Before each attempt at an API request
+    'before_request': ('method', 'endpoint', 'attempt'),
+    # After each attempt that got a response, whatever its status, with its
+    # parsed JSON body as data if it succeeded
+    'after_response': ('method', 'endpoint', 'attempt', 'response', 'data',
+                       'start', 'latency'),
+    # After each attempt that failed without a response, e.g. a timeout
+    'on_error': ('method', 'endpoint', 'attempt', 'exception', 'start',
+                 'latency'),
+    # When an app-setup is first seen or moves on to another phase
+    'build_status_change': ('build_id', 'status', 'previous', 'data'),
+}
+
+
+class Hooks(object):
+    """Calls handlers registered for events.
+
+    Handlers are called synchronously with keyword arguments, from whichever
+    thread fired the event, and any exceptions they raise are passed on.
+    Firing an event nobody's registered for costs one dict lookup.
+    """
+    def __init__(self):
+        self._handlers = {}
+        self._lock = threading.Lock()
+
+    def register(self, event, handler):
+        """Registers a handler for an event.
+
+        :param event: Name of the event, one of :data:`EVENTS`.
+        :param handler: Callable taking the event's keyword arguments.
+        :raises ValueError: If the event doesn't exist.
+        """
+        if event not in EVENTS:
+            raise ValueError('Unknown event %r.' % event)
+
+        with self._lock:
+            # Replace rather than append, so firing never needs the lock
+            self._handlers[event] = self._handlers.get(event, ()) + (handler,)
+
+    def unregister(self, event, handler):
+        """Unregisters a handler, if it's registered.
+
+        :param event: Name of the event.
+        :param handler: The handler to remove.
+        """
+        with self._lock:
+            handlers = tuple(
+                registered for registered in self._handlers.get(event, ())
+                if registered != handler
+            )
+
+            if handlers:
+                self._handlers[event] = handlers
+            else:
+                self._handlers.pop(event, None)
+
+    def fire(self, event, **kwargs):
+        """Calls every handler registered for an event.
+
+        :param event: Name of the event.
+        :param kwargs: The event's arguments.
+        """
+        handlers = self._handlers.get(event)
+
+        if handlers:
+            for handler in handlers:
+                handler(**kwargs)
@@ -0,0 +1,94 @@
+"""
+A short-lived local copy of the account's list of apps.
+"""
+import json
+import os
+import time
+
+from .locking import FileLock, atomic_write
+from .paths import cache_path, make_parent_dir
+
+#: Seconds a list of apps is reused for
+LIST_TTL = 30
+
+
+def default_cache_path():
+    """Returns the default path of the app list cache."""
+    return cache_path('apps.json')
+
+
+class AppListCache(object):
+    """Recent lists of apps, by account.
+
+    Listing thousands of apps takes several API calls, so shell completion
+    and scripts listing apps over and over can reuse the last list for a
+    few seconds instead. Lists are written atomically, so looking one up
+    doesn't need a lock. An account's list is dropped as soon as happy
+    creates or deletes one of its apps.
+    """
+    def __init__(self, path=None, ttl=LIST_TTL):
+        """Initializes the class.
+
+        :param path: (optional) Path of the cache file. Defaults to
+            :func:`default_cache_path`.
+        :param ttl: (optional) Seconds to reuse each list for.
+        """
+        self.path = path or default_cache_path()
+        self.ttl = ttl
+        self._lock = FileLock(self.path + '.lock')
+
+    def _load(self):
+        """Reads every cached list, by account."""
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def get(self, key):
+        """Looks up a list of apps.
+
+        :param key: The account's key, e.g. ``Heroku.account_key``.
+        :returns: A list of app ``dict`` objects, or ``None`` if there isn't
+            a fresh one.
+        """
+        entry = self._load().get(key)
+
+        if entry is None or entry['expires_at'] <= time.time():
+            return None
+
+        return entry['apps']
+
+    def put(self, key, apps):
+        """Saves a list of apps.
+
+        :param key: The account's key, e.g. ``Heroku.account_key``.
+        :param apps: A list of app ``dict`` objects.
+        """
+        make_parent_dir(self.path)
+
+        with self._lock:
+            lists = self._load()
+            now = time.time()
+
+            for other_key in list(lists):
+                if lists[other_key]['expires_at'] <= now:
+                    del lists[other_key]
+
+            lists[key] = {'apps': apps, 'expires_at': now + self.ttl}
+
+            atomic_write(self.path, json.dumps(lists))
+
+    def invalidate(self, key):
+        """Drops a list of apps, e.g. once apps have been created or deleted.
+
+        :param key: The account's key, e.g. ``Heroku.account_key``.
+        """
+        if not os.path.exists(self.path):
+            return
+
+        with self._lock:
+            lists = self._load()
+
+            if lists.pop(key, None) is not None:
+                atomic_write(self.path, json.dumps(lists))
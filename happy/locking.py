@@ -0,0 +1,123 @@
+"""
+File locking shared between threads and processes on one host.
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+
+def atomic_write(path, text):
+    """Replaces a file's contents all at once.
+
+    The text is written to a temporary file next to the path, which is then
+    renamed over it, so readers see either the old contents or the new, never
+    part of either.
+
+    :param path: Path of the file.
+    :param text: The new contents.
+    """
+    temp_path = '%s.%d.%d.tmp' % (
+        path, os.getpid(), threading.current_thread().ident,
+    )
+
+    with open(temp_path, 'w') as f:
+        f.write(text)
+
+    # os.rename won't replace an existing file on Windows
+    getattr(os, 'replace', os.rename)(temp_path, path)
+
+
+class FileLock(object):
+    """An exclusive lock on a file.
+
+    Entering the lock opens the file for reading and writing, creating it if
+    needed, and returns the open file. Other processes on the same host block
+    until the lock is released. On platforms without ``fcntl``, the lock only
+    works between threads.
+    """
+    def __init__(self, path):
+        """Initializes the class.
+
+        :param path: Path of the file to lock.
+        """
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+
+        try:
+            self._file = open(self.path, 'a+')
+
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        except Exception:
+            self._release()
+            raise
+
+        self._file.seek(0)
+
+        return self._file
+
+    def __exit__(self, *exc_info):
+        self._release()
+
+    def _release(self):
+        """Unlocks and closes the file."""
+        if self._file is not None:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+            self._file.close()
+            self._file = None
+
+        self._thread_lock.release()
+
+
+class JSONFile(object):
+    """A JSON object kept in a file, locked while it's being changed.
+
+    Changes are made holding a lock on ``<path>.lock`` and saved with
+    :func:`atomic_write`, so a crash partway through saving leaves the old
+    contents rather than a broken file, and reading never needs the lock.
+    """
+    def __init__(self, path):
+        """Initializes the class.
+
+        :param path: Path of the file.
+        """
+        self.path = path
+        self._lock = FileLock(path + '.lock')
+
+    def read(self):
+        """Returns the file's contents as a ``dict``, without changing it."""
+        try:
+            with open(self.path) as f:
+                return json.loads(f.read())
+        except (IOError, OSError, ValueError):
+            return {}
+
+    @contextmanager
+    def edit(self):
+        """Locks the file and yields its contents as a ``dict`` for changes.
+
+        Changes are saved even if an error is raised, so work done before the
+        error isn't lost.
+        """
+        with self._lock:
+            data = self.read()
+
+            try:
+                yield data
+            finally:
+                atomic_write(
+                    self.path,
+                    json.dumps(data, indent=2, sort_keys=True),
+                )
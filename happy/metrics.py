@@ -0,0 +1,281 @@
+"""
+Prometheus metrics for API calls and app lifecycles.
+"""
+import bisect
+import threading
+
+from .heroku import parse_time
+from .locking import JSONFile, atomic_write
+from .profile import normalize_endpoint
+
+#: Histogram buckets for API call latency, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+#: Histogram buckets for app-setup build duration, in seconds
+BUILD_BUCKETS = (30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+#: Every metric, with its type, help text, and buckets for histograms
+METRICS = {
+    'happy_api_requests_total': (
+        'counter', 'API calls by endpoint and response status.', None,
+    ),
+    'happy_api_errors_total': (
+        'counter', 'API calls that failed or got an error status.', None,
+    ),
+    'happy_api_request_duration_seconds': (
+        'histogram', 'API call latency.', LATENCY_BUCKETS,
+    ),
+    'happy_apps_created_total': (
+        'counter', 'App-setups created.', None,
+    ),
+    'happy_apps_deleted_total': (
+        'counter', 'Apps deleted.', None,
+    ),
+    'happy_builds_total': (
+        'counter', 'App-setup builds finished, by status.', None,
+    ),
+    'happy_build_duration_seconds': (
+        'histogram', 'Time from app-setup creation to the end of its build.',
+        BUILD_BUCKETS,
+    ),
+}
+
+#: Terminal statuses of an app-setup
+_DONE_STATUSES = frozenset(['succeeded', 'failed'])
+
+
+def _format_labels(labels):
+    """Formats sorted ``(name, value)`` label pairs for the text format."""
+    return ','.join(
+        '%s="%s"' % (name, str(value).replace('\\', '\\\\')
+                     .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+
+
+def _format_value(value):
+    """Formats a sample value, without a trailing ``.0`` on whole numbers."""
+    if value == int(value):
+        return '%d' % value
+
+    return repr(float(value))
+
+
+class Metrics(object):
+    """Counts API calls, app creations and deletions, and builds.
+
+    Everything is collected from request hooks, so any ``Heroku`` client's
+    calls to ``create_build``, ``check_build_status``, ``get_build`` and
+    ``delete_app`` are covered, however they're made. Recording a call is a
+    few dict updates under a lock.
+
+    Counts are merged into a shared state file when they're written, so
+    processes writing to the same path, one after another from cron or all
+    at once on a CI runner, add up rather than overwrite each other.
+    """
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._finished_builds = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, hooks):
+        """Collects metrics from a set of ``Hooks``.
+
+        :param hooks: The ``Hooks`` to register with.
+        """
+        hooks.register('after_response', self._after_response)
+        hooks.register('on_error', self._on_error)
+
+    def inc(self, name, value=1, **labels):
+        """Adds to a counter.
+
+        :param name: Name of the counter, from :data:`METRICS`.
+        :param value: (optional) Amount to add.
+        :param labels: The series' labels.
+        """
+        key = (name, tuple(sorted(labels.items())))
+
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Records a value in a histogram.
+
+        :param name: Name of the histogram, from :data:`METRICS`.
+        :param value: The value to record.
+        :param labels: The series' labels.
+        """
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+
+        with self._lock:
+            histogram = self._histograms.get(key)
+
+            if histogram is None:
+                histogram = self._histograms[key] = {
+                    'buckets': [0] * (len(buckets) + 1),
+                    'count': 0,
+                    'sum': 0,
+                }
+
+            histogram['buckets'][bisect.bisect_left(buckets, value)] += 1
+            histogram['count'] += 1
+            histogram['sum'] += value
+
+    def _after_response(self, method, endpoint, response, data, latency,
+                        **kwargs):
+        """Records an API call that got a response."""
+        template = normalize_endpoint(endpoint)
+        status = response.status_code
+
+        self.inc('happy_api_requests_total', method=method,
+                 endpoint=template, status=status)
+        self.observe('happy_api_request_duration_seconds', latency,
+                     method=method, endpoint=template)
+
+        if status >= 400:
+            self.inc('happy_api_errors_total', method=method,
+                     endpoint=template, reason=status)
+            return
+
+        if method == 'POST' and template == '/app-setups':
+            self.inc('happy_apps_created_total')
+        elif method == 'DELETE' and template == '/apps/:app':
+            self.inc('happy_apps_deleted_total')
+        elif method == 'GET' and template == '/app-setups/:id':
+            self._record_build(data)
+
+    def _on_error(self, method, endpoint, exception, latency, **kwargs):
+        """Records an API call that failed without a response."""
+        template = normalize_endpoint(endpoint)
+
+        self.inc('happy_api_requests_total', method=method,
+                 endpoint=template, status='none')
+        self.observe('happy_api_request_duration_seconds', latency,
+                     method=method, endpoint=template)
+        self.inc('happy_api_errors_total', method=method, endpoint=template,
+                 reason=type(exception).__name__)
+
+    def _record_build(self, data):
+        """Records an app-setup's build once, when it's seen to be done."""
+        try:
+            status = data['status']
+            build_id = data['id']
+        except (ValueError, KeyError, TypeError):
+            return
+
+        if status not in _DONE_STATUSES:
+            return
+
+        with self._lock:
+            if build_id in self._finished_builds:
+                return
+
+            self._finished_builds.add(build_id)
+
+        self.inc('happy_builds_total', status=status)
+
+        try:
+            duration = parse_time(data['updated_at']) - \
+                parse_time(data['created_at'])
+        except (ValueError, KeyError, TypeError):
+            return
+
+        self.observe('happy_build_duration_seconds', duration, status=status)
+
+    def _drain(self):
+        """Returns everything collected as state file entries, and resets
+        the collected values so they're only written once.
+        """
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            histograms, self._histograms = self._histograms, {}
+
+        return (
+            dict(
+                ('%s|%s' % (name, _format_labels(labels)), value)
+                for (name, labels), value in counters.items()
+            ),
+            dict(
+                ('%s|%s' % (name, _format_labels(labels)), histogram)
+                for (name, labels), histogram in histograms.items()
+            ),
+        )
+
+    def write(self, path):
+        """Adds everything collected to a Prometheus textfile.
+
+        The totals are kept in ``<path>.state``, locked while they're
+        updated, and the textfile is replaced atomically so the collector
+        never reads half of it.
+
+        :param path: Path of the textfile, which should end in ``.prom``.
+        """
+        counters, histograms = self._drain()
+
+        with JSONFile(path + '.state').edit() as state:
+            state_counters = state.setdefault('counters', {})
+            state_histograms = state.setdefault('histograms', {})
+
+            for key, value in counters.items():
+                state_counters[key] = state_counters.get(key, 0) + value
+
+            for key, histogram in histograms.items():
+                total = state_histograms.get(key)
+
+                if total is None:
+                    state_histograms[key] = histogram
+                    continue
+
+                total['buckets'] = [
+                    a + b for a, b in zip(total['buckets'],
+                                          histogram['buckets'])
+                ]
+                total['count'] += histogram['count']
+                total['sum'] += histogram['sum']
+
+            atomic_write(path, self._render(state_counters, state_histograms))
+
+    def _render(self, counters, histograms):
+        """Renders state file entries in Prometheus' text format."""
+        samples = {}
+
+        for key, value in sorted(counters.items()):
+            name, labels = key.split('|', 1)
+            samples.setdefault(name, []).append(
+                '%s{%s} %s' % (name, labels, _format_value(value))
+                if labels else '%s %s' % (name, _format_value(value))
+            )
+
+        for key, histogram in sorted(histograms.items()):
+            name, labels = key.split('|', 1)
+            prefix = labels + ',' if labels else ''
+            lines = samples.setdefault(name, [])
+            cumulative = 0
+
+            for bound, count in zip(METRICS[name][2] + ('+Inf',),
+                                    histogram['buckets']):
+                cumulative += count
+                lines.append('%s_bucket{%sle="%s"} %d' % (
+                    name, prefix, bound, cumulative,
+                ))
+
+            suffix = '{%s}' % labels if labels else ''
+            lines.append('%s_sum%s %s' % (
+                name, suffix, _format_value(histogram['sum']),
+            ))
+            lines.append('%s_count%s %d' % (
+                name, suffix, histogram['count'],
+            ))
+
+        output = []
+
+        for name in sorted(samples):
+            metric_type, help_text, buckets_ = METRICS[name]
+
+            output.append('# HELP %s %s' % (name, help_text))
+            output.append('# TYPE %s %s' % (name, metric_type))
+            output.extend(samples[name])
+
+        return '\n'.join(output) + '\n'
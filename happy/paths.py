@@ -0,0 +1,32 @@
+"""
+Where happy keeps its files.
+"""
+import os
+
+
+def cache_path(filename):
+    """Returns the path of a file in happy's cache directory, which is under
+    ``$XDG_CACHE_HOME``, or ``~/.cache`` if that isn't set.
+
+    :param filename: Name of the file.
+    """
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+
+    return os.path.join(cache_dir, 'happy', filename)
+
+
+def make_parent_dir(path):
+    """Creates the directory a file goes in, if it doesn't exist yet.
+
+    :param path: Path of the file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # Made by another process in the meantime
+            if not os.path.isdir(directory):
+                raise
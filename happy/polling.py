@@ -0,0 +1,64 @@
+"""
+Polling strategies for waiting on builds.
+"""
+import random
+import time
+
+
+class Backoff(object):
+    """Polls quickly at first, then backs off exponentially with jitter.
+
+    Any object with a ``delays()`` method that yields seconds to sleep can be
+    used as a polling policy instead of this one. When the generator stops,
+    the wait gives up.
+    """
+    def __init__(self, initial=0.5, maximum=10.0, factor=1.5, jitter=0.2,
+                 timeout=None):
+        """Initializes the class.
+
+        :param initial: (optional) Seconds to wait after the first poll.
+        :param maximum: (optional) Longest wait between polls, in seconds.
+        :param factor: (optional) How much longer each wait is than the last.
+        :param jitter: (optional) Fraction by which each wait is randomly
+            lengthened or shortened, so lots of waiters don't poll in step.
+        :param timeout: (optional) Total seconds to keep polling before
+            giving up. Waits forever if this is ``None``.
+        """
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.timeout = timeout
+
+    def delays(self):
+        """Yields seconds to sleep between polls until the timeout is up.
+
+        The timeout counts from when this is called, not from the first
+        delay taken, so time spent before then, e.g. streaming a build's
+        output or waiting in a queue, counts too.
+        """
+        deadline = None
+
+        if self.timeout is not None:
+            deadline = time.time() + self.timeout
+
+        return self._delays(deadline)
+
+    def _delays(self, deadline):
+        """Yields seconds to sleep between polls until the deadline."""
+        delay = self.initial
+
+        while True:
+            wait = delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+            if deadline is not None:
+                remaining = deadline - time.time()
+
+                if remaining <= 0:
+                    return
+
+                wait = min(wait, remaining)
+
+            yield wait
+
+            delay = min(delay * self.factor, self.maximum)
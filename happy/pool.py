@@ -0,0 +1,172 @@
+"""
+A warm pool of pre-built apps, ready to hand out instantly.
+"""
+import time
+
+from .locking import JSONFile
+
+#: Default path of the pool's state file
+DEFAULT_STATE_FILE = '.happy-pool'
+
+
+class Pool(object):
+    """Keeps a number of apps built from one tarball ready to be claimed.
+
+    Which apps are building or ready is tracked in a local JSON state file,
+    locked so several processes can fill and claim from the same pool. Apps
+    are forgotten once they're claimed. Apps whose builds failed but
+    couldn't be deleted are kept as ``failed``, and deleting them is tried
+    again on the next refill. One state file can hold pools for several
+    tarballs.
+    """
+    def __init__(self, happy, tarball_url, size=1, env=None,
+                 state_file=DEFAULT_STATE_FILE):
+        """Initializes the class.
+
+        :param happy: A ``Happy`` instance used to create and configure apps.
+        :param tarball_url: URL of a tarball containing an ``app.json``.
+        :param size: (optional) Number of apps to keep ready.
+        :param env: (optional) Dict of environment variable overrides used
+            when building the pool's apps.
+        :param state_file: (optional) Path of the pool's state file.
+        """
+        self.happy = happy
+        self.tarball_url = tarball_url
+        self.size = size
+        self.env = env
+        self._state = JSONFile(state_file)
+
+    def _filter(self, apps, status):
+        """Returns the names of this pool's apps with a status."""
+        return [
+            app_name for app_name, info in apps.items()
+            if info['tarball_url'] == self.tarball_url
+            and info['status'] == status
+        ]
+
+    def _set_status(self, app_name, status):
+        """Updates the status of one of the pool's apps."""
+        with self._state.edit() as apps:
+            if app_name in apps:
+                apps[app_name]['status'] = status
+
+    def apps(self, status):
+        """Lists this pool's apps with a status.
+
+        :param status: One of ``building``, ``ready`` or ``failed``.
+        :returns: A list of app names.
+        """
+        return self._filter(self._state.read(), status)
+
+    def _delete(self, app_names):
+        """Deletes apps and forgets them, or marks them ``failed`` if they
+        can't be deleted, so they aren't forgotten while they still exist.
+
+        :returns: A list of names of the apps that couldn't be deleted.
+        """
+        undeleted = []
+
+        for app_name in app_names:
+            try:
+                self.happy.delete(app_name=app_name)
+            except Exception:
+                self._set_status(app_name, 'failed')
+                undeleted.append(app_name)
+            else:
+                self.forget([app_name])
+
+        return undeleted
+
+    def refill(self, timeout=None):
+        """Creates apps until the pool is full, and waits for them.
+
+        Apps left building by an earlier refill are waited on too. Apps whose
+        builds fail are deleted, and so are failed apps that an earlier
+        refill couldn't delete.
+
+        The state file is only locked while reading it and recording each new
+        app, not while apps are being created, so claims aren't held up.
+        Refills running at the same time can each create the apps that are
+        missing, overfilling the pool.
+
+        :param timeout: (optional) Seconds to wait for each build.
+        :returns: A list of names of apps that became ready.
+        """
+        with self._state.edit() as apps:
+            building = dict(
+                (app_name, apps[app_name]['build_id'])
+                for app_name in self._filter(apps, 'building')
+            )
+            missing = self.size - len(building) - \
+                len(self._filter(apps, 'ready'))
+            failed = self._filter(apps, 'failed')
+
+        self._delete(failed)
+
+        for index_ in range(missing):
+            build_id, app_name = self.happy.create(
+                tarball_url=self.tarball_url,
+                env=self.env,
+            )
+
+            building[app_name] = build_id
+
+            with self._state.edit() as apps:
+                apps[app_name] = {
+                    'build_id': build_id,
+                    'created_at': time.time(),
+                    'status': 'building',
+                    'tarball_url': self.tarball_url,
+                }
+
+        futures = dict(
+            (app_name, self.happy.watch(build_id, timeout=timeout))
+            for app_name, build_id in building.items()
+        )
+
+        refilled = []
+
+        for app_name, future in futures.items():
+            try:
+                future.result()
+            except Exception:
+                self._delete([app_name])
+            else:
+                self._set_status(app_name, 'ready')
+                refilled.append(app_name)
+
+        return refilled
+
+    def claim(self, env=None):
+        """Hands out a ready app from the pool.
+
+        :param env: (optional) Dict of environment variables to set on the
+            app, applied as config var updates.
+        :returns: The name of the claimed app, or ``None`` if none are ready.
+        """
+        with self._state.edit() as apps:
+            ready = sorted(
+                self._filter(apps, 'ready'),
+                key=lambda app_name: apps[app_name]['created_at'],
+            )
+
+            if not ready:
+                return None
+
+            # Whoever claims it keeps track of it from now on
+            app_name = ready[0]
+            del apps[app_name]
+
+        if env:
+            self.happy.configure(app_name=app_name, env=env)
+
+        return app_name
+
+    def forget(self, app_names):
+        """Stops tracking apps, e.g. after they're deleted.
+
+        :param app_names: List of names of the apps to forget.
+        """
+        with self._state.edit() as apps:
+            for app_name in app_names:
+                apps.pop(app_name, None)
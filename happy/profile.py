@@ -0,0 +1,266 @@
+"""
+Timing how long bringing up an app takes, phase by phase.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+#: Statuses from ``build_status_change`` that are phases of a build
+BUILD_PHASES = ('provisioning', 'build', 'postdeploy')
+
+#: Collections whose next path segment is an ID or name
+_ID_SEGMENTS = {
+    'app-setups': ':id',
+    'apps': ':app',
+    'builds': ':id',
+}
+
+
+def normalize_endpoint(endpoint):
+    """Replaces IDs and names in an API endpoint with placeholders.
+
+    :param endpoint: API endpoint, e.g. ``/apps/butt-man-123``.
+    :returns: The endpoint's template, e.g. ``/apps/:app``.
+    """
+    segments = endpoint.split('?')[0].split('/')
+
+    for index in range(1, len(segments)):
+        placeholder = _ID_SEGMENTS.get(segments[index - 1])
+
+        if placeholder and segments[index]:
+            segments[index] = placeholder
+
+    return '/'.join(segments)
+
+
+def build_phase(data):
+    """Works out which phase an app-setup is in.
+
+    :param data: Response data for an app-setup build.
+    :returns: One of ``provisioning`` (the app and its addons are being set
+        up), ``build``, ``postdeploy``, or ``None`` if it's done.
+    """
+    if data.get('status') != 'pending':
+        return None
+
+    build = data.get('build')
+
+    if not build:
+        return 'provisioning'
+    elif build.get('status') == 'pending':
+        return 'build'
+    else:
+        return 'postdeploy'
+
+
+def _covered(intervals):
+    """Returns how many seconds a list of ``(start, end)`` intervals cover,
+    counting time where they overlap once.
+    """
+    total = 0
+    covered_until = None
+
+    for start, end in sorted(intervals):
+        if covered_until is None or start > covered_until:
+            total += end - start
+            covered_until = end
+        elif end > covered_until:
+            total += end - covered_until
+            covered_until = end
+
+    return total
+
+
+class Profiler(object):
+    """Records timestamps for each phase of a run and for every API call.
+
+    Times are in seconds since the profiler was created. It's safe to share
+    one profiler between threads. Each build's phases are tracked on their
+    own, so several builds can be profiled at once.
+    """
+    def __init__(self):
+        self.start = time.time()
+        self.phases = []
+        self.requests = []
+        self._current = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, hooks):
+        """Records API calls and build phases from a set of ``Hooks``.
+
+        :param hooks: The ``Hooks`` to register with.
+        """
+        hooks.register('after_response', self._after_response)
+        hooks.register('on_error', self._on_error)
+        hooks.register('build_status_change', self._build_status_change)
+
+    def _after_response(self, method, endpoint, response, start, latency,
+                        **kwargs):
+        """Records an API call that got a response."""
+        self.record_request(
+            method, endpoint, start, latency, response.status_code,
+            len(response.content),
+        )
+
+    def _on_error(self, method, endpoint, start, latency, **kwargs):
+        """Records an API call that failed without a response."""
+        self.record_request(method, endpoint, start, latency, None, 0)
+
+    def _build_status_change(self, build_id, status, **kwargs):
+        """Starts timing a build's new phase."""
+        self.transition(
+            status if status in BUILD_PHASES else None,
+            build_id=build_id,
+        )
+
+    def _now(self):
+        """Returns seconds since the profiler was created."""
+        return time.time() - self.start
+
+    @contextmanager
+    def phase(self, name):
+        """Times a phase around a block of code.
+
+        :param name: Name of the phase.
+        """
+        start = self._now()
+
+        try:
+            yield
+        finally:
+            self._add_phase(name, start, self._now())
+
+    def transition(self, name, build_id=None):
+        """Ends the current phase, if it's different, and starts a new one.
+
+        :param name: Name of the new phase, or ``None`` to just end the
+            current one.
+        :param build_id: (optional) ID of the build whose phase this is.
+            Each build has its own current phase.
+        """
+        with self._lock:
+            now = self._now()
+            current = self._current.get(build_id)
+
+            if current and current[0] == name:
+                return
+
+            if name:
+                self._current[build_id] = (name, now)
+            else:
+                self._current.pop(build_id, None)
+
+        if current:
+            self._add_phase(current[0], current[1], now, build_id)
+
+    def _add_phase(self, name, start, end, build_id=None):
+        """Records a finished phase."""
+        with self._lock:
+            self.phases.append({
+                'name': name,
+                'build_id': build_id,
+                'start': start,
+                'end': end,
+                'duration': end - start,
+            })
+
+    def record_request(self, method, endpoint, start, latency, status,
+                       size):
+        """Records an API call.
+
+        :param method: HTTP method.
+        :param endpoint: API endpoint, e.g. ``/apps``.
+        :param start: Time the request was sent, from ``time.time()``.
+        :param latency: Seconds until the response came back.
+        :param status: HTTP status code, or ``None`` if there was no response.
+        :param size: Size of the response body in bytes.
+        """
+        with self._lock:
+            self.requests.append({
+                'method': method,
+                'endpoint': endpoint,
+                'start': start - self.start,
+                'latency': latency,
+                'status': status,
+                'bytes': size,
+            })
+
+    def to_dict(self):
+        """Returns everything recorded, ready to be dumped as JSON."""
+        with self._lock:
+            return {
+                'phases': list(self.phases),
+                'requests': list(self.requests),
+                'total': self._now(),
+            }
+
+    def write_json(self, path):
+        """Writes everything recorded to a JSON file.
+
+        :param path: Path of the file.
+        """
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+
+    def summary(self):
+        """Returns a table of phase and API call timings.
+
+        Each phase's seconds are the time at least one build or app was in
+        it, so phases that overlap across builds aren't counted twice, next
+        to how long each one took on average.
+        """
+        data = self.to_dict()
+
+        lines = ['%-24s %6s %10s %10s' % ('Phase', 'Count', 'Avg s',
+                                          'Seconds')]
+
+        names = []
+        intervals = {}
+
+        for phase in data['phases']:
+            if phase['name'] not in intervals:
+                names.append(phase['name'])
+                intervals[phase['name']] = []
+
+            intervals[phase['name']].append((phase['start'], phase['end']))
+
+        for name in names:
+            lines.append('%-24s %6d %10.3f %10.3f' % (
+                name,
+                len(intervals[name]),
+                sum(end - start for start, end in intervals[name]) /
+                len(intervals[name]),
+                _covered(intervals[name]),
+            ))
+
+        lines.append('%-24s %6s %10s %10.3f' % (
+            'total', '', '', data['total'],
+        ))
+
+        endpoints = {}
+
+        for request in data['requests']:
+            key = '%s %s' % (
+                request['method'],
+                normalize_endpoint(request['endpoint']),
+            )
+            endpoints.setdefault(key, []).append(request)
+
+        lines.append('')
+        lines.append('%-32s %6s %9s %9s %10s' % (
+            'API call', 'Calls', 'Avg ms', 'Max ms', 'Bytes',
+        ))
+
+        for key, requests in sorted(endpoints.items()):
+            latencies = [request['latency'] for request in requests]
+
+            lines.append('%-32s %6d %9.1f %9.1f %10d' % (
+                key,
+                len(requests),
+                1000 * sum(latencies) / len(latencies),
+                1000 * max(latencies),
+                sum(request['bytes'] for request in requests),
+            ))
+
+        return '\n'.join(lines)
@@ -0,0 +1,98 @@
+"""
+Client-side throttling for the Heroku API rate limit.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from .locking import FileLock
+
+
+class RateLimiter(object):
+    """A token bucket kept in step with Heroku's ``RateLimit-Remaining``.
+
+    Heroku gives each account 4500 requests, refilled at 75 per minute. Every
+    request takes a token from the bucket, and every response resets the
+    bucket to what Heroku says is left. Once the bucket drops to ``reserve``
+    tokens, requests are paced at the refill rate instead of running into
+    429s.
+
+    One limiter can be shared by every thread using a client. To share one
+    between processes on the same host too, give it a ``state_file``.
+    """
+    def __init__(self, capacity=4500, refill_rate=75 / 60.0, reserve=100,
+                 state_file=None):
+        """Initializes the class.
+
+        :param capacity: (optional) Most tokens the bucket can hold.
+        :param refill_rate: (optional) Tokens added back per second.
+        :param reserve: (optional) Tokens held back before slowing down.
+        :param state_file: (optional) Path of a file holding the bucket, so
+            processes on the same host can share it.
+        """
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.reserve = reserve
+
+        self._state = {'tokens': float(capacity), 'updated': time.time()}
+        self._lock = FileLock(state_file) if state_file else threading.Lock()
+        self._state_file = state_file
+
+    @contextmanager
+    def _locked_state(self):
+        """Locks the bucket and yields its refilled state for changes."""
+        with self._lock as f:
+            state = self._state
+
+            if self._state_file:
+                try:
+                    state = json.loads(f.read())
+                except ValueError:
+                    pass
+
+            now = time.time()
+            state['tokens'] = min(
+                self.capacity,
+                state['tokens'] + (now - state['updated']) * self.refill_rate,
+            )
+            state['updated'] = now
+
+            yield state
+
+            self._state = state
+
+            if self._state_file:
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+
+    @property
+    def remaining(self):
+        """The number of requests left in the budget."""
+        with self._locked_state() as state:
+            return state['tokens']
+
+    def acquire(self):
+        """Takes a token from the bucket, waiting for one if needed."""
+        while True:
+            with self._locked_state() as state:
+                available = state['tokens'] - self.reserve
+
+                if available >= 1:
+                    state['tokens'] -= 1
+                    return
+
+                # Wait for the token, but always at least 1 ms
+                delay = max((1 - available) / self.refill_rate, 0.001)
+
+            time.sleep(delay)
+
+    def update(self, remaining):
+        """Resets the bucket to what the API says is left.
+
+        :param remaining: Value of the ``RateLimit-Remaining`` header.
+        """
+        with self._locked_state() as state:
+            state['tokens'] = float(remaining)
@@ -0,0 +1,271 @@
+"""
+Packaging local source code for Heroku.
+"""
+import hashlib
+import os
+import stat
+import subprocess
+import tarfile
+import time
+import zlib
+
+from .locking import JSONFile
+from .paths import cache_path, make_parent_dir
+
+#: Bytes read from each file at a time
+CHUNK_SIZE = 64 * 1024
+
+#: Seconds an uploaded source is reused for. Heroku's URLs last an hour, and
+#: builds need a few minutes to fetch them.
+SOURCE_TTL = 50 * 60
+
+
+def _read_chunks(path):
+    """Yields a file's contents in chunks."""
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(CHUNK_SIZE), b''):
+            yield data
+
+
+def default_cache_path():
+    """Returns the default path of the source cache's index."""
+    return cache_path('sources.json')
+
+
+def list_files(root):
+    """Lists the files under a directory that should be uploaded.
+
+    Inside a git work tree this respects ``.gitignore``, otherwise every file
+    except those under ``.git`` is listed.
+
+    :param root: Path of the directory.
+    :returns: A sorted list of paths relative to ``root``.
+    """
+    try:
+        with open(os.devnull, 'w') as devnull:
+            output = subprocess.check_output(
+                ['git', 'ls-files', '-z', '--cached', '--others',
+                 '--exclude-standard'],
+                cwd=root,
+                stderr=devnull,
+            )
+    except (OSError, subprocess.CalledProcessError):
+        paths = []
+
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [name for name in dirnames if name != '.git']
+
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                paths.append(os.path.relpath(path, root))
+    else:
+        paths = [
+            path.decode('utf-8') for path in output.split(b'\0') if path
+        ]
+
+    # Skip tracked files deleted from the work tree, and submodules
+    return sorted(
+        path for path in set(paths)
+        if os.path.islink(os.path.join(root, path))
+        or os.path.isfile(os.path.join(root, path))
+    )
+
+
+class Tarball(object):
+    """A gzipped tarball of a directory, streamed in chunks.
+
+    Nothing is written to disk and only one chunk is held in memory at a time,
+    however big the directory is. Iterating over the tarball builds it from
+    scratch each time, with the same bytes as long as the files don't change,
+    so ``len()`` can be found with a first pass that throws the chunks away.
+    That makes it usable as a request body with a ``Content-Length``, which
+    S3 upload URLs require.
+    """
+    def __init__(self, root, paths=None):
+        """Initializes the class.
+
+        :param root: Path of the directory to package.
+        :param paths: (optional) Paths relative to ``root`` to include.
+            Defaults to :func:`list_files`.
+        """
+        self.root = root
+        self.paths = list_files(root) if paths is None else paths
+        self._length = None
+
+    def __len__(self):
+        if self._length is None:
+            self._length = sum(len(chunk) for chunk in self)
+
+        return self._length
+
+    def __iter__(self):
+        # 16 + MAX_WBITS makes zlib write a gzip header, with mtime 0
+        compressor = zlib.compressobj(
+            6, zlib.DEFLATED, 16 + zlib.MAX_WBITS,
+        )
+
+        for data in self._tar_chunks():
+            chunk = compressor.compress(data)
+
+            if chunk:
+                yield chunk
+
+        yield compressor.flush()
+
+    def digest(self):
+        """Returns a SHA-256 hex digest of the files' names, modes and
+        contents, which is much cheaper than building the tarball.
+        """
+        digest = hashlib.sha256()
+
+        for path in self.paths:
+            full_path = os.path.join(self.root, path)
+            info = os.lstat(full_path)
+
+            if stat.S_ISLNK(info.st_mode):
+                contents = [os.readlink(full_path).encode('utf-8')]
+                size = len(contents[0])
+            else:
+                contents = _read_chunks(full_path)
+                size = info.st_size
+
+            digest.update(('%s\0%o\0%d\0' % (
+                path.replace(os.sep, '/'),
+                stat.S_IMODE(info.st_mode),
+                size,
+            )).encode('utf-8'))
+
+            for data in contents:
+                digest.update(data)
+
+        return digest.hexdigest()
+
+    def _tar_chunks(self):
+        """Yields the uncompressed tarball in chunks."""
+        offset = 0
+
+        for path in self.paths:
+            full_path = os.path.join(self.root, path)
+            info = os.lstat(full_path)
+
+            tarinfo = tarfile.TarInfo(path.replace(os.sep, '/'))
+            tarinfo.mode = stat.S_IMODE(info.st_mode)
+            tarinfo.mtime = int(info.st_mtime)
+
+            if stat.S_ISLNK(info.st_mode):
+                tarinfo.type = tarfile.SYMTYPE
+                tarinfo.linkname = os.readlink(full_path)
+            else:
+                tarinfo.size = info.st_size
+
+            header = tarinfo.tobuf(format=tarfile.GNU_FORMAT)
+            offset += len(header)
+            yield header
+
+            if tarinfo.type == tarfile.SYMTYPE:
+                continue
+
+            remaining = tarinfo.size
+
+            with open(full_path, 'rb') as f:
+                while remaining > 0:
+                    data = f.read(min(CHUNK_SIZE, remaining))
+
+                    if not data:
+                        raise IOError('%s changed while packaging.' % path)
+
+                    remaining -= len(data)
+                    offset += len(data)
+                    yield data
+
+            padding = -offset % tarfile.BLOCKSIZE
+            offset += padding
+            yield tarfile.NUL * padding
+
+        # Two empty blocks end the archive, padded out to a whole record
+        end = tarfile.NUL * (2 * tarfile.BLOCKSIZE)
+        offset += len(end)
+        yield end + tarfile.NUL * (-offset % tarfile.RECORDSIZE)
+
+
+class SourceCache(object):
+    """A local index of uploaded source tarballs, by content hash.
+
+    Jobs uploading the same files can share one cache and skip packaging and
+    uploading entirely while an earlier upload is still fresh. The index is
+    locked, so it's safe to share between processes.
+    """
+    def __init__(self, path=None, ttl=SOURCE_TTL):
+        """Initializes the class.
+
+        :param path: (optional) Path of the index file. Defaults to
+            :func:`default_cache_path`.
+        :param ttl: (optional) Seconds to reuse each uploaded source for.
+        """
+        self.path = path or default_cache_path()
+        self.ttl = ttl
+
+        make_parent_dir(self.path)
+
+        self._index = JSONFile(self.path)
+
+    def get(self, digest):
+        """Looks up an uploaded source, counting the hit or miss.
+
+        :param digest: The tarball's :meth:`Tarball.digest`.
+        :returns: The source's URL, or ``None`` if there isn't a fresh one.
+        """
+        with self._index.edit() as index:
+            sources = index.setdefault('sources', {})
+            stats = index.setdefault('stats', {
+                'bytes_saved': 0,
+                'hits': 0,
+                'misses': 0,
+            })
+
+            now = time.time()
+
+            for key in list(sources):
+                if sources[key]['expires_at'] <= now:
+                    del sources[key]
+
+            source = sources.get(digest)
+
+            if source is None:
+                stats['misses'] += 1
+                return None
+
+            stats['hits'] += 1
+            stats['bytes_saved'] += source['size']
+
+            return source['url']
+
+    def put(self, digest, url, size):
+        """Records an uploaded source.
+
+        :param digest: The tarball's :meth:`Tarball.digest`.
+        :param url: The URL the tarball can be fetched from.
+        :param size: Size of the tarball in bytes.
+        """
+        with self._index.edit() as index:
+            index.setdefault('sources', {})[digest] = {
+                'expires_at': time.time() + self.ttl,
+                'size': size,
+                'url': url,
+            }
+
+    def stats(self):
+        """Returns a dict with ``hits``, ``misses``, ``hit_rate`` and
+        ``bytes_saved``.
+        """
+        with self._index.edit() as index:
+            stats = dict(index.get('stats', {}))
+
+        stats.setdefault('bytes_saved', 0)
+        stats.setdefault('hits', 0)
+        stats.setdefault('misses', 0)
+
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = float(stats['hits']) / lookups if lookups else 0.0
+
+        return stats
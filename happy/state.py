@@ -0,0 +1,194 @@
+"""
+Records of the apps brought up from a workspace.
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from .locking import FileLock, atomic_write
+
+#: Default path of the state file
+DEFAULT_STATE_FILE = '.happy'
+
+#: Version of the state file's format
+VERSION = 1
+
+
+class State(object):
+    """Keeps a record of every app brought up from a workspace.
+
+    Each record has the app's name, the ID of its latest build, the tarball
+    it was built from, when it was created, its status (``building``,
+    ``up`` or ``failed``) and any tags. The build is an app-setup, or a
+    plain build of an existing app if its ``build_type`` is ``build``.
+
+    Records are kept in a JSON file, keyed by app name. Changes are made
+    holding a lock on ``<path>.lock``, and saved by renaming a new file over
+    the old one, so any number of processes can change the records at once,
+    and reading them never needs the lock.
+
+    A state file from older versions of happy, holding only app names, is
+    read as records of apps that are up, and is rewritten in the new format
+    the first time it's changed.
+    """
+    def __init__(self, path=DEFAULT_STATE_FILE):
+        """Initializes the class.
+
+        :param path: (optional) Path of the state file.
+        """
+        self.path = path
+        self._lock = FileLock(path + '.lock')
+
+    def _load(self):
+        """Reads the records from the state file.
+
+        :returns: A dict of records, by app name.
+        """
+        try:
+            with open(self.path) as f:
+                contents = f.read()
+        except (IOError, OSError):
+            return {}
+
+        try:
+            data = json.loads(contents)
+        except ValueError:
+            data = None
+
+        if isinstance(data, dict):
+            return data.get('apps', {})
+
+        # App names, one per line, from before records were kept
+        created_at = os.path.getmtime(self.path)
+
+        return dict(
+            (app_name, _record(app_name, created_at=created_at, status='up'))
+            for app_name in contents.split()
+        )
+
+    @contextmanager
+    def _edit(self):
+        """Locks the state file and yields its records for changes.
+
+        The file is deleted once there are no records left.
+        """
+        with self._lock:
+            apps = self._load()
+
+            yield apps
+
+            if apps:
+                atomic_write(self.path, json.dumps(
+                    {'version': VERSION, 'apps': apps},
+                    indent=2,
+                    sort_keys=True,
+                ))
+            elif os.path.exists(self.path):
+                os.remove(self.path)
+
+    def add(self, app_name, build_id=None, tarball_url=None, status='up',
+            tags=None, build_type='app-setup'):
+        """Records an app, replacing any record with the same name.
+
+        :param app_name: Name of the app.
+        :param build_id: (optional) ID of the app's latest build.
+        :param tarball_url: (optional) URL of the tarball the app was built
+            from.
+        :param status: (optional) One of ``building``, ``up`` or ``failed``.
+        :param tags: (optional) List of tags, for finding the app later.
+        :param build_type: (optional) ``app-setup``, or ``build`` if
+            ``build_id`` is a plain build of an existing app.
+        :returns: The new record.
+        """
+        record = _record(
+            app_name,
+            build_id=build_id,
+            tarball_url=tarball_url,
+            created_at=time.time(),
+            status=status,
+            tags=sorted(set(tags or [])),
+            build_type=build_type,
+        )
+
+        with self._edit() as apps:
+            apps[app_name] = record
+
+        return record
+
+    def update(self, app_name, **fields):
+        """Changes an app's record.
+
+        :param app_name: Name of the app.
+        :param fields: Fields to change, like ``status='up'``.
+        :returns: The changed record, or ``None`` if the app isn't recorded.
+        """
+        with self._edit() as apps:
+            record = apps.get(app_name)
+
+            if record is not None:
+                record.update(fields)
+
+        return record
+
+    def remove(self, app_names):
+        """Forgets apps.
+
+        :param app_names: List of app names.
+        """
+        with self._edit() as apps:
+            for app_name in app_names:
+                apps.pop(app_name, None)
+
+    def get(self, app_name):
+        """Looks up an app's record.
+
+        :param app_name: Name of the app.
+        :returns: The record, or ``None`` if the app isn't recorded.
+        """
+        return self._load().get(app_name)
+
+    def apps(self, tag=None, status=None, older_than=None):
+        """Lists records, oldest first.
+
+        :param tag: (optional) Only list apps with this tag.
+        :param status: (optional) Only list apps with this status.
+        :param older_than: (optional) Only list apps created more than this
+            many seconds ago.
+        :returns: A list of records.
+        """
+        records = sorted(
+            self._load().values(),
+            key=lambda record: (record['created_at'] or 0, record['name']),
+        )
+
+        if tag is not None:
+            records = [record for record in records if tag in record['tags']]
+
+        if status is not None:
+            records = [
+                record for record in records if record['status'] == status
+            ]
+
+        if older_than is not None:
+            cutoff = time.time() - older_than
+            records = [
+                record for record in records
+                if (record['created_at'] or 0) < cutoff
+            ]
+
+        return records
+
+
+def _record(app_name, build_id=None, tarball_url=None, created_at=None,
+            status='up', tags=None, build_type='app-setup'):
+    """Returns a new record of an app."""
+    return {
+        'name': app_name,
+        'build_id': build_id,
+        'build_type': build_type,
+        'tarball_url': tarball_url,
+        'created_at': created_at,
+        'status': status,
+        'tags': tags or [],
+    }
@@ -0,0 +1,581 @@
+"""
+A fake Heroku API server, for load testing happy without touching Heroku.
+
+Start one and point a client at it::
+
+    from happy import Happy
+    from happy.heroku import Heroku
+    from happy.testing import FakeHeroku, lognormal
+
+    with FakeHeroku(build_time=5, latency=lognormal(0.1, 0.5)) as fake:
+        api = Heroku(auth_token='fake', api_root=fake.url)
+        happy = Happy(api=api)
+
+The CLI can be pointed at it with the ``HAPPY_API_ROOT`` environment
+variable.
+"""
+import hashlib
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:  # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+from .profile import normalize_endpoint
+
+#: Share of an app-setup's time spent provisioning before the build starts
+PROVISIONING_SHARE = 0.2
+
+#: Share of an app-setup's time by the end of which the build is done, with
+#: the rest spent running postdeploy scripts
+BUILD_SHARE = 0.9
+
+#: Items in a page of a list when the ``Range`` header doesn't say
+PAGE_SIZE = 200
+
+#: Most items in a page of a list
+MAX_PAGE_SIZE = 1000
+
+#: A ``Range`` header, e.g. ``name ]app-1..; max=100``
+_RANGE = re.compile(r'^(\w+) (\]?)([^.]*)\.\.[^;]*(?:;\s*max=(\d+))?')
+
+
+def uniform(low, high, seed=None):
+    """Returns a function giving uniformly distributed durations.
+
+    :param low: Shortest duration, in seconds.
+    :param high: Longest duration, in seconds.
+    :param seed: (optional) Seed for repeatable runs.
+    """
+    generator = random.Random(seed)
+
+    return lambda: generator.uniform(low, high)
+
+
+def lognormal(median, sigma, seed=None):
+    """Returns a function giving log-normally distributed durations, which
+    is roughly how network latency is spread out, with a long tail.
+
+    :param median: Median duration, in seconds.
+    :param sigma: Spread; 0.5 puts the 99th percentile at about 3x the
+        median.
+    :param seed: (optional) Seed for repeatable runs.
+    """
+    generator = random.Random(seed)
+
+    return lambda: generator.lognormvariate(math.log(median), sigma)
+
+
+def _timestamp(seconds):
+    """Formats a Unix time the way the Heroku API does."""
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(seconds))
+
+
+def _sample(value):
+    """Returns a duration from a number or a function giving numbers."""
+    return value() if callable(value) else value
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    """An HTTP server handling each connection in its own thread."""
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Passes requests along to a ``FakeHeroku``."""
+    # Keep connections alive, like the real API
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        """Keeps quiet instead of logging every request to stderr."""
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+
+        status, headers, data = self.server.fake.handle(
+            self.command, self.path, body, self.headers,
+        )
+
+        payload = b'' if data is None else json.dumps(data).encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+
+        for name, value in headers.items():
+            self.send_header(name, value)
+
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_DELETE = do_GET = do_PATCH = do_POST = do_PUT = _handle
+
+
+def _paginate(items, range_header=None):
+    """Returns a page of a list, like Heroku's ``Range`` pagination.
+
+    :param items: List of dicts.
+    :param range_header: (optional) The request's ``Range`` header, giving
+        the field to sort by, where to start, and how many items to return.
+    :returns: A tuple with ``(page, next_range)``, where ``next_range`` is
+        the ``Next-Range`` for the rest of the list, or ``None``.
+    """
+    match = _RANGE.match(range_header or '')
+
+    if match is None:
+        field, exclusive, start, size = 'id', '', '', None
+    else:
+        field, exclusive, start, size = match.groups()
+
+    size = min(int(size or PAGE_SIZE), MAX_PAGE_SIZE)
+    items = sorted(items, key=lambda item: str(item.get(field)))
+
+    if start:
+        items = [
+            item for item in items
+            if str(item.get(field)) > start
+            or (not exclusive and str(item.get(field)) == start)
+        ]
+
+    if len(items) <= size:
+        return (items, None)
+
+    page = items[:size]
+
+    return (page, '%s ]%s..; max=%d' % (field, page[-1].get(field), size))
+
+
+class FakeHeroku(object):
+    """A local HTTP server acting like the parts of the Heroku API happy uses.
+
+    It handles ``/app-setups``, ``/app-setups/:id``, ``/apps``,
+    ``/apps/:name``, ``/apps/:name/builds``, ``/apps/:name/builds/:id``,
+    ``/apps/:name/config-vars`` and ``/sources``, and sends
+    ``RateLimit-Remaining`` headers from a token bucket that refills like
+    Heroku's. App-setups go through provisioning, build and postdeploy
+    phases over their build time, while builds of existing apps only take
+    the build phase's share of it. Lists are paginated with ``Range`` and
+    ``Next-Range`` headers.
+
+    Durations can be numbers of seconds, or functions returning them, like
+    :func:`uniform` and :func:`lognormal`.
+    """
+    def __init__(self, build_time=0, latency=0, error_rate=0,
+                 throttle_rate=0, failure_rate=0, capacity=None,
+                 rate_limit=4500, refill_rate=75 / 60., seed=None,
+                 host='127.0.0.1', port=0):
+        """Initializes the class.
+
+        :param build_time: (optional) How long each app-setup takes.
+        :param latency: (optional) How long each API request takes.
+        :param error_rate: (optional) Share of API requests answered with a
+            503.
+        :param throttle_rate: (optional) Share of API requests answered with
+            a 429, on top of the real rate limit.
+        :param failure_rate: (optional) Share of app-setups whose builds
+            fail.
+        :param capacity: (optional) Most apps that can exist at once. Creating
+            more is refused with a 422, like an account's app limit.
+        :param rate_limit: (optional) Size of the API rate limit's bucket.
+        :param refill_rate: (optional) Requests per second added back to the
+            rate limit's bucket.
+        :param seed: (optional) Seed for repeatable error injection.
+        :param host: (optional) Address to listen on.
+        :param port: (optional) Port to listen on. Defaults to a free one.
+        """
+        self.build_time = build_time
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.failure_rate = failure_rate
+        self.capacity = capacity
+        self.rate_limit = rate_limit
+        self.refill_rate = refill_rate
+        self.host = host
+        self.port = port
+
+        self.apps = {}
+        self.setups = {}
+        self.builds = {}
+        self.sources = {}
+        self.request_counts = {}
+        self.not_modified = 0
+        self.peak_apps = 0
+
+        self._random = random.Random(seed)
+        self._tokens = float(rate_limit)
+        self._refilled_at = time.time()
+        self._app_numbers = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+        self._routes = [
+            ('POST', re.compile(r'^/app-setups$'), self._create_setup),
+            ('GET', re.compile(r'^/app-setups/([^/]+)$'), self._get_setup),
+            ('GET', re.compile(r'^/apps$'), self._list_apps),
+            ('GET', re.compile(r'^/apps/([^/]+)$'), self._get_app),
+            ('DELETE', re.compile(r'^/apps/([^/]+)$'), self._delete_app),
+            ('POST', re.compile(r'^/apps/([^/]+)/builds$'),
+             self._create_build),
+            ('GET', re.compile(r'^/apps/([^/]+)/builds/([^/]+)$'),
+             self._get_build),
+            ('PATCH', re.compile(r'^/apps/([^/]+)/config-vars$'),
+             self._update_config),
+            ('POST', re.compile(r'^/sources$'), self._create_source),
+        ]
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def url(self):
+        """Base URL of the running server, to use as a client's API root."""
+        host, port = self._server.server_address[:2]
+
+        return 'http://%s:%d' % (host, port)
+
+    def start(self):
+        """Starts serving requests in a background thread.
+
+        :returns: This instance.
+        """
+        self._server = _Server((self.host, self.port), _Handler)
+        self._server.fake = self
+
+        # Poll often so stop() returns quickly
+        self._thread = threading.Thread(
+            target=self._server.serve_forever,
+            kwargs={'poll_interval': 0.05},
+        )
+        self._thread.daemon = True
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        """Stops the server."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def handle(self, method, path, body, headers=None):
+        """Handles a request.
+
+        GET responses have an ``ETag``, and a ``304 Not Modified`` is sent
+        instead when it matches the request's ``If-None-Match``.
+
+        :param method: HTTP method.
+        :param path: Request path, e.g. ``/apps``.
+        :param body: Request body as bytes.
+        :param headers: (optional) Request headers.
+        :returns: A tuple with ``(status, headers, data)``, where ``data`` is
+            sent as JSON.
+        """
+        path = path.split('?')[0]
+        request_headers = headers or {}
+
+        # Uploads go to S3 rather than the API, so they aren't limited
+        if path.startswith('/_sources/'):
+            return self._upload_source(method, path, body)
+
+        delay = _sample(self.latency)
+
+        if delay > 0:
+            time.sleep(delay)
+
+        with self._lock:
+            key = '%s %s' % (method, normalize_endpoint(path))
+            self.request_counts[key] = self.request_counts.get(key, 0) + 1
+
+            now = time.time()
+            self._tokens = min(
+                self.rate_limit,
+                self._tokens + (now - self._refilled_at) * self.refill_rate,
+            )
+            self._refilled_at = now
+
+            roll = self._random.random()
+
+            if self._tokens < 1 or roll < self.throttle_rate:
+                return (429, {'RateLimit-Remaining': '0'}, {
+                    'id': 'rate_limit',
+                    'message': 'Your account reached the API rate limit.',
+                })
+
+            self._tokens -= 1
+            headers = {'RateLimit-Remaining': '%d' % self._tokens}
+
+            if roll < self.throttle_rate + self.error_rate:
+                return (503, headers, {
+                    'id': 'unavailable',
+                    'message': 'The service is temporarily unavailable.',
+                })
+
+            try:
+                data = json.loads(body.decode('utf-8')) if body else {}
+            except ValueError:
+                return (400, headers, {
+                    'id': 'bad_request',
+                    'message': 'Invalid JSON.',
+                })
+
+            for route_method, pattern, handler in self._routes:
+                match = pattern.match(path)
+
+                if route_method == method and match:
+                    status, data = handler(data, *match.groups())
+                    break
+            else:
+                return (404, headers, {
+                    'id': 'not_found',
+                    'message': 'No such endpoint.',
+                })
+
+            if method == 'GET' and isinstance(data, list):
+                data, next_range = _paginate(
+                    data, request_headers.get('Range'),
+                )
+
+                if next_range:
+                    status = 206
+                    headers['Next-Range'] = next_range
+
+            if method == 'GET' and status == 200:
+                headers['ETag'] = '"%s"' % hashlib.md5(
+                    json.dumps(data, sort_keys=True).encode('utf-8')
+                ).hexdigest()
+
+                if request_headers.get('If-None-Match') == headers['ETag']:
+                    self.not_modified += 1
+                    return (304, headers, None)
+
+            return (status, headers, data)
+
+    def _app_data(self, app):
+        """Returns an app's API representation."""
+        return {
+            'created_at': _timestamp(app['created_at']),
+            'id': app['id'],
+            'name': app['name'],
+        }
+
+    def _not_found(self, name):
+        """Returns a 404 response for a missing resource."""
+        return (404, {
+            'id': 'not_found',
+            'message': 'Couldn\'t find that %s.' % name,
+        })
+
+    def _create_setup(self, data):
+        app_name = (data.get('app') or {}).get('name')
+
+        if app_name in self.apps:
+            return (422, {
+                'id': 'invalid_params',
+                'message': 'Name %s is already taken' % app_name,
+            })
+
+        if self.capacity is not None and len(self.apps) >= self.capacity:
+            return (422, {
+                'id': 'invalid_params',
+                'message': 'You\'ve reached the limit of %d apps.' % (
+                    self.capacity,
+                ),
+            })
+
+        now = time.time()
+
+        overrides = data.get('overrides') or {}
+
+        app = {
+            'config_vars': dict(overrides.get('env') or {}),
+            'created_at': now,
+            'id': str(uuid.uuid4()),
+            'name': app_name or 'fake-app-%d' % next(self._app_numbers),
+        }
+        self.apps[app['name']] = app
+        self.peak_apps = max(self.peak_apps, len(self.apps))
+
+        setup = {
+            'app_name': app['name'],
+            'created_at': now,
+            'duration': _sample(self.build_time),
+            'fails': self._random.random() < self.failure_rate,
+            'id': str(uuid.uuid4()),
+        }
+        self.setups[setup['id']] = setup
+
+        return (201, self._setup_data(setup, now))
+
+    def _setup_data(self, setup, now):
+        """Returns an app-setup's API representation at a point in time."""
+        created_at = setup['created_at']
+        elapsed = now - created_at
+        duration = setup['duration']
+        app = self.apps.get(setup['app_name'], {})
+
+        # Only changes move updated_at, so ETags last between them
+        updated_at = created_at
+
+        data = {
+            'app': {'id': app.get('id'), 'name': setup['app_name']},
+            'build': None,
+            'created_at': _timestamp(setup['created_at']),
+            'failure_message': None,
+            'id': setup['id'],
+            'status': 'pending',
+        }
+
+        if elapsed >= PROVISIONING_SHARE * duration:
+            build_done = elapsed >= BUILD_SHARE * duration
+            build_status = 'pending'
+            updated_at = created_at + PROVISIONING_SHARE * duration
+
+            if build_done:
+                build_status = 'failed' if setup['fails'] else 'succeeded'
+                updated_at = created_at + BUILD_SHARE * duration
+
+            data['build'] = {
+                'id': setup['id'],
+                'output_stream_url': None,
+                'status': build_status,
+            }
+
+        if elapsed >= duration:
+            updated_at = created_at + duration
+
+            if setup['fails']:
+                data['status'] = 'failed'
+                data['failure_message'] = 'Build failed.'
+            else:
+                data['status'] = 'succeeded'
+
+        data['updated_at'] = _timestamp(updated_at)
+
+        return data
+
+    def _get_setup(self, data, setup_id):
+        setup = self.setups.get(setup_id)
+
+        if setup is None:
+            return self._not_found('app setup')
+
+        return (200, self._setup_data(setup, time.time()))
+
+    def _create_build(self, data, app_name):
+        if app_name not in self.apps:
+            return self._not_found('app')
+
+        build = {
+            'app_name': app_name,
+            'created_at': time.time(),
+            'duration': _sample(self.build_time) * (
+                BUILD_SHARE - PROVISIONING_SHARE
+            ),
+            'fails': self._random.random() < self.failure_rate,
+            'id': str(uuid.uuid4()),
+        }
+        self.builds[build['id']] = build
+
+        return (201, self._build_data(build, build['created_at']))
+
+    def _build_data(self, build, now):
+        """Returns a build's API representation at a point in time."""
+        done = now - build['created_at'] >= build['duration']
+        status = 'pending'
+
+        if done:
+            status = 'failed' if build['fails'] else 'succeeded'
+
+        return {
+            'app': {'name': build['app_name']},
+            'created_at': _timestamp(build['created_at']),
+            'id': build['id'],
+            'output_stream_url': None,
+            'status': status,
+            'updated_at': _timestamp(
+                build['created_at'] + (build['duration'] if done else 0)
+            ),
+        }
+
+    def _get_build(self, data, app_name, build_id):
+        build = self.builds.get(build_id)
+
+        if build is None or build['app_name'] != app_name:
+            return self._not_found('build')
+
+        return (200, self._build_data(build, time.time()))
+
+    def _list_apps(self, data):
+        return (200, [
+            self._app_data(app)
+            for app in sorted(self.apps.values(),
+                              key=lambda app: app['name'])
+        ])
+
+    def _get_app(self, data, app_name):
+        app = self.apps.get(app_name)
+
+        if app is None:
+            return self._not_found('app')
+
+        return (200, self._app_data(app))
+
+    def _delete_app(self, data, app_name):
+        app = self.apps.pop(app_name, None)
+
+        if app is None:
+            return self._not_found('app')
+
+        return (200, self._app_data(app))
+
+    def _update_config(self, data, app_name):
+        app = self.apps.get(app_name)
+
+        if app is None:
+            return self._not_found('app')
+
+        for key, value in data.items():
+            if value is None:
+                app['config_vars'].pop(key, None)
+            else:
+                app['config_vars'][key] = value
+
+        return (200, dict(app['config_vars']))
+
+    def _create_source(self, data):
+        source_id = str(uuid.uuid4())
+        url = '%s/_sources/%s' % (self.url, source_id)
+
+        return (201, {
+            'source_blob': {'get_url': url, 'put_url': url},
+        })
+
+    def _upload_source(self, method, path, body):
+        """Stores an uploaded source tarball's size, like S3 would."""
+        source_id = path.split('/')[-1]
+
+        if method != 'PUT':
+            return (405, {}, None)
+
+        with self._lock:
+            self.sources[source_id] = len(body)
+
+        return (200, {}, None)
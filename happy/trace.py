@@ -0,0 +1,291 @@
+"""
+Recording spans of what happy does, for viewing on a timeline.
+"""
+import binascii
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from .profile import normalize_endpoint
+
+#: Formats traces can be written in
+FORMATS = ('chrome', 'otlp')
+
+
+def _random_id(size):
+    """Returns a random hex ID made of ``size`` bytes."""
+    return binascii.hexlify(os.urandom(size)).decode('ascii')
+
+
+def _otlp_value(value):
+    """Converts an attribute value to an OTLP ``AnyValue``."""
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    elif isinstance(value, int):
+        # 64 bit ints are strings in OTLP's JSON encoding
+        return {'intValue': str(value)}
+    elif isinstance(value, float):
+        return {'doubleValue': value}
+    else:
+        return {'stringValue': str(value)}
+
+
+class Span(object):
+    """A named, timed piece of work, possibly inside another span."""
+    def __init__(self, name, span_id, parent_id, start, attributes):
+        self.name = name
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.start = start
+        self.end = None
+        self.attributes = attributes
+        self.thread_id = threading.current_thread().ident
+        self.thread_name = threading.current_thread().name
+
+
+class Tracer(object):
+    """Records spans for a command, the apps it works on, and API calls.
+
+    Spans started in a thread nest inside the span that thread has open.
+    Spans started in a thread with nothing open, like a worker in a thread
+    pool, nest inside the first span started, usually the command's own.
+    """
+    def __init__(self):
+        self.trace_id = _random_id(16)
+        self.spans = []
+        self._root = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        """Returns the current thread's stack of open spans."""
+        stack = getattr(self._local, 'stack', None)
+
+        if stack is None:
+            stack = self._local.stack = []
+
+        return stack
+
+    def _parent_id(self):
+        """Returns the ID of the span a new span should nest in."""
+        stack = self._stack()
+
+        if stack:
+            return stack[-1].span_id
+        elif self._root is not None:
+            return self._root.span_id
+
+        return None
+
+    def start_span(self, name, **attributes):
+        """Starts a span in the current thread.
+
+        :param name: Name of the span.
+        :param attributes: Attributes describing the span. Any that are
+            ``None`` are left out.
+        :returns: The ``Span``, to be passed to :meth:`end_span`.
+        """
+        span = Span(
+            name=name,
+            span_id=_random_id(8),
+            parent_id=self._parent_id(),
+            start=time.time(),
+            attributes=dict(
+                (key, value) for key, value in attributes.items()
+                if value is not None
+            ),
+        )
+
+        with self._lock:
+            if self._root is None:
+                self._root = span
+
+        self._stack().append(span)
+
+        return span
+
+    def end_span(self, span):
+        """Ends a span started with :meth:`start_span`.
+
+        :param span: The ``Span`` to end.
+        """
+        span.end = time.time()
+
+        stack = self._stack()
+
+        if span in stack:
+            stack.remove(span)
+
+        with self._lock:
+            if self._root is span:
+                self._root = None
+
+            self.spans.append(span)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Records a span around a block of code.
+
+        An ``error`` attribute is added if the block raises.
+
+        :param name: Name of the span.
+        :param attributes: Attributes describing the span.
+        """
+        span = self.start_span(name, **attributes)
+
+        try:
+            yield span
+        except Exception as exc:
+            span.attributes['error'] = str(exc) or type(exc).__name__
+            raise
+        finally:
+            self.end_span(span)
+
+    def subscribe(self, hooks):
+        """Records a span for every API call fired on a set of ``Hooks``.
+
+        :param hooks: The ``Hooks`` to register with.
+        """
+        hooks.register('after_response', self._after_response)
+        hooks.register('on_error', self._on_error)
+
+    def _record_request(self, method, endpoint, attempt, start, latency,
+                        **attributes):
+        """Records a finished API call as a span."""
+        span = Span(
+            name='%s %s' % (method, normalize_endpoint(endpoint)),
+            span_id=_random_id(8),
+            parent_id=self._parent_id(),
+            start=start,
+            attributes=dict(
+                attributes,
+                method=method,
+                endpoint=endpoint,
+                attempt=attempt,
+            ),
+        )
+        span.end = start + latency
+
+        with self._lock:
+            self.spans.append(span)
+
+    def _after_response(self, method, endpoint, attempt, response, start,
+                        latency, **kwargs):
+        """Records an API call that got a response."""
+        self._record_request(
+            method, endpoint, attempt, start, latency,
+            status=response.status_code,
+        )
+
+    def _on_error(self, method, endpoint, attempt, exception, start,
+                  latency, **kwargs):
+        """Records an API call that failed without a response."""
+        self._record_request(
+            method, endpoint, attempt, start, latency,
+            error=str(exception) or type(exception).__name__,
+        )
+
+    def to_chrome(self):
+        """Returns the spans in Chrome's trace event format."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start)
+
+        pid = os.getpid()
+        events = []
+        threads = {}
+
+        for span in spans:
+            threads.setdefault(span.thread_id, span.thread_name)
+
+            args = dict(span.attributes, span_id=span.span_id)
+
+            if span.parent_id:
+                args['parent_id'] = span.parent_id
+
+            events.append({
+                'name': span.name,
+                'ph': 'X',
+                'ts': int(span.start * 1e6),
+                'dur': int((span.end - span.start) * 1e6),
+                'pid': pid,
+                'tid': span.thread_id,
+                'args': args,
+            })
+
+        for thread_id, thread_name in threads.items():
+            events.append({
+                'name': 'thread_name',
+                'ph': 'M',
+                'pid': pid,
+                'tid': thread_id,
+                'args': {'name': thread_name},
+            })
+
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def to_otlp(self):
+        """Returns the spans as OpenTelemetry OTLP/JSON."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start)
+
+        otlp_spans = []
+
+        for span in spans:
+            otlp_span = {
+                'traceId': self.trace_id,
+                'spanId': span.span_id,
+                'name': span.name,
+                # API calls are client spans, everything else is internal
+                'kind': 3 if 'method' in span.attributes else 1,
+                'startTimeUnixNano': str(int(span.start * 1e9)),
+                'endTimeUnixNano': str(int(span.end * 1e9)),
+                'attributes': [
+                    {'key': key, 'value': _otlp_value(value)}
+                    for key, value in sorted(span.attributes.items())
+                ],
+            }
+
+            if span.parent_id:
+                otlp_span['parentSpanId'] = span.parent_id
+
+            if 'error' in span.attributes:
+                otlp_span['status'] = {
+                    'code': 2,
+                    'message': str(span.attributes['error']),
+                }
+
+            otlp_spans.append(otlp_span)
+
+        return {
+            'resourceSpans': [{
+                'resource': {
+                    'attributes': [{
+                        'key': 'service.name',
+                        'value': {'stringValue': 'happy'},
+                    }],
+                },
+                'scopeSpans': [{
+                    'scope': {'name': 'happy'},
+                    'spans': otlp_spans,
+                }],
+            }],
+        }
+
+    def write(self, path, format='chrome'):
+        """Writes the spans recorded so far to a JSON file.
+
+        :param path: Path of the file.
+        :param format: (optional) One of :data:`FORMATS`.
+        :raises ValueError: If the format doesn't exist.
+        """
+        if format == 'chrome':
+            data = self.to_chrome()
+        elif format == 'otlp':
+            data = self.to_otlp()
+        else:
+            raise ValueError('Unknown trace format %r.' % format)
+
+        with open(path, 'w') as f:
+            json.dump(data, f)
@@ -0,0 +1,190 @@
+"""
+A single poller for lots of in-flight builds.
+"""
+import heapq
+import itertools
+import threading
+import time
+
+from concurrent.futures import Future
+
+from .heroku import BuildTimeout
+from .polling import Backoff
+
+
+class _Watch(object):
+    """A build being watched."""
+    def __init__(self, build_id, future, delays):
+        self.build_id = build_id
+        self.future = future
+        self.delays = delays
+        self.status = None
+
+
+class BuildWatcher(object):
+    """Polls many app-setup builds from one thread on a shared timetable.
+
+    Each build is polled on its own backoff schedule, but never more than
+    ``max_rate`` status checks per second go out in total, no matter how many
+    builds are being watched.
+    """
+    def __init__(self, check, max_rate=5.0):
+        """Initializes the class.
+
+        :param check: Called with a build's ID and the status it had last
+            time (``None`` the first time) to check on it. Returns a tuple
+            with ``(done, status)``, or raises ``BuildError`` if the build
+            failed, e.g. ``Happy._check_build``.
+        :param max_rate: (optional) Most status checks sent per second.
+        """
+        self._check = check
+        self._spacing = 1.0 / max_rate
+        self._queue = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def watch(self, build_id, timeout=None, policy=None, callback=None):
+        """Starts watching an app-setup build.
+
+        :param build_id: ID of the app-setup build to watch.
+        :param timeout: (optional) Seconds to wait before giving up.
+        :param policy: (optional) Polling policy, e.g. a ``Backoff``. If this
+            is given, ``timeout`` is ignored in favor of the policy's own.
+        :param callback: (optional) Called with the ``Future`` when the build
+            is done.
+        :returns: A ``Future`` that resolves to ``True`` when the build
+            succeeds, or raises ``BuildError`` or ``BuildTimeout``.
+        """
+        future = Future()
+
+        if callback is not None:
+            future.add_done_callback(callback)
+
+        watch = _Watch(
+            build_id=build_id,
+            future=future,
+            delays=(policy or Backoff(timeout=timeout)).delays(),
+        )
+
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('BuildWatcher is closed.')
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+            self._schedule(watch, time.time())
+
+        return future
+
+    def close(self):
+        """Stops polling and cancels every build still being watched."""
+        with self._condition:
+            self._closed = True
+            queue, self._queue = self._queue, []
+            self._condition.notify()
+
+        for due_, count_, watch in queue:
+            watch.future.cancel()
+
+    def _schedule(self, watch, due):
+        """Queues a build to be polled at a certain time.
+
+        This must be called while holding the condition's lock.
+        """
+        heapq.heappush(self._queue, (due, next(self._counter), watch))
+        self._condition.notify()
+
+    def _next_watch(self, not_before):
+        """Blocks until a build is due to be polled, and returns it."""
+        with self._condition:
+            while not self._closed:
+                if not self._queue:
+                    self._condition.wait()
+                    continue
+
+                delay = max(self._queue[0][0], not_before) - time.time()
+
+                if delay <= 0:
+                    return heapq.heappop(self._queue)[2]
+
+                self._condition.wait(delay)
+
+        return None
+
+    def _run(self):
+        """Polls builds as they come due until the watcher is closed."""
+        last_poll = 0
+
+        while True:
+            watch = self._next_watch(not_before=last_poll + self._spacing)
+
+            if watch is None:
+                return
+
+            if watch.future.done():
+                continue
+
+            last_poll = time.time()
+
+            try:
+                self._poll(watch)
+            except Exception as exc:
+                # Nothing is allowed to stop the thread, or every other build
+                # being watched would never resolve.
+                _resolve(watch.future, exception=exc)
+
+    def _poll(self, watch):
+        """Checks a build's status once, and resolves or reschedules it."""
+        try:
+            done, watch.status = self._check(watch.build_id, watch.status)
+        except Exception as exc:
+            _resolve(watch.future, exception=exc)
+            return
+
+        if done:
+            _resolve(watch.future, result=True)
+            return
+
+        delay = next(watch.delays, None)
+
+        if delay is None:
+            _resolve(watch.future, exception=BuildTimeout(
+                'Timed out waiting for build %s.' % watch.build_id
+            ))
+            return
+
+        with self._condition:
+            if self._closed:
+                watch.future.cancel()
+            else:
+                self._schedule(watch, time.time() + delay)
+
+
+def _resolve(future, result=None, exception=None):
+    """Sets a future's result or exception, unless it's already done.
+
+    A future can be cancelled by its owner while its build is being polled,
+    and setting a result on it then would raise.
+    """
+    if future.done():
+        return
+
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+    except Exception:
+        # Cancelled between checking and setting
+        pass
@@ -15,11 +15,12 @@ setup(
     long_description=readme,
     install_requires=[
         'click',
+        'futures; python_version < "3"',
         'requests'
     ],
     entry_points="""
         [console_scripts]
         happy=happy.cli:cli
     """,
-    packages=find_packages(exclude=['tests'])
+    packages=find_packages(exclude=['tests', 'benchmarks'])
 )
@@ -0,0 +1,11 @@
+"""
+Test configuration.
+"""
+import sys
+
+#: Test modules that can't even be compiled on this version of Python
+collect_ignore = []
+
+if sys.version_info < (3, 7):
+    # async/await, and asyncio.get_running_loop
+    collect_ignore.append('test_aio.py')
@@ -0,0 +1,133 @@
+"""
+Tests for the asyncio interfaces.
+"""
+import asyncio
+
+import mock
+import pytest
+
+from happy.aio import AsyncHappy, AsyncHeroku
+
+
+def run(coro):
+    """Runs a coroutine to completion on a fresh event loop."""
+    loop = asyncio.new_event_loop()
+
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+@pytest.fixture
+def api():
+    """Returns a mocked blocking Heroku client."""
+    return mock.MagicMock()
+
+
+def test_async_heroku_create_build(api):
+    """AsyncHeroku.create_build should call the blocking client."""
+    api.create_build.return_value = {'id': '12345'}
+    heroku = AsyncHeroku(api=api)
+
+    result = run(heroku.create_build('tarball-url', env={'A': 'b'}))
+
+    api.create_build.assert_called_with(
+        tarball_url='tarball-url',
+        env={'A': 'b'},
+        app_name=None,
+    )
+    assert result == {'id': '12345'}
+
+
+def test_async_heroku_check_build_status(api):
+    """AsyncHeroku.check_build_status should call the blocking client."""
+    api.check_build_status.return_value = True
+    heroku = AsyncHeroku(api=api)
+
+    assert run(heroku.check_build_status('123'))
+
+    api.check_build_status.assert_called_with('123')
+
+
+def test_async_heroku_delete_app(api):
+    """AsyncHeroku.delete_app should call the blocking client."""
+    heroku = AsyncHeroku(api=api)
+
+    run(heroku.delete_app('butt-man-123'))
+
+    api.delete_app.assert_called_with(app_name='butt-man-123')
+
+
+def test_async_heroku_close_shared_api(api):
+    """AsyncHeroku.close should leave a shared client open."""
+    heroku = AsyncHeroku(api=api)
+
+    run(heroku.close())
+
+    assert not api.close.called
+
+
+@mock.patch('happy.aio.Heroku')
+def test_async_heroku_close(heroku_cls):
+    """AsyncHeroku.close should close its own client."""
+    heroku = AsyncHeroku(auth_token='12345')
+
+    run(heroku.close())
+
+    heroku_cls.assert_called_with(auth_token='12345', pool_size=10)
+    assert heroku_cls().close.called
+
+
+def test_async_happy_create(api):
+    """AsyncHappy.create should return the build ID and app name."""
+    api.create_build.return_value = {
+        'id': '12345',
+        'app': {'name': 'butt-man-123'},
+    }
+    happy = AsyncHappy(api=AsyncHeroku(api=api))
+
+    assert run(happy.create('tarball-url')) == ('12345', 'butt-man-123')
+
+
+def test_async_happy_wait(api):
+    """AsyncHappy.wait should poll until the build is done."""
+    api.check_build_status.side_effect = (False, False, True)
+    happy = AsyncHappy(api=AsyncHeroku(api=api))
+
+    async def no_sleep(delay):
+        pass
+
+    with mock.patch('happy.aio.asyncio.sleep', no_sleep):
+        run(happy.wait('12345'))
+
+    assert api.check_build_status.call_count == 3
+
+
+def test_async_happy_many_at_once(api):
+    """AsyncHappy should drive many builds on one event loop."""
+    api.create_build.side_effect = lambda **kwargs: {
+        'id': kwargs['app_name'],
+        'app': {'name': kwargs['app_name']},
+    }
+    api.check_build_status.return_value = True
+    happy = AsyncHappy(api=AsyncHeroku(api=api))
+
+    async def up(name):
+        build_id, app_name = await happy.create('tarball', app_name=name)
+        await happy.wait(build_id)
+        return app_name
+
+    async def main():
+        return await asyncio.gather(*[up('app-%d' % i) for i in range(50)])
+
+    assert run(main()) == ['app-%d' % i for i in range(50)]
+
+
+def test_async_happy_delete(api):
+    """AsyncHappy.delete should delete the app."""
+    happy = AsyncHappy(api=AsyncHeroku(api=api))
+
+    run(happy.delete('butt-man-123'))
+
+    api.delete_app.assert_called_with(app_name='butt-man-123')
@@ -1,15 +1,20 @@
 """
 Tests for the cli commands.
 """
+import json
 import os
 import subprocess
+import sys
 
 import decorator
 import mock
 import pytest
 from click.testing import CliRunner
+from concurrent.futures import Future
 
 from happy.cli import cli
+from happy.heroku import BuildError, BuildTimeout
+from happy.state import State
 
 
 @pytest.fixture
@@ -58,6 +63,16 @@ def test_help(runner):
     assert 'Usage: happy' in result.output
 
 
+def test_startup_imports():
+    """Importing the CLI shouldn't import requests until an API call."""
+    output = subprocess.check_output([
+        sys.executable, '-c',
+        'import sys, happy.cli; print("requests" in sys.modules)',
+    ])
+
+    assert output.strip() == b'False'
+
+
 @isolated
 def test_up(runner, happy):
     """Running up should exit cleanly."""
@@ -89,6 +104,20 @@ def test_up_auth_token(runner, happy):
     assert kwargs['auth_token'] == '12345'
 
 
+@isolated
+def test_up_rate_limit_file(runner, happy):
+    """Running up should share the rate limit through --rate-limit-file."""
+    runner.invoke(cli, ['up', '--rate-limit-file=ratelimit'])
+
+    args_, kwargs = happy.call_args
+
+    assert kwargs['rate_limiter'] is not None
+
+    kwargs['rate_limiter'].acquire()
+
+    assert os.path.exists('ratelimit')
+
+
 @isolated
 def test_up_tarball_url(runner, happy):
     """Running up should pass the --tarball-url option to Happy.create."""
@@ -110,6 +139,38 @@ def test_up_tarball_url_app_json(runner, happy):
         'https://github.com/butt/man/tarball/master/'
 
 
+@isolated
+def test_up_source(runner, happy):
+    """Running up --source should upload the directory."""
+    os.mkdir('src')
+    happy().upload.return_value = 'uploaded-url'
+
+    result = runner.invoke(cli, ['up', '--source=src', '--no-source-cache'])
+
+    happy().upload.assert_called_with('src', cache=None)
+    args_, kwargs = happy().create.call_args
+
+    assert kwargs['tarball_url'] == 'uploaded-url'
+    assert result.output.startswith(
+        'Uploading source... done\nCreating app... '
+    )
+
+
+@isolated
+def test_up_source_cache(runner, happy):
+    """Running up --source should report the source cache's stats."""
+    os.mkdir('src')
+
+    result = runner.invoke(cli, [
+        'up', '--source=src', '--source-cache=cache.json',
+    ])
+
+    args_, kwargs = happy().upload.call_args
+
+    assert kwargs['cache'].path == 'cache.json'
+    assert 'Source cache: 0% hit rate, 0.0 B saved' in result.output
+
+
 @isolated
 def test_up_no_tarball_url(runner, happy):
     """Running up should fail if it can't infer the tarball URL."""
@@ -154,13 +215,17 @@ def test_up_env(runner, happy):
 
 @isolated
 def test_up_writes_app_name(runner, happy):
-    """Running up should write the app name to .happy."""
-    runner.invoke(cli, ['up'])
+    """Running up should record the app in .happy."""
+    runner.invoke(cli, ['up', '--tag=ci'])
 
-    with open('.happy') as f:
-        app_name = f.read()
+    record = State().get('butt-man-123')
 
-    assert app_name == 'butt-man-123'
+    assert record['build_id'] == '12345'
+    assert record['tarball_url'] == (
+        'https://github.com/butt/man/tarball/master/'
+    )
+    assert record['status'] == 'up'
+    assert record['tags'] == ['ci']
 
 
 @isolated
@@ -171,6 +236,246 @@ def test_up_waits_for_build(runner, happy):
     assert happy().wait.called
 
 
+@isolated
+def test_up_timeout(runner, happy):
+    """Running up --timeout should fail when the build takes too long."""
+    happy().wait.side_effect = BuildTimeout('too slow')
+
+    result = runner.invoke(cli, ['up', '--timeout=60'])
+
+    happy().wait.assert_called_with('12345', timeout=60)
+    assert result.exit_code == 1
+    assert 'timed out after 60 seconds' in result.output
+    assert not happy().delete.called
+    assert State().get('butt-man-123')['status'] == 'building'
+
+
+@isolated
+def test_up_records_build_before_waiting(runner, happy):
+    """Running up should record the build before waiting for it."""
+    records = []
+    happy().wait.side_effect = lambda build_id, timeout=None: records.append(
+        State().get('butt-man-123')
+    )
+
+    runner.invoke(cli, ['up'])
+
+    assert records[0]['build_id'] == '12345'
+    assert records[0]['status'] == 'building'
+    assert State().get('butt-man-123')['status'] == 'up'
+
+
+@isolated
+def test_up_build_failed(runner, happy):
+    """Running up should record a failed build."""
+    happy().wait.side_effect = BuildError('oops')
+
+    result = runner.invoke(cli, ['up'])
+
+    assert result.exit_code == 1
+    assert 'failed: oops' in result.output
+    assert State().get('butt-man-123')['status'] == 'failed'
+
+
+@isolated
+def test_up_resume(runner, happy):
+    """Running up --resume should wait for an unfinished build."""
+    State().add('old-app', build_id='678', status='building',
+                tarball_url='https://github.com/butt/man/tarball/master/')
+
+    result = runner.invoke(cli, ['up', '--resume'])
+
+    happy().wait.assert_called_with('678', timeout=None)
+    assert not happy().create.called
+    assert result.exit_code == 0
+    assert result.output == (
+        "Resuming app old-app\n"
+        "Building... done\n"
+        "It's up! :) https://old-app.herokuapp.com\n"
+    )
+    assert State().get('old-app')['status'] == 'up'
+
+
+@isolated
+def test_up_resume_nothing_unfinished(runner, happy):
+    """Running up --resume with no unfinished build should create an app."""
+    State().add('other-app', build_id='678', status='building',
+                tarball_url='other-tarball')
+
+    runner.invoke(cli, ['up', '--resume'])
+
+    assert happy().create.called
+    happy().wait.assert_called_with('12345', timeout=None)
+
+
+@isolated
+def test_up_reuse(runner, happy):
+    """Running up --reuse should rebuild an app that exists."""
+    State().add('review-app', tags=['pr'])
+    happy().app_exists.return_value = True
+    happy().rebuild.return_value = '456'
+    happy().wait.side_effect = BuildTimeout('too slow')
+
+    result = runner.invoke(cli, [
+        'up', '--reuse', '--env', 'A=b', '--timeout=60',
+        '--delete-on-timeout',
+    ])
+
+    happy().app_exists.assert_called_with('review-app')
+    happy().rebuild.assert_called_with(
+        'review-app', 'https://github.com/butt/man/tarball/master/',
+        env={'A': 'b'},
+    )
+    happy().wait.assert_called_with('456', timeout=60, app_name='review-app')
+    assert not happy().create.called
+    assert not happy().delete.called
+    assert result.exit_code == 1
+
+    record = State().get('review-app')
+
+    assert record['build_id'] == '456'
+    assert record['build_type'] == 'build'
+    assert record['status'] == 'building'
+    assert record['tags'] == ['pr']
+
+
+@isolated
+def test_up_reuse_missing_app(runner, happy):
+    """Running up --reuse should create the app if it doesn't exist."""
+    happy().app_exists.return_value = False
+
+    result = runner.invoke(cli, ['up', 'review-app', '--reuse'])
+
+    happy().app_exists.assert_called_with('review-app')
+    assert not happy().rebuild.called
+    assert 'No app to reuse.' in result.output
+    assert happy().create.call_args[1]['app_name'] == 'review-app'
+
+
+@isolated
+def test_wait_app_build(runner, happy):
+    """Running wait should wait for a recorded rebuild of an app."""
+    State().add('app-1', build_id='678', status='building',
+                build_type='build')
+
+    runner.invoke(cli, ['wait', 'app-1'])
+
+    happy().wait.assert_called_with('678', timeout=None, app_name='app-1')
+
+
+@isolated
+def test_wait(runner, happy):
+    """Running wait should wait for a recorded app's build."""
+    State().add('app-1', build_id='678', status='building')
+
+    result = runner.invoke(cli, ['wait', 'app-1', '--timeout=30'])
+
+    happy().wait.assert_called_with('678', timeout=30)
+    assert result.exit_code == 0
+    assert State().get('app-1')['status'] == 'up'
+
+
+@isolated
+def test_wait_list_cache(runner, happy):
+    """Running wait should drop the cached app list if it deletes an app."""
+    State().add('app-1', build_id='678', status='building')
+
+    runner.invoke(cli, ['wait', 'app-1', '--delete-on-timeout'],
+                  env={'HAPPY_LIST_CACHE': 'apps.json'})
+
+    args_, kwargs = happy.call_args
+    assert kwargs['list_cache'].path == 'apps.json'
+
+
+@isolated
+def test_wait_nothing_recorded(runner, happy):
+    """Running wait without a recorded build should fail."""
+    result = runner.invoke(cli, ['wait'])
+
+    assert result.exit_code == 1
+    assert result.output == 'No build recorded for any app.\n'
+    assert not happy().wait.called
+
+
+@isolated
+def test_up_delete_on_timeout(runner, happy):
+    """Running up --delete-on-timeout should bring a stuck app down."""
+    happy().wait.side_effect = BuildTimeout('too slow')
+
+    result = runner.invoke(cli, [
+        'up', '--timeout=60', '--delete-on-timeout',
+    ])
+
+    happy().delete.assert_called_with(app_name='butt-man-123')
+    assert result.exit_code == 1
+
+
+@isolated
+def test_up_stream(runner, happy):
+    """Running up --stream should print the build output."""
+    def stream(build_id, callback, timeout=None):
+        callback('-----> Building\n')
+        callback('-----> Done\n')
+
+    happy().stream.side_effect = stream
+
+    result = runner.invoke(cli, ['up', '--stream'])
+
+    assert not happy().wait.called
+    assert result.output == (
+        "Creating app... butt-man-123\n"
+        "Building...\n"
+        "-----> Building\n"
+        "-----> Done\n"
+        "done\n"
+        "It's up! :) https://butt-man-123.herokuapp.com\n"
+    )
+
+
+@isolated
+def test_up_profile(runner, happy):
+    """Running up --profile should print timings and save them as JSON."""
+    result = runner.invoke(cli, [
+        'up', '--profile', '--profile-json=profile.json',
+    ])
+
+    args_, kwargs = happy.call_args
+
+    assert kwargs['profiler'] is not None
+    assert result.exit_code == 0
+    assert 'Phase' in result.output
+    assert 'API call' in result.output
+
+    with open('profile.json') as f:
+        assert json.load(f)['phases'] == []
+
+
+@isolated
+def test_up_trace_file(runner, happy):
+    """Running up --trace-file should write a Chrome trace of the run."""
+    result = runner.invoke(cli, ['up', '--trace-file=trace.json'])
+
+    args_, kwargs = happy.call_args
+
+    assert kwargs['tracer'] is not None
+    assert result.exit_code == 0
+
+    with open('trace.json') as f:
+        events = json.load(f)['traceEvents']
+
+    assert events[0]['name'] == 'happy up'
+
+
+@isolated
+def test_up_metrics_file(runner, happy):
+    """Running up --metrics-file should collect and write metrics."""
+    result = runner.invoke(cli, ['up', '--metrics-file=happy.prom'])
+
+    assert result.exit_code == 0
+    assert happy().hooks.register.called
+    assert os.path.exists('happy.prom')
+
+
 @isolated
 def test_up_prints_info(runner, happy):
     """Running up should print status info."""
@@ -183,6 +488,126 @@ def test_up_prints_info(runner, happy):
     )
 
 
+def _future(result=None, exception=None):
+    """Returns a finished Future."""
+    future = Future()
+
+    if exception:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+
+    return future
+
+
+@isolated
+def test_up_count(runner, happy):
+    """Running up --count should create several apps at once."""
+    def create_many(**kwargs):
+        kwargs['on_status']('1', 'ci-1', 'building')
+        kwargs['on_status']('2', 'ci-2', 'building')
+        kwargs['on_status']('1', 'ci-1', 'up')
+        kwargs['on_status']('2', 'ci-2', 'up')
+        return [_future(('1', 'ci-1')), _future(('2', 'ci-2'))]
+
+    happy().create_many.side_effect = create_many
+
+    result = runner.invoke(cli, ['up', 'ci', '--count=2', '--concurrency=4'])
+
+    args_, kwargs = happy().create_many.call_args
+
+    assert result.exit_code == 0
+    assert kwargs['count'] == 2
+    assert kwargs['app_names'] == ['ci-1', 'ci-2']
+    assert kwargs['max_workers'] == 4
+    assert sorted(result.output.splitlines()) == [
+        "2 up, 0 failed.",
+        "Creating 2 apps...",
+        "It's up! :) https://ci-1.herokuapp.com",
+        "It's up! :) https://ci-2.herokuapp.com",
+    ]
+
+    assert State().get('ci-1')['status'] == 'up'
+    assert State().get('ci-2')['build_id'] == '2'
+
+
+@isolated
+def test_up_count_partial_failure(runner, happy):
+    """Running up --count should report failures without stopping."""
+    happy().create_many.return_value = [
+        _future(exception=Exception('oh no')),
+        _future(('2', 'butt-man-2')),
+    ]
+
+    result = runner.invoke(cli, ['up', '--count=2'])
+
+    assert result.exit_code == 1
+    assert 'App #1 failed: oh no' in result.output
+    assert "It's up! :) https://butt-man-2.herokuapp.com" in result.output
+    assert '1 up, 1 failed.' in result.output
+
+
+def _write_pool(status='ready'):
+    """Writes a pool state file with one app."""
+    with open('.happy-pool', 'w') as f:
+        f.write(json.dumps({'pool-app': {
+            'build_id': '123',
+            'created_at': 0,
+            'status': status,
+            'tarball_url': 'https://github.com/butt/man/tarball/master/',
+        }}))
+
+
+@isolated
+def test_up_from_pool(runner, happy):
+    """Running up --from-pool should claim a ready app."""
+    _write_pool()
+
+    result = runner.invoke(cli, ['up', '--from-pool', '--env', 'A=b'])
+
+    happy().configure.assert_called_with(app_name='pool-app', env={'A': 'b'})
+    assert not happy().create.called
+    assert result.output == (
+        "Claiming app from pool... pool-app\n"
+        "It's up! :) https://pool-app.herokuapp.com\n"
+    )
+
+    assert [record['name'] for record in State().apps()] == ['pool-app']
+
+
+@isolated
+def test_up_from_empty_pool(runner, happy):
+    """Running up --from-pool with nothing ready should create an app."""
+    _write_pool(status='claimed')
+
+    result = runner.invoke(cli, ['up', '--from-pool'])
+
+    assert result.exit_code == 0
+    assert 'Claiming app from pool... none ready' in result.output
+    assert happy().create.called
+
+
+@isolated
+def test_pool_fill(runner, happy):
+    """Running pool fill should fill the pool."""
+    happy().watch.return_value = _future(True)
+
+    result = runner.invoke(cli, ['pool', 'fill', '--size=1'])
+
+    assert result.exit_code == 0
+    assert result.output == 'Filling pool... 1 new, 1 ready\n'
+
+
+@isolated
+def test_pool_status(runner, happy):
+    """Running pool status should count the pool's apps."""
+    _write_pool()
+
+    result = runner.invoke(cli, ['pool', 'status'])
+
+    assert result.output == 'ready: 1\nbuilding: 0\nfailed: 0\n'
+
+
 @isolated
 def test_down(runner, happy):
     """Running down should delete the app."""
@@ -245,6 +670,25 @@ def test_down_deletes_app_name_file(runner, happy):
         open('.happy', 'r')
 
 
+@isolated
+def test_down_newest_only(runner, happy):
+    """Running down without app names should delete only the newest app."""
+    state = State()
+
+    with mock.patch('happy.state.time.time', return_value=100.0):
+        state.add('app-1')
+
+    with mock.patch('happy.state.time.time', return_value=200.0):
+        state.add('app-2')
+
+    result = runner.invoke(cli, ['down', '--force'])
+
+    happy().delete.assert_called_with(app_name='app-2')
+    assert not happy().delete_many.called
+    assert result.exit_code == 0
+    assert [record['name'] for record in state.apps()] == ['app-1']
+
+
 @isolated
 def test_down_no_app(runner, happy):
     """With no app to delete, down should fail."""
@@ -279,3 +723,197 @@ def test_down_prompts_yes(runner, happy):
     result = runner.invoke(cli, ['down', 'butt-man-123'], input='y\n')
 
     assert result.exit_code == 0
+
+
+@isolated
+def test_down_many(runner, happy):
+    """Running down with several apps should delete them all at once."""
+    happy().delete_many.return_value = [_future(), _future()]
+
+    result = runner.invoke(cli, [
+        'down', 'app-1', 'app-2', '--force', '--concurrency=3',
+    ])
+
+    happy().delete_many.assert_called_with(['app-1', 'app-2'], max_workers=3)
+    assert result.exit_code == 0
+    assert result.output == (
+        "Destroying 2 apps...\n"
+        "app-1... done\n"
+        "app-2... done\n"
+        "2 down, 0 failed.\n"
+    )
+
+
+@isolated
+def test_down_many_partial_failure(runner, happy):
+    """Running down should report failures and keep the failed app names."""
+    with open('.happy', 'w') as f:
+        f.write('app-1\napp-2')
+
+    happy().delete_many.return_value = [
+        _future(exception=Exception('nope')),
+        _future(),
+    ]
+
+    result = runner.invoke(cli, ['down', '--all', '--force'])
+
+    assert result.exit_code == 1
+    assert 'app-1... failed: nope' in result.output
+    assert '1 down, 1 failed.' in result.output
+    assert [record['name'] for record in State().apps()] == ['app-1']
+
+
+@isolated
+def test_down_trace_file(runner, happy):
+    """Running down --trace-format=otlp should write OTLP/JSON spans."""
+    happy().delete_many.return_value = [_future()]
+
+    runner.invoke(cli, [
+        'down', 'app-1', '--force', '--trace-file=trace.json',
+        '--trace-format=otlp',
+    ])
+
+    with open('trace.json') as f:
+        data = json.load(f)
+
+    spans = data['resourceSpans'][0]['scopeSpans'][0]['spans']
+
+    assert spans[0]['name'] == 'happy down'
+
+
+@isolated
+def test_down_glob(runner, happy):
+    """Running down with a glob should delete the matching apps."""
+    happy().find_apps.return_value = ['ci-1', 'ci-2']
+    happy().delete_many.return_value = [_future(), _future()]
+
+    result = runner.invoke(cli, ['down', 'ci-*', '--force'])
+
+    happy().find_apps.assert_called_with('ci-*')
+    args_, kwargs = happy().delete_many.call_args
+
+    assert args_[0] == ['ci-1', 'ci-2']
+    assert result.exit_code == 0
+
+
+@isolated
+def test_down_all_prompts(runner, happy):
+    """Running down --all should ask about every app."""
+    with open('.happy', 'w') as f:
+        f.write('app-1\napp-2')
+
+    result = runner.invoke(cli, ['down', '--all'], input='n\n')
+
+    assert 'delete app-1, app-2?' in result.output
+    assert result.exit_code == 1
+    assert not happy().delete_many.called
+
+
+@isolated
+def test_down_tag(runner, happy):
+    """Running down --tag should only bring down apps with the tag."""
+    state = State()
+    state.add('app-1', tags=['ci'])
+    state.add('app-2')
+
+    result = runner.invoke(cli, ['down', '--tag=ci', '--force'])
+
+    happy().delete.assert_called_with(app_name='app-1')
+    assert result.exit_code == 0
+    assert [record['name'] for record in state.apps()] == ['app-2']
+
+
+@isolated
+def test_gc(runner, happy):
+    """Running gc should bring down expired apps."""
+    State().add('app-1')
+    happy().find_expired_apps.return_value = [
+        ('ci-1', 2 * 24 * 60 * 60), ('app-1', 7 * 60 * 60),
+    ]
+    happy().delete_many.return_value = [_future(), _future()]
+
+    result = runner.invoke(cli, [
+        'gc', '--older-than=6h', '--prefix=ci-', '--concurrency=2',
+    ])
+
+    happy().find_expired_apps.assert_called_with(
+        6 * 60 * 60, prefixes=('ci-',), app_names=['app-1'],
+    )
+    happy().delete_many.assert_called_with(['ci-1', 'app-1'], max_workers=2)
+    assert result.exit_code == 0
+    assert result.output == (
+        "2 expired apps:\n"
+        "ci-1 (2.0d old)\n"
+        "app-1 (7h old)\n"
+        "Destroying 2 apps...\n"
+        "ci-1... done\n"
+        "app-1... done\n"
+        "2 down, 0 failed.\n"
+    )
+    assert State().apps() == []
+
+
+@isolated
+def test_gc_dry_run(runner, happy):
+    """Running gc --dry-run should only list expired apps."""
+    happy().find_expired_apps.return_value = [('ci-1', 90)]
+
+    result = runner.invoke(cli, ['gc', '--older-than=1m', '--dry-run'])
+
+    assert not happy().delete_many.called
+    assert result.output == "1 expired apps:\nci-1 (2m old)\n"
+
+
+@isolated
+def test_gc_bad_duration(runner, happy):
+    """Running gc with a bad --older-than should fail."""
+    result = runner.invoke(cli, ['gc', '--older-than=soon'])
+
+    assert result.exit_code == 2
+    assert not happy().find_expired_apps.called
+
+
+@isolated
+def test_gc_empty_prefix(runner, happy):
+    """Running gc with an empty --prefix shouldn't match every app."""
+    result = runner.invoke(cli, ['gc', '--older-than=6h', '--prefix', ''])
+
+    assert result.exit_code == 2
+    assert "Prefixes can't be empty." in result.output
+    assert not happy().find_expired_apps.called
+
+
+@isolated
+def test_ls(runner, happy):
+    """Running ls should list apps matching the patterns and ages."""
+    happy().iter_apps.return_value = iter([
+        {'name': 'ci-new', 'created_at': '2001-09-09T01:40:00Z'},
+        {'name': 'ci-old', 'created_at': '2001-09-09T00:40:00Z'},
+        {'name': 'pr-old', 'created_at': '2001-09-08T00:00:00Z'},
+        {'name': 'prod', 'created_at': '2001-09-01T00:00:00Z'},
+    ])
+
+    with mock.patch('happy.cli.time.time', return_value=1000000000):
+        result = runner.invoke(cli, [
+            'ls', 'ci-*', 'pr-*', '--older-than=1h', '--newer-than=2d', '-l',
+            '--cache-file=apps.json',
+        ])
+
+    args_, kwargs = happy().iter_apps.call_args
+
+    assert kwargs['cache'].path == 'apps.json'
+    assert result.exit_code == 0
+    assert result.output == 'ci-old\t1h\npr-old\t1.1d\n'
+
+
+@isolated
+def test_ls_no_cache(runner, happy):
+    """Running ls --cache-ttl=0 should always list apps from the API."""
+    happy().iter_apps.return_value = iter([
+        {'name': 'app-1', 'created_at': '2001-09-09T01:40:00Z'},
+    ])
+
+    result = runner.invoke(cli, ['ls', '--cache-ttl=0'])
+
+    happy().iter_apps.assert_called_with(cache=None)
+    assert result.output == 'app-1\n'
@@ -5,6 +5,10 @@ import mock
 import pytest
 
 from happy import Happy
+from happy.heroku import APIError, BuildTimeout
+from happy.hooks import Hooks
+from happy.profile import Profiler
+from happy.trace import Tracer
 
 
 @pytest.fixture
@@ -35,6 +39,80 @@ def test_auth_token(heroku):
     assert kwargs['auth_token'] == '12345'
 
 
+def test_shared_api(heroku):
+    """Happy should use a Heroku client that's passed in."""
+    api = mock.MagicMock()
+    happy = Happy(api=api)
+
+    happy.create('example.com')
+
+    assert api.create_build.called
+    assert not heroku.called
+
+
+def test_close(heroku):
+    """Happy.close should close its own Heroku client."""
+    with Happy():
+        pass
+
+    assert heroku().close.called
+
+
+def test_close_shared_api(heroku):
+    """Happy.close should leave a shared Heroku client open."""
+    api = mock.Mock()
+
+    with Happy(api=api):
+        pass
+
+    assert not api.close.called
+
+
+def test_upload(heroku, happy, tmpdir):
+    """Should upload a directory and return its tarball URL."""
+    tmpdir.join('app.json').write('{}')
+    heroku().create_source.return_value = {
+        'get_url': 'get-url',
+        'put_url': 'put-url',
+    }
+
+    assert happy.upload(str(tmpdir)) == 'get-url'
+
+    args, kwargs_ = heroku().upload_source.call_args
+
+    assert args[0] == 'put-url'
+    assert args[1].paths == ['app.json']
+
+
+def test_upload_cached(heroku, happy, tmpdir):
+    """Should skip packaging and uploading when the source is cached."""
+    tmpdir.join('app.json').write('{}')
+    cache = mock.Mock()
+    cache.get.return_value = 'cached-url'
+
+    assert happy.upload(str(tmpdir), cache=cache) == 'cached-url'
+    assert not heroku().create_source.called
+    assert not heroku().upload_source.called
+
+
+def test_upload_caches(heroku, happy, tmpdir):
+    """Should record fresh uploads in the cache."""
+    tmpdir.join('app.json').write('{}')
+    heroku().create_source.return_value = {
+        'get_url': 'get-url',
+        'put_url': 'put-url',
+    }
+    cache = mock.Mock()
+    cache.get.return_value = None
+
+    happy.upload(str(tmpdir), cache=cache)
+
+    digest, url = cache.put.call_args[0]
+
+    assert url == 'get-url'
+    assert cache.put.call_args[1]['size'] > 0
+
+
 def test_create(heroku, happy):
     """Should create an app build on Heroku."""
     happy.create(tarball_url='tarball-url')
@@ -85,16 +163,413 @@ def test_create_returns_app_name(heroku, happy):
 
 def test_wait(heroku, happy):
     """Should wait for the build to complete."""
-    heroku().check_build_status.side_effect = (False, False, True)
+    heroku().build_status.side_effect = (False, False, True)
 
     with mock.patch('happy.sleep'):  # Ain't nobody got time etc.
         happy.wait('12345')
 
-    heroku().check_build_status.assert_has_calls([
+    assert heroku().get_build.call_args_list == [
         mock.call('12345'),
         mock.call('12345'),
         mock.call('12345'),
-    ])
+    ]
+
+
+def test_wait_app_build(heroku, happy):
+    """Should poll a rebuilt app's build, reporting it as building."""
+    heroku().get_app_build.side_effect = [
+        {'status': 'pending'},
+        {'status': 'succeeded'},
+    ]
+    heroku().build_status.side_effect = (False, True)
+    statuses = []
+    happy.hooks.register(
+        'build_status_change',
+        lambda status, **kwargs: statuses.append(status),
+    )
+
+    with mock.patch('happy.sleep'):
+        happy.wait('456', app_name='butt-man-123')
+
+    heroku().get_app_build.assert_called_with('butt-man-123', '456')
+    assert not heroku().get_build.called
+    assert statuses == ['build', 'succeeded']
+
+
+def test_rebuild(heroku, happy):
+    """Should set config vars, then build on the existing app."""
+    heroku().create_app_build.return_value = {'id': '456'}
+
+    build_id = happy.rebuild('butt-man-123', 'tarball-url', env={'A': 'b'})
+
+    heroku().update_config.assert_called_with(
+        app_name='butt-man-123', env={'A': 'b'},
+    )
+    heroku().create_app_build.assert_called_with(
+        app_name='butt-man-123', tarball_url='tarball-url',
+    )
+    assert build_id == '456'
+
+
+def test_app_exists(heroku, happy):
+    """Should tell whether an app exists, and raise on other errors."""
+    assert happy.app_exists('butt-man-123')
+
+    heroku().get_app.side_effect = APIError('Not found.', 404)
+
+    assert not happy.app_exists('butt-man-123')
+
+    heroku().get_app.side_effect = APIError('Oh no.', 500)
+
+    with pytest.raises(APIError):
+        happy.app_exists('butt-man-123')
+
+
+def test_wait_backs_off(heroku, happy):
+    """Should poll quickly at first, then back off."""
+    heroku().build_status.side_effect = (False, False, False, True)
+
+    with mock.patch('happy.sleep') as sleep:
+        happy.wait('12345')
+
+    delays = [args[0] for args, kwargs_ in sleep.call_args_list]
+
+    assert delays[0] < 1
+    assert delays[0] < delays[1] < delays[2]
+
+
+def test_wait_timeout(heroku, happy):
+    """Should raise BuildTimeout when the policy gives up."""
+    heroku().build_status.return_value = False
+    policy = mock.Mock()
+    policy.delays.return_value = iter([1, 2])
+
+    with mock.patch('happy.sleep') as sleep:
+        with pytest.raises(BuildTimeout):
+            happy.wait('12345', policy=policy)
+
+    assert heroku().get_build.call_count == 3
+    sleep.assert_has_calls([mock.call(1), mock.call(2)])
+
+
+def test_stream(heroku, happy):
+    """Should pass build output along and poll only around the stream."""
+    heroku().get_build.side_effect = [
+        {'status': 'pending', 'build': None},
+        {'status': 'pending', 'build': {'output_stream_url': 'stream-url'}},
+        {'status': 'succeeded'},
+    ]
+    heroku().build_status.side_effect = (False, False, True)
+    heroku().stream_build_output.return_value = iter(['a', 'b'])
+    chunks = []
+
+    with mock.patch('happy.sleep') as sleep:
+        happy.stream('12345', callback=chunks.append)
+
+    assert chunks == ['a', 'b']
+    heroku().stream_build_output.assert_called_with(
+        'stream-url', timeout=None,
+    )
+    assert sleep.call_count == 1
+    assert heroku().get_build.call_count == 3
+
+
+def test_stream_timeout(heroku, happy):
+    """Should only follow the output for what's left of the timeout."""
+    heroku().get_build.side_effect = [
+        {'status': 'pending', 'build': {'output_stream_url': 'stream-url'}},
+        {'status': 'succeeded'},
+    ]
+    heroku().build_status.side_effect = (False, True)
+    heroku().stream_build_output.return_value = iter([])
+
+    happy.stream('12345', callback=None, timeout=60)
+
+    args_, kwargs = heroku().stream_build_output.call_args
+    assert 0 < kwargs['timeout'] <= 60
+
+
+def test_stream_timeout_after_output(heroku, happy):
+    """Time spent streaming should count against the timeout."""
+    heroku().get_build.return_value = {
+        'status': 'pending',
+        'build': {'output_stream_url': 'stream-url'},
+    }
+    heroku().build_status.return_value = False
+    now = [1000.0]
+
+    def sleep(seconds):
+        now[0] += seconds
+
+    def stream_build_output(url, timeout=None):
+        sleep(0.95)
+        return iter([])
+
+    heroku().stream_build_output.side_effect = stream_build_output
+
+    with mock.patch('happy.time.time', lambda: now[0]), \
+            mock.patch('happy.polling.time.time', lambda: now[0]), \
+            mock.patch('happy.sleep', sleep):
+        with pytest.raises(BuildTimeout):
+            happy.stream('12345', callback=None, timeout=1.0)
+
+    assert now[0] <= 1001.0
+
+
+def test_stream_already_done(heroku, happy):
+    """Should return right away if the build is already done."""
+    heroku().get_build.return_value = {'status': 'succeeded'}
+    heroku().build_status.return_value = True
+
+    happy.stream('12345', callback=None)
+
+    assert not heroku().stream_build_output.called
+
+
+def test_profiler_phases(heroku):
+    """Should record create and build phases with a profiler."""
+    profiler = Profiler()
+    happy = Happy(profiler=profiler)
+    heroku().get_build.side_effect = [
+        {'status': 'pending', 'build': None},
+        {'status': 'pending', 'build': {'status': 'pending'}},
+        {'status': 'pending', 'build': {'status': 'succeeded'}},
+        {'status': 'succeeded'},
+    ]
+    heroku().build_status.side_effect = (False, False, False, True)
+
+    happy.create(tarball_url='example.com')
+
+    with mock.patch('happy.sleep'):
+        happy.wait('12345')
+
+    assert [phase['name'] for phase in profiler.phases] == [
+        'create', 'provisioning', 'build', 'postdeploy',
+    ]
+
+
+def test_build_status_change(heroku, happy):
+    """Should fire build_status_change when a build's phase changes."""
+    handler = mock.Mock()
+    happy.hooks.register('build_status_change', handler)
+    heroku().get_build.side_effect = [
+        {'status': 'pending', 'build': None},
+        {'status': 'pending', 'build': None},
+        {'status': 'pending', 'build': {'status': 'pending'}},
+        {'status': 'succeeded'},
+    ]
+    heroku().build_status.side_effect = (False, False, False, True)
+
+    with mock.patch('happy.sleep'):
+        happy.wait('12345')
+
+    assert [
+        (kwargs['previous'], kwargs['status'])
+        for args_, kwargs in handler.call_args_list
+    ] == [
+        (None, 'provisioning'),
+        ('provisioning', 'build'),
+        ('build', 'succeeded'),
+    ]
+    assert handler.call_args[1]['build_id'] == '12345'
+
+
+def test_shared_hooks(heroku):
+    """Should fire request events on the same hooks as build events."""
+    hooks = Hooks()
+    happy = Happy(hooks=hooks)
+
+    args_, kwargs = heroku.call_args
+
+    assert happy.hooks is hooks
+    assert kwargs['hooks'] is hooks
+
+
+def test_watch(heroku, happy):
+    """Should wait for builds in the background from one shared watcher."""
+    heroku().build_status.return_value = True
+
+    futures = [happy.watch('1'), happy.watch('2')]
+
+    assert all(future.result(timeout=5) for future in futures)
+    assert happy.watcher is happy.watcher
+
+
+def test_close_watcher(heroku, happy):
+    """Happy.close should stop the watcher."""
+    watcher = happy.watcher
+
+    happy.close()
+
+    with pytest.raises(RuntimeError):
+        watcher.watch('123')
+
+
+def test_create_many(heroku, happy):
+    """Should create and wait for several apps at once."""
+    heroku().create_build.side_effect = lambda **kwargs: {
+        'id': 'build-%s' % kwargs['app_name'],
+        'app': {'name': kwargs['app_name']},
+    }
+    heroku().build_status.return_value = True
+
+    futures = happy.create_many(
+        tarball_url='tarball-url',
+        count=3,
+        app_names=['a', 'b', 'c'],
+        max_workers=2,
+    )
+
+    assert [future.result() for future in futures] == [
+        ('build-a', 'a'),
+        ('build-b', 'b'),
+        ('build-c', 'c'),
+    ]
+    assert heroku().build_status.call_count == 3
+
+
+def test_create_many_build_status_change(heroku, happy):
+    """Builds watched in the background should fire build_status_change."""
+    handler = mock.Mock()
+    happy.hooks.register('build_status_change', handler)
+    heroku().create_build.return_value = {'id': '1', 'app': {'name': 'a'}}
+    heroku().get_build.return_value = {'status': 'succeeded'}
+    heroku().build_status.return_value = True
+
+    futures = happy.create_many(tarball_url='tarball-url', count=1)
+    futures[0].result(timeout=5)
+
+    heroku().get_build.assert_called_with('1')
+    handler.assert_called_once_with(
+        build_id='1',
+        status='succeeded',
+        previous=None,
+        data={'status': 'succeeded'},
+    )
+
+
+def test_create_many_envs(heroku, happy):
+    """Should merge per-app env overrides over the shared ones."""
+    heroku().build_status.return_value = True
+
+    futures = happy.create_many(
+        tarball_url='tarball-url',
+        count=2,
+        env={'SHARED': 'yes', 'INDEX': '?'},
+        envs=[{'INDEX': '0'}, {'INDEX': '1'}],
+    )
+    [future.result() for future in futures]
+
+    envs = sorted(
+        kwargs['env']['INDEX']
+        for args_, kwargs in heroku().create_build.call_args_list
+    )
+
+    assert envs == ['0', '1']
+    assert all(
+        kwargs['env']['SHARED'] == 'yes'
+        for args_, kwargs in heroku().create_build.call_args_list
+    )
+
+
+def test_create_many_partial_failure(heroku, happy):
+    """One failed app shouldn't stop the others."""
+    def create_build(**kwargs):
+        if kwargs['app_name'] == 'bad':
+            raise ValueError('nope')
+        return {'id': '1', 'app': {'name': kwargs['app_name']}}
+
+    heroku().create_build.side_effect = create_build
+    heroku().build_status.return_value = True
+
+    good, bad = happy.create_many(
+        tarball_url='tarball-url',
+        count=2,
+        app_names=['good', 'bad'],
+    )
+
+    assert good.result() == ('1', 'good')
+    with pytest.raises(ValueError):
+        bad.result()
+
+
+def test_create_many_delete_on_timeout(heroku, happy):
+    """Should delete apps whose builds time out, if asked."""
+    heroku().create_build.return_value = {'id': '1', 'app': {'name': 'a'}}
+    heroku().build_status.return_value = False
+
+    futures = happy.create_many(
+        tarball_url='tarball-url',
+        count=1,
+        timeout=0,
+        delete_on_timeout=True,
+    )
+
+    with pytest.raises(BuildTimeout):
+        futures[0].result()
+
+    heroku().delete_app.assert_called_with(app_name='a')
+
+
+def test_create_many_on_status(heroku, happy):
+    """Should report each app as soon as it's created, and when it's done."""
+    heroku().create_build.return_value = {'id': '1', 'app': {'name': 'a'}}
+    heroku().build_status.return_value = False
+    on_status = mock.Mock()
+
+    futures = happy.create_many(
+        tarball_url='tarball-url',
+        count=1,
+        timeout=0,
+        delete_on_timeout=True,
+        on_status=on_status,
+    )
+
+    with pytest.raises(BuildTimeout):
+        futures[0].result()
+
+    assert on_status.call_args_list == [
+        mock.call('1', 'a', 'building'),
+        mock.call('1', 'a', 'deleted'),
+    ]
+
+
+def test_create_many_traced(heroku):
+    """Should trace a span for each app with its create and wait inside."""
+    tracer = Tracer()
+    happy = Happy(tracer=tracer)
+    heroku().create_build.return_value = {
+        'id': '12345',
+        'app': {'name': 'butt-man-123'},
+    }
+    heroku().build_status.return_value = True
+
+    with tracer.span('command'):
+        for future in happy.create_many('example.com', count=2):
+            future.result()
+
+    happy.close()
+
+    spans = dict((span.span_id, span) for span in tracer.spans)
+    apps = [span for span in tracer.spans if span.name == 'app']
+
+    assert len(apps) == 2
+    assert apps[0].attributes['app'] == 'butt-man-123'
+    assert spans[apps[0].parent_id].name == 'command'
+    assert sorted(
+        span.name for span in tracer.spans
+        if span.parent_id == apps[0].span_id
+    ) == ['create', 'wait']
+
+
+def test_configure(heroku, happy):
+    """Should update the app's config vars."""
+    happy.configure(app_name='butt-man-123', env={'HELLO': 'world'})
+
+    heroku().update_config.assert_called_with(
+        app_name='butt-man-123',
+        env={'HELLO': 'world'},
+    )
 
 
 def test_delete(heroku, happy):
@@ -102,3 +577,107 @@ def test_delete(heroku, happy):
     happy.delete(app_name='butt-man-123')
 
     heroku().delete_app.assert_called_with(app_name='butt-man-123')
+
+
+def test_delete_many(heroku, happy):
+    """Should delete several apps at once."""
+    futures = happy.delete_many(['a', 'b', 'c'], max_workers=2)
+
+    [future.result() for future in futures]
+
+    heroku().delete_app.assert_has_calls([
+        mock.call(app_name='a'),
+        mock.call(app_name='b'),
+        mock.call(app_name='c'),
+    ], any_order=True)
+
+
+def test_find_apps(heroku, happy):
+    """Should return the names of apps matching a glob."""
+    heroku().iter_apps.return_value = iter([
+        {'name': 'ci-1'},
+        {'name': 'prod'},
+        {'name': 'ci-2'},
+    ])
+
+    assert happy.find_apps('ci-*') == ['ci-1', 'ci-2']
+
+
+@mock.patch('happy.time.time', return_value=1000000000)
+def test_find_expired_apps(time_, heroku, happy):
+    """Should return old apps with a prefix or a given name, oldest first."""
+    heroku().iter_apps.return_value = iter([
+        {'name': 'ci-new', 'created_at': '2001-09-09T01:40:00Z'},
+        {'name': 'ci-old', 'created_at': '2001-09-09T00:40:00Z'},
+        {'name': 'ci-older', 'created_at': '2001-09-08T00:00:00Z'},
+        {'name': 'prod', 'created_at': '2001-09-01T00:00:00Z'},
+        {'name': 'recorded', 'created_at': '2001-09-09T00:00:00Z'},
+    ])
+
+    expired = happy.find_expired_apps(
+        3600, prefixes=['ci-'], app_names=['recorded'],
+    )
+
+    assert [app_name for app_name, age_ in expired] == [
+        'ci-older', 'recorded', 'ci-old',
+    ]
+    assert expired[-1] == ('ci-old', 4000)
+
+
+def test_find_expired_apps_empty_prefix(heroku, happy):
+    """Should refuse an empty prefix, which would match every app."""
+    with pytest.raises(ValueError):
+        happy.find_expired_apps(3600, prefixes=['ci-', ''])
+
+    assert not heroku().iter_apps.called
+
+
+def test_iter_apps_cache(heroku, happy):
+    """Should save the list of apps once it's read, and then reuse it."""
+    heroku().account_key = 'account'
+    heroku().iter_apps.side_effect = lambda: iter([
+        {'name': 'a', 'created_at': '2001-09-09T01:40:00Z', 'id': '1'},
+    ])
+    cache = mock.Mock()
+    cache.get.return_value = None
+
+    assert [app['id'] for app in happy.iter_apps(cache=cache)] == ['1']
+
+    cache.put.assert_called_with('account', [
+        {'name': 'a', 'created_at': '2001-09-09T01:40:00Z'},
+    ])
+
+    cache.get.return_value = [{'name': 'b'}]
+
+    assert list(happy.iter_apps(cache=cache)) == [{'name': 'b'}]
+    assert heroku().iter_apps.call_count == 1
+
+
+def test_create_delete_forget_app_list(heroku):
+    """Creating or deleting an app should drop the cached list of apps."""
+    heroku().account_key = 'account'
+    heroku().create_build.return_value = {'id': '1', 'app': {'name': 'a'}}
+    list_cache = mock.Mock()
+    happy = Happy(list_cache=list_cache)
+
+    happy.create(tarball_url='tarball-url')
+    happy.delete(app_name='a')
+
+    assert list_cache.invalidate.call_args_list == [
+        mock.call('account'),
+        mock.call('account'),
+    ]
+
+
+def test_iter_apps_cache_partial(heroku, happy):
+    """Shouldn't save a list of apps that wasn't all read."""
+    heroku().iter_apps.return_value = iter([
+        {'name': 'a', 'created_at': '2001-09-09T01:40:00Z'},
+        {'name': 'b', 'created_at': '2001-09-09T01:40:00Z'},
+    ])
+    cache = mock.Mock()
+    cache.get.return_value = None
+
+    next(happy.iter_apps(cache=cache))
+
+    assert not cache.put.called
@@ -4,8 +4,12 @@ Tests for Heroku API interaction.
 import json
 import mock
 import pytest
+from requests import exceptions
 
-from happy.heroku import Heroku, APIError, BuildError
+from happy.heroku import (
+    Heroku, APIError, BuildError, BuildTimeout, RateLimitError,
+)
+from happy.profile import Profiler
 
 
 def test_heroku():
@@ -37,6 +41,34 @@ def test_heroku_api_request(session):
     )
 
 
+def test_heroku_account_key():
+    """Heroku.account_key should tell accounts apart without the token."""
+    key = Heroku(auth_token='12345').account_key
+
+    assert key == Heroku(auth_token='12345').account_key
+    assert key != Heroku(auth_token='67890').account_key
+    assert key != Heroku(auth_token='12345', api_root='http://x').account_key
+    assert '12345' not in key
+
+
+@mock.patch('happy.heroku.Session')
+def test_heroku_api_root(session):
+    """Heroku.api_request should send requests to the API root."""
+    heroku = Heroku(api_root='http://localhost:5000/')
+
+    heroku.api_request('GET', '/apps')
+
+    args, kwargs_ = session().request.call_args
+
+    assert args == ('GET', 'http://localhost:5000/apps')
+
+
+@mock.patch.dict('os.environ', {'HAPPY_API_ROOT': 'http://localhost:5001'})
+def test_heroku_api_root_environment():
+    """Heroku should take its API root from HAPPY_API_ROOT."""
+    assert Heroku().api_root == 'http://localhost:5001'
+
+
 @mock.patch('happy.heroku.Session')
 def test_heroku_api_request_headers(session):
     """Heroku.api_request should attach common headers to the session."""
@@ -51,6 +83,21 @@ def test_heroku_api_request_headers(session):
     }
 
 
+@mock.patch('happy.heroku.get_netrc_auth')
+@mock.patch('happy.heroku.Session')
+def test_heroku_netrc_auth(session, get_netrc_auth):
+    """Heroku should read netrc auth once, not on every request."""
+    get_netrc_auth.return_value = ('me@example.com', 'token')
+    session().request.return_value = _response(200)
+    heroku = Heroku()
+
+    for index_ in range(5):
+        heroku.api_request('GET', '/test')
+
+    get_netrc_auth.assert_called_once_with('https://api.heroku.com')
+    assert session().auth == ('me@example.com', 'token')
+
+
 @mock.patch('happy.heroku.Session')
 def test_heroku_api_request_auth_token(session):
     """Heroku.api_request should send its auth token."""
@@ -101,6 +148,301 @@ def test_heroku_api_request_big_fail(session):
     assert 'not JSON at all' in str(exc.value)
 
 
+@mock.patch('happy.heroku.Session')
+def test_heroku_api_request_reuses_session(session):
+    """Heroku.api_request should reuse one session across requests."""
+    heroku = Heroku()
+
+    heroku.api_request('GET', '/test')
+    heroku.api_request('GET', '/test')
+
+    assert session.call_count == 1
+    assert session().request.call_count == 2
+
+
+@mock.patch('happy.heroku.HTTPAdapter')
+@mock.patch('happy.heroku.Session')
+def test_heroku_pool_size(session, adapter):
+    """Heroku should mount a connection pool of the given size."""
+    heroku = Heroku(pool_size=42)
+
+    heroku.api_request('GET', '/test')
+
+    args_, kwargs = adapter.call_args
+
+    assert kwargs['pool_maxsize'] == 42
+    session().mount.assert_any_call('https://', adapter())
+
+
+@mock.patch('happy.heroku.Session')
+def test_heroku_close(session):
+    """Heroku.close should close the session and make a new one later."""
+    heroku = Heroku()
+
+    heroku.api_request('GET', '/test')
+    heroku.close()
+
+    assert session.return_value.close.called
+
+    heroku.api_request('GET', '/test')
+
+    assert session.call_count == 2
+
+
+@mock.patch('happy.heroku.Session')
+def test_heroku_context_manager(session):
+    """Heroku should close its session when used as a context manager."""
+    with Heroku() as heroku:
+        heroku.api_request('GET', '/test')
+
+    assert session().close.called
+
+
+@mock.patch('happy.heroku.Session')
+def test_heroku_api_request_rate_limiter(session):
+    """Heroku.api_request should wait on and update its rate limiter."""
+    limiter = mock.Mock()
+    heroku = Heroku(rate_limiter=limiter)
+    session().request.return_value.headers = {'RateLimit-Remaining': '123'}
+
+    heroku.api_request('GET', '/test')
+
+    assert limiter.acquire.called
+    limiter.update.assert_called_with(123)
+    assert heroku.rate_limit_remaining == 123
+
+
+@mock.patch('happy.heroku.sleep')
+@mock.patch('happy.heroku.Session')
+def test_heroku_api_request_rate_limited(session, sleep):
+    """Heroku.api_request should raise RateLimitError on 429s."""
+    heroku = Heroku()
+
+    bad_response = mock.Mock(ok=False, status_code=429, headers={})
+    bad_response.json.return_value = {'message': 'Slow down'}
+    session().request.return_value = bad_response
+
+    with pytest.raises(RateLimitError):
+        heroku.api_request('GET', '/test')
+
+
+def _response(status_code, headers=None):
+    """Returns a fake response."""
+    response = mock.Mock(
+        ok=status_code < 400,
+        status_code=status_code,
+        headers=headers or {},
+    )
+    response.json.return_value = {'message': 'status %d' % status_code}
+
+    return response
+
+
+@mock.patch('happy.heroku.sleep')
+@mock.patch('happy.heroku.Session')
+def test_heroku_api_request_retries(session, sleep):
+    """Heroku.api_request should retry idempotent requests on 5xx."""
+    heroku = Heroku()
+    session().request.side_effect = [
+        _response(503),
+        _response(502),
+        _response(200),
+    ]
+
+    assert heroku.api_request('GET', '/test') == {'message': 'status 200'}
+    assert sleep.call_count == 2
+
+
+@mock.patch('happy.heroku.sleep')
+@mock.patch('happy.heroku.Session')
+def test_heroku_api_request_profiler(session, sleep):
+    """Heroku.api_request should record every attempt with a profiler."""
+    profiler = Profiler()
+    heroku = Heroku(profiler=profiler)
+    responses = [_response(503), _response(200)]
+    responses[0].content = b''
+    responses[1].content = b'12345'
+    session().request.side_effect = responses
+
+    heroku.api_request('GET', '/apps/test')
+
+    assert [
+        (request['method'], request['endpoint'], request['status'],
+         request['bytes'])
+        for request in profiler.requests
+    ] == [('GET', '/apps/test', 503, 0), ('GET', '/apps/test', 200, 5)]
+
+
+@mock.patch('happy.heroku.sleep')
+@mock.patch('happy.heroku.Session')
+def test_heroku_api_request_hooks(session, sleep):
+    """Heroku.api_request should fire hooks around every attempt."""
+    heroku = Heroku()
+    events = []
+
+    for event in ('before_request', 'after_response', 'on_error'):
+        heroku.hooks.register(
+            event,
+            lambda event=event, **kwargs: events.append(
+                (event, kwargs['attempt'])
+            ),
+        )
+
+    session().request.side_effect = [
+        exceptions.ConnectionError('reset'),
+        _response(200),
+    ]
+
+    heroku.api_request('GET', '/test')
+
+    assert events == [
+        ('before_request', 0),
+        ('on_error', 0),
+        ('before_request', 1),
+        ('after_response', 1),
+    ]
+
+
+@mock.patch('happy.heroku.Session')
+def test_heroku_api_request_hook_data(session):
+    """Heroku.api_request should parse the response once, for hooks too."""
+    heroku = Heroku()
+    handler = mock.Mock()
+    heroku.hooks.register('after_response', handler)
+    session().request.return_value = response = _response(200)
+    response.json.return_value = {'status': 'pending'}
+
+    assert heroku.api_request('GET', '/test') == {'status': 'pending'}
+    assert handler.call_args[1]['data'] == {'status': 'pending'}
+    assert response.json.call_count == 1
+
+
+@mock.patch('happy.heroku.Session')
+def test_heroku_api_request_etag(session):
+    """Heroku.api_request should reuse cached GET responses on 304s."""
+    heroku = Heroku()
+    first = _response(200, headers={'ETag': '"abc"'})
+    first.json.return_value = {'status': 'pending'}
+    session().request.side_effect = [first, _response(304)]
+
+    assert heroku.api_request('GET', '/app-setups/1') == {'status': 'pending'}
+    assert heroku.api_request('GET', '/app-setups/1') == {'status': 'pending'}
+
+    args_, kwargs = session().request.call_args
+
+    assert kwargs['headers'] == {'If-None-Match': '"abc"'}
+
+
+@mock.patch('happy.heroku.Session')
+def test_heroku_api_request_etag_eviction(session):
+    """Heroku.api_request should evict the least recently used responses."""
+    heroku = Heroku(cache_size=1)
+    session().request.side_effect = [
+        _response(200, headers={'ETag': '"1"'}),
+        _response(200, headers={'ETag': '"2"'}),
+        _response(200, headers={'ETag': '"1"'}),
+    ]
+
+    heroku.api_request('GET', '/apps/one')
+    heroku.api_request('GET', '/apps/two')
+    heroku.api_request('GET', '/apps/one')
+
+    args_, kwargs = session().request.call_args
+
+    assert 'headers' not in kwargs
+
+
+@mock.patch('happy.heroku.Session')
+def test_heroku_api_request_etag_disabled(session):
+    """Heroku.api_request shouldn't cache anything with a cache size of 0."""
+    heroku = Heroku(cache_size=0)
+    session().request.return_value = _response(200, headers={'ETag': '"1"'})
+
+    heroku.api_request('GET', '/apps/one')
+    heroku.api_request('GET', '/apps/one')
+
+    args_, kwargs = session().request.call_args
+
+    assert 'headers' not in kwargs
+
+
+@mock.patch('happy.heroku.sleep')
+@mock.patch('happy.heroku.Session')
+def test_heroku_api_request_retries_give_up(session, sleep):
+    """Heroku.api_request should give up after so many retries."""
+    heroku = Heroku(retries=2)
+    session().request.return_value = _response(500)
+
+    with pytest.raises(APIError):
+        heroku.api_request('DELETE', '/apps/test')
+
+    assert session().request.call_count == 3
+
+
+@mock.patch('happy.heroku.sleep')
+@mock.patch('happy.heroku.Session')
+def test_heroku_api_request_retries_connection_errors(session, sleep):
+    """Heroku.api_request should retry idempotent requests after resets."""
+    heroku = Heroku()
+    session().request.side_effect = [
+        exceptions.ConnectionError('reset'),
+        _response(200),
+    ]
+
+    heroku.api_request('GET', '/test')
+
+    assert session().request.call_count == 2
+
+
+@mock.patch('happy.heroku.sleep')
+@mock.patch('happy.heroku.Session')
+def test_heroku_api_request_no_post_retries(session, sleep):
+    """Heroku.api_request shouldn't blindly retry POSTs."""
+    heroku = Heroku()
+    session().request.side_effect = [
+        exceptions.ConnectionError('reset'),
+        _response(200),
+    ]
+
+    with pytest.raises(exceptions.ConnectionError):
+        heroku.api_request('POST', '/app-setups')
+
+    session().request.side_effect = [_response(503), _response(200)]
+
+    with pytest.raises(APIError):
+        heroku.api_request('POST', '/app-setups')
+
+    assert not sleep.called
+
+
+@mock.patch('happy.heroku.sleep')
+@mock.patch('happy.heroku.Session')
+def test_heroku_api_request_retries_rate_limited_post(session, sleep):
+    """Heroku.api_request should retry POSTs that were rate limited."""
+    heroku = Heroku()
+    session().request.side_effect = [
+        _response(429, {'Retry-After': '7'}),
+        _response(201),
+    ]
+
+    heroku.api_request('POST', '/app-setups')
+
+    sleep.assert_called_with(7.0)
+
+
+@mock.patch('happy.heroku.sleep')
+@mock.patch('happy.heroku.Session')
+def test_heroku_api_request_retry_timeout(session, sleep):
+    """Heroku.api_request should stop retrying after the retry timeout."""
+    heroku = Heroku(retry_timeout=10)
+    session().request.return_value = _response(503, {'Retry-After': '30'})
+
+    with pytest.raises(APIError):
+        heroku.api_request('GET', '/test')
+
+    assert not sleep.called
+
+
 @mock.patch.object(Heroku, 'api_request')
 def test_heroku_create_build(api_request):
     """Heroku.create_build should send a POST to /app-setups."""
@@ -202,7 +544,108 @@ def test_heroku_check_build_status_failed(api_request):
     with pytest.raises(BuildError) as exc:
         heroku.check_build_status('123')
 
-    assert str(result) in str(exc.value)
+    assert str(exc.value) == 'Build failed: oops'
+
+
+@mock.patch.object(Heroku, 'api_request')
+def test_heroku_get_build(api_request):
+    """Heroku.get_build should GET /app-setups/:id."""
+    api_request.return_value = {'status': 'pending'}
+    heroku = Heroku()
+
+    assert heroku.get_build('123') == {'status': 'pending'}
+
+    api_request.assert_called_with('GET', '/app-setups/123')
+
+
+@mock.patch.object(Heroku, 'api_request')
+def test_heroku_create_app_build(api_request):
+    """Heroku.create_app_build should POST to /apps/:app/builds."""
+    heroku = Heroku()
+
+    heroku.create_app_build('butt-man-123', 'tarball-url')
+
+    api_request.assert_called_with(
+        'POST',
+        '/apps/butt-man-123/builds',
+        data={'source_blob': {'url': 'tarball-url'}},
+    )
+
+
+@mock.patch.object(Heroku, 'api_request')
+def test_heroku_get_app_build(api_request):
+    """Heroku.get_app_build should GET /apps/:app/builds/:id."""
+    heroku = Heroku()
+
+    heroku.get_app_build('butt-man-123', '456')
+
+    api_request.assert_called_with('GET', '/apps/butt-man-123/builds/456')
+
+
+@mock.patch('happy.heroku.Session')
+def test_heroku_api_request_error_status(session):
+    """Heroku.api_request's errors should have the response's status."""
+    session().request.return_value = _response(404)
+
+    with pytest.raises(APIError) as exc:
+        Heroku().get_app('nope')
+
+    assert exc.value.status_code == 404
+    assert str(exc.value) == 'status 404'
+
+
+@mock.patch('happy.heroku.Session')
+def test_heroku_stream_build_output(session):
+    """Heroku.stream_build_output should yield text as it arrives."""
+    heroku = Heroku(auth_token='12345')
+    snowman = u'\u2603'.encode('utf-8')
+    session().get.return_value.iter_content.return_value = [
+        b'Building ',
+        snowman[:1],
+        snowman[1:] + b'\n',
+    ]
+
+    chunks = list(heroku.stream_build_output('stream-url'))
+
+    assert u''.join(chunks) == u'Building \u2603\n'
+    args_, kwargs = session().get.call_args
+    assert kwargs['stream'] is True
+    assert kwargs['headers']['Authorization'] is None
+    assert kwargs['timeout'] is None
+    assert session().get.return_value.close.called
+
+
+@mock.patch('happy.heroku.Session')
+def test_heroku_stream_build_output_deadline(session):
+    """Heroku.stream_build_output should stop once its timeout is up."""
+    heroku = Heroku(auth_token='12345')
+    session().get.return_value.iter_content.return_value = [b'a', b'b']
+    chunks = []
+
+    with mock.patch('happy.heroku.time.time', side_effect=[0, 5, 11]):
+        with pytest.raises(BuildTimeout):
+            for chunk in heroku.stream_build_output('stream-url', timeout=10):
+                chunks.append(chunk)
+
+    assert chunks == ['a', 'b']
+    assert session().get.call_args[1]['timeout'] == 10
+    assert session().get.return_value.close.called
+
+
+@mock.patch('happy.heroku.Session')
+def test_heroku_stream_build_output_read_timeout(session):
+    """Heroku.stream_build_output should time out on a quiet stream."""
+    heroku = Heroku(auth_token='12345')
+
+    def iter_content(chunk_size):
+        yield b'a'
+        raise exceptions.ConnectionError('Read timed out.')
+
+    session().get.return_value.iter_content.side_effect = iter_content
+
+    with mock.patch('happy.heroku.time.time', side_effect=[0, 1, 10, 10]):
+        with pytest.raises(BuildTimeout):
+            list(heroku.stream_build_output('stream-url', timeout=10))
 
 
 @mock.patch.object(Heroku, 'api_request')
@@ -216,3 +659,99 @@ def test_heroku_delete_app(api_request):
         'DELETE',
         '/apps/butt-man-123',
     )
+
+
+@mock.patch.object(Heroku, 'api_request')
+def test_heroku_create_source(api_request):
+    """Heroku.create_source should POST to /sources."""
+    api_request.return_value = {'source_blob': {
+        'get_url': 'get-url',
+        'put_url': 'put-url',
+    }}
+    heroku = Heroku()
+
+    source = heroku.create_source()
+
+    api_request.assert_called_with('POST', '/sources')
+    assert source == {'get_url': 'get-url', 'put_url': 'put-url'}
+
+
+@mock.patch('happy.heroku.Session')
+def test_heroku_upload_source(session):
+    """Heroku.upload_source should PUT the tarball without API headers."""
+    heroku = Heroku(auth_token='12345')
+
+    heroku.upload_source('put-url', b'tarball')
+
+    session().put.assert_called_with('put-url', data=b'tarball', headers={
+        'Accept': None,
+        'Authorization': None,
+        'Content-type': None,
+    })
+
+
+@mock.patch('happy.heroku.Session')
+def test_heroku_upload_source_fail(session):
+    """Heroku.upload_source should raise APIError on failures."""
+    heroku = Heroku()
+    session().put.return_value = mock.Mock(ok=False, content='Denied')
+
+    with pytest.raises(APIError) as exc:
+        heroku.upload_source('put-url', b'tarball')
+
+    assert 'Denied' in str(exc.value)
+
+
+@mock.patch.object(Heroku, 'api_request')
+def test_heroku_update_config(api_request):
+    """Heroku.update_config should PATCH the app's config vars."""
+    heroku = Heroku()
+
+    heroku.update_config(app_name='butt-man-123', env={'HELLO': 'world'})
+
+    api_request.assert_called_with(
+        'PATCH',
+        '/apps/butt-man-123/config-vars',
+        data={'HELLO': 'world'},
+    )
+
+
+@mock.patch('happy.heroku.Session')
+def test_heroku_list_apps(session):
+    """Heroku.list_apps should list the account's apps."""
+    response = _response(200)
+    response.json.return_value = [{'name': 'butt-man-123'}]
+    session().request.return_value = response
+    heroku = Heroku()
+
+    assert heroku.list_apps() == [{'name': 'butt-man-123'}]
+
+    session().request.assert_called_with(
+        'GET', 'https://api.heroku.com/apps', data=None,
+        headers={'Range': 'name ..; max=1000'},
+    )
+
+
+@mock.patch('happy.heroku.Session')
+def test_heroku_iter_apps_pages(session):
+    """Heroku.iter_apps should follow Next-Range one page at a time."""
+    first = _response(206, headers={'Next-Range': 'name ]b..; max=2'})
+    first.json.return_value = [{'name': 'a'}, {'name': 'b'}]
+    last = _response(200, headers={'ETag': '"1"'})
+    last.json.return_value = [{'name': 'c'}]
+    session().request.side_effect = [first, last]
+    heroku = Heroku()
+
+    apps = heroku.iter_apps(page_size=2)
+
+    assert next(apps) == {'name': 'a'}
+    assert session().request.call_count == 1
+    assert [app['name'] for app in apps] == ['b', 'c']
+
+    ranges = [
+        kwargs['headers']['Range']
+        for args_, kwargs in session().request.call_args_list
+    ]
+
+    assert ranges == ['name ..; max=2', 'name ]b..; max=2']
+    assert not heroku._cache
@@ -0,0 +1,49 @@
+"""
+Tests for hooks.
+"""
+import mock
+import pytest
+
+from happy.hooks import Hooks
+
+
+def test_fire():
+    """Hooks.fire should call every handler with the event's arguments."""
+    hooks = Hooks()
+    first = mock.Mock()
+    second = mock.Mock()
+
+    hooks.register('before_request', first)
+    hooks.register('before_request', second)
+    hooks.fire('before_request', method='GET', endpoint='/apps', attempt=0)
+
+    first.assert_called_with(method='GET', endpoint='/apps', attempt=0)
+    second.assert_called_with(method='GET', endpoint='/apps', attempt=0)
+
+
+def test_fire_no_handlers():
+    """Hooks.fire should do nothing when nobody's registered."""
+    hooks = Hooks()
+
+    hooks.fire('before_request', method='GET', endpoint='/apps', attempt=0)
+
+
+def test_unregister():
+    """Hooks.unregister should stop a handler from being called."""
+    hooks = Hooks()
+    handler = mock.Mock()
+
+    hooks.register('on_error', handler)
+    hooks.unregister('on_error', handler)
+    hooks.unregister('on_error', handler)
+    hooks.fire('on_error', exception=None)
+
+    assert not handler.called
+
+
+def test_register_unknown_event():
+    """Hooks.register should refuse events that don't exist."""
+    hooks = Hooks()
+
+    with pytest.raises(ValueError):
+        hooks.register('before_butt', mock.Mock())
@@ -0,0 +1,53 @@
+"""
+Tests for the local copy of the account's list of apps.
+"""
+import mock
+import pytest
+
+from happy.listing import AppListCache
+
+
+@pytest.fixture
+def cache(tmpdir):
+    """Returns an app list cache in a temporary directory."""
+    return AppListCache(str(tmpdir.join('cache', 'apps.json')), ttl=30)
+
+
+def test_get_put(cache):
+    """AppListCache should return a saved list for its account only."""
+    assert cache.get('account') is None
+
+    cache.put('account', [{'name': 'app-1'}])
+
+    assert cache.get('account') == [{'name': 'app-1'}]
+    assert cache.get('other-account') is None
+
+
+def test_expiry(cache):
+    """AppListCache should forget lists after their TTL."""
+    with mock.patch('happy.listing.time.time', return_value=100):
+        cache.put('old', [])
+
+    with mock.patch('happy.listing.time.time', return_value=120):
+        cache.put('new', [])
+        assert cache.get('old') == []
+
+    with mock.patch('happy.listing.time.time', return_value=130):
+        assert cache.get('old') is None
+        assert cache.get('new') == []
+
+        cache.put('newer', [])
+
+    assert sorted(cache._load()) == ['new', 'newer']
+
+
+def test_invalidate(cache):
+    """AppListCache.invalidate should drop one account's list."""
+    cache.invalidate('account')
+
+    cache.put('account', [])
+    cache.put('other-account', [])
+    cache.invalidate('account')
+
+    assert cache.get('account') is None
+    assert cache.get('other-account') == []
@@ -0,0 +1,62 @@
+"""
+Tests for file locking.
+"""
+import json
+import threading
+
+import mock
+import pytest
+
+from happy.locking import JSONFile
+
+
+@pytest.fixture
+def json_file(tmpdir):
+    """Returns a JSON file in a temporary directory."""
+    return JSONFile(str(tmpdir.join('data.json')))
+
+
+def test_edit(json_file):
+    """JSONFile.edit should save changes, even if an error is raised."""
+    assert json_file.read() == {}
+
+    with json_file.edit() as data:
+        data['a'] = 1
+
+    with pytest.raises(ValueError):
+        with json_file.edit() as data:
+            data['b'] = 2
+            raise ValueError('oops')
+
+    assert json_file.read() == {'a': 1, 'b': 2}
+
+
+def test_edit_failed_save(json_file):
+    """A save that fails partway should leave the old contents."""
+    with json_file.edit() as data:
+        data['a'] = 1
+
+    with mock.patch('happy.locking.json.dumps', side_effect=MemoryError):
+        with pytest.raises(MemoryError):
+            with json_file.edit() as data:
+                data['a'] = 2
+
+    with open(json_file.path) as f:
+        assert json.load(f) == {'a': 1}
+
+
+def test_concurrent_edits(json_file):
+    """Edits from several threads at once should all be saved."""
+    def increment():
+        with json_file.edit() as data:
+            data['count'] = data.get('count', 0) + 1
+
+    threads = [threading.Thread(target=increment) for index_ in range(20)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert json_file.read() == {'count': 20}
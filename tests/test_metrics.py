@@ -0,0 +1,138 @@
+"""
+Tests for Prometheus metrics.
+"""
+import mock
+from requests import exceptions
+
+from happy.hooks import Hooks
+from happy.metrics import Metrics
+
+
+def _response(status_code, data=None):
+    """Returns a fake response."""
+    response = mock.Mock(status_code=status_code)
+    response.json.return_value = data or {}
+
+    return response
+
+
+def _fire(hooks, method, endpoint, response, latency=0.2):
+    """Fires after_response for a fake API call."""
+    hooks.fire(
+        'after_response',
+        method=method,
+        endpoint=endpoint,
+        attempt=0,
+        response=response,
+        data=response.json() if response.status_code < 400 else None,
+        start=0,
+        latency=latency,
+    )
+
+
+def _read(path):
+    """Returns a textfile's lines."""
+    with open(path) as f:
+        return f.read().splitlines()
+
+
+def test_api_requests(tmpdir):
+    """Metrics should count API calls by endpoint and time them."""
+    path = str(tmpdir.join('happy.prom'))
+    hooks = Hooks()
+    metrics = Metrics()
+    metrics.subscribe(hooks)
+
+    _fire(hooks, 'DELETE', '/apps/butt-man-123', _response(200))
+    _fire(hooks, 'DELETE', '/apps/butt-man-456', _response(200), 3)
+    _fire(hooks, 'DELETE', '/apps/butt-man-789', _response(404))
+
+    metrics.write(path)
+
+    lines = _read(path)
+
+    assert '# TYPE happy_api_requests_total counter' in lines
+    assert 'happy_api_requests_total{endpoint="/apps/:app",method="DELETE",' \
+        'status="200"} 2' in lines
+    assert 'happy_api_errors_total{endpoint="/apps/:app",method="DELETE",' \
+        'reason="404"} 1' in lines
+    assert 'happy_apps_deleted_total 2' in lines
+    assert 'happy_api_request_duration_seconds_bucket{endpoint="/apps/:app",' \
+        'method="DELETE",le="0.25"} 2' in lines
+    assert 'happy_api_request_duration_seconds_bucket{endpoint="/apps/:app",' \
+        'method="DELETE",le="+Inf"} 3' in lines
+    assert 'happy_api_request_duration_seconds_count{endpoint="/apps/:app",' \
+        'method="DELETE"} 3' in lines
+
+
+def test_connection_errors(tmpdir):
+    """Metrics should count calls that failed without a response."""
+    path = str(tmpdir.join('happy.prom'))
+    hooks = Hooks()
+    metrics = Metrics()
+    metrics.subscribe(hooks)
+
+    hooks.fire(
+        'on_error',
+        method='GET',
+        endpoint='/app-setups/123',
+        attempt=0,
+        exception=exceptions.ConnectionError('reset'),
+        start=0,
+        latency=1,
+    )
+
+    metrics.write(path)
+
+    assert 'happy_api_errors_total{endpoint="/app-setups/:id",method="GET",' \
+        'reason="ConnectionError"} 1' in _read(path)
+
+
+def test_builds(tmpdir):
+    """Metrics should count finished builds once, with their duration."""
+    path = str(tmpdir.join('happy.prom'))
+    hooks = Hooks()
+    metrics = Metrics()
+    metrics.subscribe(hooks)
+
+    _fire(hooks, 'POST', '/app-setups', _response(201))
+    _fire(hooks, 'GET', '/app-setups/123', _response(200, {
+        'id': '123',
+        'status': 'pending',
+    }))
+
+    for index_ in range(2):
+        _fire(hooks, 'GET', '/app-setups/123', _response(200, {
+            'id': '123',
+            'status': 'succeeded',
+            'created_at': '2017-01-01T00:00:00Z',
+            'updated_at': '2017-01-01T00:01:30Z',
+        }))
+
+    metrics.write(path)
+
+    lines = _read(path)
+
+    assert 'happy_apps_created_total 1' in lines
+    assert 'happy_builds_total{status="succeeded"} 1' in lines
+    assert 'happy_build_duration_seconds_sum{status="succeeded"} 90' in lines
+    assert 'happy_build_duration_seconds_bucket{status="succeeded",' \
+        'le="60"} 0' in lines
+    assert 'happy_build_duration_seconds_bucket{status="succeeded",' \
+        'le="120"} 1' in lines
+
+
+def test_write_adds_up(tmpdir):
+    """Metrics.write should add to what earlier runs wrote."""
+    path = str(tmpdir.join('happy.prom'))
+
+    for index_ in range(2):
+        metrics = Metrics()
+        metrics.inc('happy_apps_created_total', 3)
+        metrics.write(path)
+
+    # Writing again shouldn't count anything twice
+    metrics.write(path)
+
+    assert 'happy_apps_created_total 6' in _read(path)
+    assert not [name for name in tmpdir.listdir() if name.ext == '.tmp']
@@ -0,0 +1,48 @@
+"""
+Tests for polling strategies.
+"""
+import itertools
+
+import mock
+
+from happy.polling import Backoff
+
+
+def test_backoff_grows():
+    """Backoff should wait longer and longer, up to the maximum."""
+    backoff = Backoff(initial=1, maximum=4, factor=2, jitter=0)
+
+    delays = list(itertools.islice(backoff.delays(), 5))
+
+    assert delays == [1, 2, 4, 4, 4]
+
+
+def test_backoff_jitter():
+    """Backoff should randomly stretch or shrink each wait."""
+    backoff = Backoff(initial=10, maximum=10, jitter=0.5)
+
+    delays = list(itertools.islice(backoff.delays(), 100))
+
+    assert all(5 <= delay <= 15 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+@mock.patch('happy.polling.time')
+def test_backoff_timeout(time):
+    """Backoff should stop once the timeout is used up."""
+    time.time.side_effect = [100, 100, 108, 110]
+    backoff = Backoff(initial=3, maximum=3, jitter=0, timeout=10)
+
+    assert list(backoff.delays()) == [3, 2]
+
+
+@mock.patch('happy.polling.time')
+def test_backoff_timeout_starts_on_call(time):
+    """Backoff's timeout should count from when delays() is called."""
+    time.time.return_value = 100
+    backoff = Backoff(initial=3, maximum=3, jitter=0, timeout=10)
+
+    delays = backoff.delays()
+    time.time.return_value = 108
+
+    assert list(itertools.islice(delays, 2)) == [2, 2]
@@ -0,0 +1,170 @@
+"""
+Tests for the warm pool of apps.
+"""
+import fcntl
+import json
+
+import mock
+import pytest
+from concurrent.futures import Future
+
+from happy.heroku import APIError, BuildError
+from happy.pool import Pool
+
+
+def _future(exception=None):
+    """Returns a finished Future."""
+    future = Future()
+
+    if exception:
+        future.set_exception(exception)
+    else:
+        future.set_result(True)
+
+    return future
+
+
+@pytest.fixture
+def happy():
+    """Returns a mocked Happy instance that makes numbered apps."""
+    happy = mock.Mock()
+    names = iter('app-%d' % index for index in range(100))
+
+    def create(**kwargs):
+        app_name = next(names)
+        return ('build-%s' % app_name, app_name)
+
+    happy.create.side_effect = create
+    happy.watch.side_effect = lambda build_id, timeout=None: _future()
+
+    return happy
+
+
+@pytest.fixture
+def state_file(tmpdir):
+    """Returns the path of a pool state file."""
+    return str(tmpdir.join('pool'))
+
+
+def test_refill(happy, state_file):
+    """Pool.refill should create apps until the pool is full."""
+    pool = Pool(happy, 'tarball', size=2, env={'A': 'b'},
+                state_file=state_file)
+
+    assert sorted(pool.refill()) == ['app-0', 'app-1']
+    assert sorted(pool.apps('ready')) == ['app-0', 'app-1']
+    happy.create.assert_called_with(tarball_url='tarball', env={'A': 'b'})
+
+    assert pool.refill() == []
+    assert happy.create.call_count == 2
+
+
+def test_refill_unlocked_while_creating(happy, state_file):
+    """Pool.refill shouldn't lock the state file while creating apps."""
+    pool = Pool(happy, 'tarball', size=2, state_file=state_file)
+    building = []
+
+    def create(**kwargs):
+        with open(state_file + '.lock', 'a+') as f:
+            # Raises if another file has the lock
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        building.append(pool.apps('building'))
+        app_name = 'app-%d' % len(building)
+
+        return ('build-%s' % app_name, app_name)
+
+    happy.create.side_effect = create
+
+    assert sorted(pool.refill()) == ['app-1', 'app-2']
+    assert building == [[], ['app-1']]
+
+
+def test_refill_waits_on_building_apps(happy, state_file):
+    """Pool.refill should wait on apps left building by another refill."""
+    with open(state_file, 'w') as f:
+        json.dump({'old-app': {
+            'build_id': 'old-build',
+            'created_at': 0,
+            'status': 'building',
+            'tarball_url': 'tarball',
+        }}, f)
+
+    pool = Pool(happy, 'tarball', size=1, state_file=state_file)
+
+    assert pool.refill() == ['old-app']
+    assert not happy.create.called
+    happy.watch.assert_called_with('old-build', timeout=None)
+
+
+def test_refill_deletes_failed_apps(happy, state_file):
+    """Pool.refill should delete apps whose builds fail."""
+    happy.watch.side_effect = lambda build_id, timeout=None: _future(
+        BuildError('oh no')
+    )
+    pool = Pool(happy, 'tarball', size=1, state_file=state_file)
+
+    assert pool.refill() == []
+    happy.delete.assert_called_with(app_name='app-0')
+    assert pool.apps('building') == []
+
+
+def test_refill_delete_fails(happy, state_file):
+    """Pool.refill should keep going when deleting a failed app fails."""
+    happy.watch.side_effect = lambda build_id, timeout=None: _future(
+        BuildError('oh no') if build_id == 'build-app-0' else None
+    )
+    happy.delete.side_effect = APIError('nope')
+    pool = Pool(happy, 'tarball', size=2, state_file=state_file)
+
+    assert pool.refill() == ['app-1']
+    assert pool.apps('ready') == ['app-1']
+    assert pool.apps('failed') == ['app-0']
+
+    happy.delete.side_effect = None
+    happy.watch.side_effect = lambda build_id, timeout=None: _future()
+
+    assert pool.refill() == ['app-2']
+    happy.delete.assert_called_with(app_name='app-0')
+    assert pool.apps('failed') == []
+
+
+def test_apps_read_only(happy, state_file):
+    """Pool.apps shouldn't write the state file."""
+    pool = Pool(happy, 'tarball', size=1, state_file=state_file)
+    pool.refill()
+
+    with mock.patch('happy.locking.json.dumps') as dumps:
+        assert pool.apps('ready') == ['app-0']
+
+    assert not dumps.called
+
+
+def test_claim(happy, state_file):
+    """Pool.claim should hand out the oldest ready app, configure it and
+    forget it.
+    """
+    pool = Pool(happy, 'tarball', size=2, state_file=state_file)
+    pool.refill()
+
+    first = pool.claim(env={'HELLO': 'world'})
+    second = pool.claim()
+
+    assert first != second
+    assert pool.claim() is None
+
+    with open(state_file) as f:
+        assert json.load(f) == {}
+
+    happy.configure.assert_called_once_with(
+        app_name=first,
+        env={'HELLO': 'world'},
+    )
+
+
+def test_pools_by_tarball(happy, state_file):
+    """Pools for different tarballs should share a file but not apps."""
+    Pool(happy, 'one', size=1, state_file=state_file).refill()
+
+    assert Pool(happy, 'two', state_file=state_file).claim() is None
+    assert Pool(happy, 'one', state_file=state_file).claim() == 'app-0'
@@ -0,0 +1,180 @@
+"""
+Tests for phase timing.
+"""
+import json
+import threading
+
+import mock
+
+from happy.hooks import Hooks
+from happy.profile import Profiler, build_phase, normalize_endpoint
+
+
+def test_normalize_endpoint():
+    """normalize_endpoint should replace names and IDs with placeholders."""
+    assert normalize_endpoint('/apps') == '/apps'
+    assert normalize_endpoint('/apps/butt-man-123') == '/apps/:app'
+    assert normalize_endpoint('/apps/butt-man-123/config-vars') == \
+        '/apps/:app/config-vars'
+    assert normalize_endpoint('/app-setups/12345') == '/app-setups/:id'
+
+
+def test_build_phase():
+    """build_phase should tell provisioning, build and postdeploy apart."""
+    assert build_phase({'status': 'pending', 'build': None}) == \
+        'provisioning'
+    assert build_phase({
+        'status': 'pending',
+        'build': {'status': 'pending'},
+    }) == 'build'
+    assert build_phase({
+        'status': 'pending',
+        'build': {'status': 'succeeded'},
+    }) == 'postdeploy'
+    assert build_phase({'status': 'succeeded'}) is None
+
+
+@mock.patch('happy.profile.time')
+def test_phase(time):
+    """Profiler.phase should time a block of code."""
+    time.time.side_effect = [100, 101, 103]
+    profiler = Profiler()
+
+    with profiler.phase('upload'):
+        pass
+
+    assert profiler.phases == [
+        {'name': 'upload', 'build_id': None, 'start': 1, 'end': 3,
+         'duration': 2},
+    ]
+
+
+@mock.patch('happy.profile.time')
+def test_transition(time):
+    """Profiler.transition should end one phase when the next starts."""
+    time.time.side_effect = [100, 101, 102, 104, 107]
+    profiler = Profiler()
+
+    profiler.transition('provisioning')
+    profiler.transition('provisioning')
+    profiler.transition('build')
+    profiler.transition(None)
+
+    assert [
+        (phase['name'], phase['duration']) for phase in profiler.phases
+    ] == [('provisioning', 3), ('build', 3)]
+
+
+@mock.patch('happy.profile.time')
+def test_transition_per_build(time):
+    """Profiler should track each build's phases on their own."""
+    time.time.return_value = 100
+    profiler = Profiler()
+    hooks = Hooks()
+    profiler.subscribe(hooks)
+
+    def change(build_id, status, now):
+        time.time.return_value = 100 + now
+        hooks.fire('build_status_change', build_id=build_id, status=status,
+                   previous=None, data={})
+
+    change('1', 'provisioning', 0)
+    change('2', 'provisioning', 1)
+    change('1', 'build', 2)
+    change('2', 'build', 4)
+    change('1', 'postdeploy', 5)
+    change('1', 'succeeded', 6)
+    change('2', 'postdeploy', 7)
+    change('2', 'failed', 9)
+
+    assert sorted(
+        (phase['build_id'], phase['name'], phase['duration'])
+        for phase in profiler.phases
+    ) == [
+        ('1', 'build', 3),
+        ('1', 'postdeploy', 1),
+        ('1', 'provisioning', 2),
+        ('2', 'build', 3),
+        ('2', 'postdeploy', 2),
+        ('2', 'provisioning', 3),
+    ]
+
+
+def test_transition_concurrent():
+    """Builds changing phase from several threads should all be recorded."""
+    profiler = Profiler()
+
+    def run(build_id):
+        for name in ('provisioning', 'build', 'postdeploy', None):
+            profiler.transition(name, build_id=build_id)
+
+    threads = [
+        threading.Thread(target=run, args=(str(index),))
+        for index in range(8)
+    ]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert len(profiler.phases) == 24
+    assert all(
+        len([phase for phase in profiler.phases if phase['name'] == name])
+        == 8 for name in ('provisioning', 'build', 'postdeploy')
+    )
+
+
+def test_summary_overlapping_phases():
+    """Profiler.summary shouldn't count overlapping phases twice."""
+    profiler = Profiler()
+
+    profiler._add_phase('create', 0, 2, '1')
+    profiler._add_phase('create', 1, 3, '2')
+    profiler._add_phase('create', 5, 6, '3')
+
+    line = [
+        line for line in profiler.summary().splitlines()
+        if line.startswith('create')
+    ][0]
+
+    assert line.split() == ['create', '3', '1.667', '4.000']
+
+
+def test_summary():
+    """Profiler.summary should total phases and group API calls."""
+    profiler = Profiler()
+
+    profiler._add_phase('build', 0, 2)
+    profiler.record_request('GET', '/app-setups/1', profiler.start, 0.1,
+                            200, 10)
+    profiler.record_request('GET', '/app-setups/2', profiler.start, 0.3,
+                            200, 20)
+
+    summary = profiler.summary()
+
+    assert 'build' in summary
+    assert 'total' in summary
+    assert 'GET /app-setups/:id' in summary
+    assert '     2     200.0     300.0         30' in summary
+
+
+def test_write_json(tmpdir):
+    """Profiler.write_json should save everything recorded."""
+    path = str(tmpdir.join('profile.json'))
+    profiler = Profiler()
+
+    with profiler.phase('create'):
+        profiler.record_request('POST', '/app-setups', profiler.start, 0.5,
+                                201, 100)
+
+    profiler.write_json(path)
+
+    with open(path) as f:
+        data = json.load(f)
+
+    assert data['phases'][0]['name'] == 'create'
+    assert data['requests'][0]['endpoint'] == '/app-setups'
+    assert data['requests'][0]['status'] == 201
+    assert 'total' in data
@@ -0,0 +1,54 @@
+"""
+Tests for API rate limiting.
+"""
+import mock
+
+from happy.ratelimit import RateLimiter
+
+
+def test_acquire():
+    """RateLimiter.acquire should take a token from the bucket."""
+    limiter = RateLimiter(capacity=10, refill_rate=0.0001, reserve=0)
+
+    limiter.acquire()
+    limiter.acquire()
+
+    assert 7.99 < limiter.remaining < 8.01
+
+
+def test_update():
+    """RateLimiter.update should reset the bucket to the API's count."""
+    limiter = RateLimiter(refill_rate=0.0001)
+
+    limiter.update(42)
+
+    assert 41.99 < limiter.remaining < 42.01
+
+
+@mock.patch('happy.ratelimit.time.sleep')
+def test_acquire_waits_near_reserve(sleep):
+    """RateLimiter.acquire should slow down once it reaches the reserve."""
+    limiter = RateLimiter(refill_rate=1, reserve=10)
+    limiter.update(10)
+
+    def fake_sleep(delay):
+        limiter.update(11)
+
+    sleep.side_effect = fake_sleep
+
+    limiter.acquire()
+
+    assert sleep.called
+    assert 0.9 < sleep.call_args[0][0] <= 1
+
+
+def test_state_file(tmpdir):
+    """RateLimiters with the same state file should share a bucket."""
+    path = str(tmpdir.join('ratelimit'))
+    first = RateLimiter(refill_rate=0.0001, reserve=0, state_file=path)
+    second = RateLimiter(refill_rate=0.0001, reserve=0, state_file=path)
+
+    first.update(50)
+    second.acquire()
+
+    assert 48.99 < first.remaining < 49.01
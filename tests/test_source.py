@@ -0,0 +1,123 @@
+"""
+Tests for packaging local source code.
+"""
+import io
+import os
+import subprocess
+import tarfile
+
+import mock
+import pytest
+
+from happy.source import SourceCache, Tarball, list_files
+
+
+@pytest.fixture
+def root(tmpdir):
+    """Returns a directory with some files in it."""
+    tmpdir.join('app.json').write('{}')
+    tmpdir.join('ignored.log').write('log')
+    tmpdir.join('.gitignore').write('*.log\n')
+    tmpdir.mkdir('lib').join('thing.py').write('print("hi")\n' * 10000)
+
+    return str(tmpdir)
+
+
+def test_list_files(root):
+    """list_files should list every file outside of git."""
+    assert list_files(root) == [
+        '.gitignore',
+        'app.json',
+        'ignored.log',
+        os.path.join('lib', 'thing.py'),
+    ]
+
+
+def test_list_files_gitignore(root):
+    """list_files should respect .gitignore in a git work tree."""
+    subprocess.check_call(['git', 'init', '-q', root])
+
+    assert list_files(root) == [
+        '.gitignore',
+        'app.json',
+        'lib/thing.py',
+    ]
+
+
+def test_tarball(root):
+    """Tarball should stream a gzipped tarball of the files."""
+    tarball = Tarball(root)
+    data = b''.join(tarball)
+
+    with tarfile.open(fileobj=io.BytesIO(data), mode='r:gz') as tar:
+        assert sorted(tar.getnames()) == [
+            '.gitignore',
+            'app.json',
+            'ignored.log',
+            'lib/thing.py',
+        ]
+        assert tar.extractfile('app.json').read() == b'{}'
+        assert tar.extractfile('lib/thing.py').read() == \
+            b'print("hi")\n' * 10000
+
+
+def test_tarball_length(root):
+    """Tarball's length should match the bytes it streams, every time."""
+    tarball = Tarball(root)
+
+    assert len(tarball) == len(b''.join(tarball)) == len(b''.join(tarball))
+
+
+def test_tarball_chunks(root):
+    """Tarball should stream in chunks rather than all at once."""
+    with open(os.path.join(root, 'big'), 'wb') as f:
+        f.write(os.urandom(1024 * 1024))
+
+    chunks = list(Tarball(root, paths=['big']))
+
+    assert len(chunks) > 1
+    assert max(len(chunk) for chunk in chunks) < 256 * 1024
+
+
+def test_tarball_digest(root):
+    """Tarball.digest should change only when the files do."""
+    digest = Tarball(root).digest()
+
+    assert Tarball(root).digest() == digest
+
+    with open(os.path.join(root, 'app.json'), 'w') as f:
+        f.write('{"changed": true}')
+
+    assert Tarball(root).digest() != digest
+
+
+def test_source_cache(tmpdir):
+    """SourceCache should remember uploads and count hits and misses."""
+    cache = SourceCache(str(tmpdir.join('cache', 'sources.json')))
+
+    assert cache.get('abc') is None
+
+    cache.put('abc', 'get-url', size=1000)
+
+    assert cache.get('abc') == 'get-url'
+    assert cache.get('abc') == 'get-url'
+    assert cache.stats() == {
+        'bytes_saved': 2000,
+        'hit_rate': 2 / 3.0,
+        'hits': 2,
+        'misses': 1,
+    }
+
+
+@mock.patch('happy.source.time')
+def test_source_cache_expires(time, tmpdir):
+    """SourceCache should forget uploads once their URLs expire."""
+    time.time.return_value = 1000
+    cache = SourceCache(str(tmpdir.join('sources.json')), ttl=60)
+    cache.put('abc', 'get-url', size=1000)
+
+    time.time.return_value = 1059
+    assert cache.get('abc') == 'get-url'
+
+    time.time.return_value = 1060
+    assert cache.get('abc') is None
@@ -0,0 +1,113 @@
+"""
+Tests for the record of apps brought up from a workspace.
+"""
+import json
+import os
+import threading
+
+import mock
+import pytest
+
+from happy.state import State
+
+
+@pytest.fixture
+def state(tmpdir):
+    """Returns a State kept in a temporary directory."""
+    return State(str(tmpdir.join('.happy')))
+
+
+def test_add(state):
+    """State.add should record an app."""
+    with mock.patch('happy.state.time.time', return_value=100.0):
+        state.add('app-1', build_id='123', tarball_url='tarball',
+                  status='building', tags=['b', 'a', 'b'])
+
+    assert state.get('app-1') == {
+        'name': 'app-1',
+        'build_id': '123',
+        'build_type': 'app-setup',
+        'tarball_url': 'tarball',
+        'created_at': 100.0,
+        'status': 'building',
+        'tags': ['a', 'b'],
+    }
+    assert state.get('app-2') is None
+
+
+def test_update(state):
+    """State.update should change a recorded app only."""
+    state.add('app-1', status='building')
+
+    assert state.update('app-1', status='up')['status'] == 'up'
+    assert state.get('app-1')['status'] == 'up'
+    assert state.update('app-2', status='up') is None
+    assert state.get('app-2') is None
+
+
+def test_remove_deletes_file(state):
+    """State.remove should delete the file when no apps are left."""
+    state.add('app-1')
+    state.add('app-2')
+
+    state.remove(['app-1'])
+
+    assert os.path.exists(state.path)
+
+    state.remove(['app-2', 'app-3'])
+
+    assert not os.path.exists(state.path)
+    assert state.apps() == []
+
+
+def test_apps_filters(state):
+    """State.apps should filter by tag, status and age, oldest first."""
+    for created_at, app_name, status, tags in [
+        (300.0, 'app-3', 'up', ['ci']),
+        (100.0, 'app-1', 'up', ['ci']),
+        (200.0, 'app-2', 'building', []),
+    ]:
+        with mock.patch('happy.state.time.time', return_value=created_at):
+            state.add(app_name, status=status, tags=tags)
+
+    def names(**kwargs):
+        with mock.patch('happy.state.time.time', return_value=400.0):
+            return [record['name'] for record in state.apps(**kwargs)]
+
+    assert names() == ['app-1', 'app-2', 'app-3']
+    assert names(tag='ci') == ['app-1', 'app-3']
+    assert names(status='building') == ['app-2']
+    assert names(older_than=150) == ['app-1', 'app-2']
+
+
+def test_legacy_file(state):
+    """A file of plain app names should be read and upgraded."""
+    with open(state.path, 'w') as f:
+        f.write('app-1\napp-2')
+
+    assert [record['name'] for record in state.apps()] == ['app-1', 'app-2']
+    assert state.get('app-1')['status'] == 'up'
+
+    state.remove(['app-1'])
+
+    with open(state.path) as f:
+        data = json.load(f)
+
+    assert data['version'] == 1
+    assert list(data['apps']) == ['app-2']
+
+
+def test_concurrent_adds(state):
+    """Apps added from several threads at once should all be recorded."""
+    threads = [
+        threading.Thread(target=state.add, args=('app-%d' % index,))
+        for index in range(20)
+    ]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert len(state.apps()) == 20
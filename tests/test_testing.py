@@ -0,0 +1,178 @@
+"""
+Tests for the fake Heroku API server.
+"""
+import time
+
+import mock
+import pytest
+
+from happy import Happy
+from happy.heroku import APIError, BuildError, Heroku, RateLimitError
+from happy.testing import FakeHeroku, lognormal, uniform
+
+
+@pytest.fixture
+def fake(request):
+    """Returns a running fake server, stopped after the test."""
+    server = FakeHeroku().start()
+    request.addfinalizer(server.stop)
+
+    return server
+
+
+def client(fake, **kwargs):
+    """Returns a Heroku client pointed at a fake server."""
+    return Heroku(auth_token='fake', api_root=fake.url, **kwargs)
+
+
+def test_app_lifecycle(fake):
+    """FakeHeroku should create, build and delete apps."""
+    happy = Happy(api=client(fake))
+
+    build_id, app_name = happy.create('example.com', env={'BUTT': 'man'})
+
+    with mock.patch('happy.sleep'):
+        happy.wait(build_id)
+
+    assert fake.apps[app_name]['config_vars'] == {'BUTT': 'man'}
+    assert happy.find_apps('fake-*') == [app_name]
+
+    happy.delete(app_name)
+
+    assert fake.apps == {}
+    assert fake.request_counts['POST /app-setups'] == 1
+    assert fake.request_counts['DELETE /apps/:app'] == 1
+
+
+def test_build_phases(fake):
+    """FakeHeroku should move app-setups through their phases over time."""
+    fake.build_time = 100
+    api = client(fake)
+    setup = api.create_build('example.com')
+
+    def phase_at(elapsed):
+        fake.setups[setup['id']]['created_at'] = time.time() - elapsed
+        data = api.get_build(setup['id'])
+
+        return (data['status'], (data['build'] or {}).get('status'))
+
+    assert phase_at(10) == ('pending', None)
+    assert phase_at(50) == ('pending', 'pending')
+    assert phase_at(95) == ('pending', 'succeeded')
+    assert phase_at(100) == ('succeeded', 'succeeded')
+
+
+def test_build_failures(fake):
+    """FakeHeroku should fail builds at the failure rate."""
+    fake.failure_rate = 1
+    api = client(fake)
+
+    setup = api.create_build('example.com')
+
+    with pytest.raises(BuildError):
+        api.check_build_status(setup['id'])
+
+
+def test_capacity(fake):
+    """FakeHeroku should refuse apps past its capacity."""
+    fake.capacity = 1
+    api = client(fake)
+
+    api.create_build('example.com')
+
+    with pytest.raises(APIError):
+        api.create_build('example.com')
+
+    assert fake.peak_apps == 1
+
+
+def test_rate_limit(fake):
+    """FakeHeroku should send rate limit headers and 429 when it's out."""
+    fake.rate_limit = fake._tokens = 2
+    fake.refill_rate = 0
+    api = client(fake, retries=0)
+
+    api.list_apps()
+
+    assert api.rate_limit_remaining == 1
+
+    api.list_apps()
+
+    with pytest.raises(RateLimitError):
+        api.list_apps()
+
+
+@mock.patch('happy.heroku.sleep')
+def test_error_injection(sleep, fake):
+    """FakeHeroku should inject 5xx errors that the client retries."""
+    fake.error_rate = 1
+    api = client(fake, retries=2)
+
+    with pytest.raises(APIError):
+        api.list_apps()
+
+    assert fake.request_counts['GET /apps'] == 3
+
+
+def test_etags(fake):
+    """FakeHeroku should send 304s for unchanged GETs."""
+    api = client(fake)
+    setup = api.create_build('example.com')
+
+    assert api.get_build(setup['id']) == api.get_build(setup['id'])
+    assert fake.not_modified == 1
+
+
+def test_not_found(fake):
+    """FakeHeroku should 404 on unknown apps."""
+    with pytest.raises(APIError):
+        client(fake).delete_app('nope')
+
+
+def test_source_upload(fake, tmpdir):
+    """FakeHeroku should accept source uploads."""
+    tmpdir.join('app.json').write('{}')
+    happy = Happy(api=client(fake))
+
+    url = happy.upload(str(tmpdir))
+
+    assert url.startswith(fake.url)
+    assert list(fake.sources.values())[0] > 0
+
+
+def test_distributions():
+    """uniform and lognormal should give durations in a sensible range."""
+    assert 1 <= uniform(1, 2, seed=1)() <= 2
+    assert 0 < lognormal(0.1, 0.5, seed=1)() < 10
+
+
+def test_pagination(fake):
+    """FakeHeroku should page through lists with Range headers."""
+    api = client(fake)
+
+    for index in range(5):
+        api.create_build('example.com', app_name='app-%d' % index)
+
+    apps = [app['name'] for app in api.iter_apps(page_size=2)]
+
+    assert apps == ['app-0', 'app-1', 'app-2', 'app-3', 'app-4']
+    assert fake.request_counts['GET /apps'] == 3
+
+
+def test_rebuild(fake):
+    """FakeHeroku should build new code on existing apps."""
+    happy = Happy(api=client(fake))
+
+    build_id, app_name = happy.create('example.com')
+
+    with mock.patch('happy.sleep'):
+        happy.wait(build_id)
+
+        assert happy.app_exists(app_name)
+        assert not happy.app_exists('nope')
+
+        build_id = happy.rebuild(app_name, 'example.com', env={'A': 'b'})
+        happy.wait(build_id, app_name=app_name)
+
+    assert fake.apps[app_name]['config_vars'] == {'A': 'b'}
+    assert fake.request_counts['POST /apps/:app/builds'] == 1
@@ -0,0 +1,140 @@
+"""
+Tests for tracing.
+"""
+import json
+import threading
+
+import mock
+import pytest
+
+from happy.hooks import Hooks
+from happy.trace import Tracer
+
+
+def _spans(tracer):
+    """Returns a tracer's spans by name."""
+    return dict((span.name, span) for span in tracer.spans)
+
+
+def test_span_nesting():
+    """Spans should nest inside the span open in the same thread."""
+    tracer = Tracer()
+
+    with tracer.span('command'):
+        with tracer.span('create', app='butt-man-123', build_id=None):
+            pass
+
+    spans = _spans(tracer)
+
+    assert spans['command'].parent_id is None
+    assert spans['create'].parent_id == spans['command'].span_id
+    assert spans['create'].attributes == {'app': 'butt-man-123'}
+    assert spans['create'].end >= spans['create'].start
+
+
+def test_span_other_thread():
+    """Spans in threads with nothing open should nest in the first span."""
+    tracer = Tracer()
+    root = tracer.start_span('command')
+
+    def work():
+        with tracer.span('delete'):
+            pass
+
+    thread = threading.Thread(target=work)
+    thread.start()
+    thread.join()
+
+    tracer.end_span(root)
+
+    assert _spans(tracer)['delete'].parent_id == root.span_id
+
+
+def test_span_error():
+    """Spans should record the error their block raised."""
+    tracer = Tracer()
+
+    with pytest.raises(ValueError):
+        with tracer.span('create'):
+            raise ValueError('nope')
+
+    assert tracer.spans[0].attributes['error'] == 'nope'
+
+
+def test_subscribe():
+    """Tracer.subscribe should record a span for every API call."""
+    tracer = Tracer()
+    hooks = Hooks()
+    tracer.subscribe(hooks)
+
+    with tracer.span('wait'):
+        hooks.fire(
+            'after_response',
+            method='GET',
+            endpoint='/app-setups/12345',
+            attempt=0,
+            response=mock.Mock(status_code=200),
+            data={},
+            start=100.0,
+            latency=0.5,
+        )
+
+    spans = _spans(tracer)
+    request = spans['GET /app-setups/:id']
+
+    assert request.parent_id == spans['wait'].span_id
+    assert request.start == 100.0
+    assert request.end == 100.5
+    assert request.attributes['status'] == 200
+
+
+def test_to_chrome():
+    """Tracer.to_chrome should give complete events in microseconds."""
+    tracer = Tracer()
+
+    with tracer.span('command'):
+        pass
+
+    events = tracer.to_chrome()['traceEvents']
+    span = tracer.spans[0]
+
+    assert events[0]['name'] == 'command'
+    assert events[0]['ph'] == 'X'
+    assert events[0]['ts'] == int(span.start * 1e6)
+    assert events[0]['args']['span_id'] == span.span_id
+    assert events[1]['ph'] == 'M'
+
+
+def test_to_otlp():
+    """Tracer.to_otlp should give OTLP/JSON spans with their parents."""
+    tracer = Tracer()
+
+    with tracer.span('command'):
+        with tracer.span('delete', app='butt-man-123'):
+            pass
+
+    spans = tracer.to_otlp()['resourceSpans'][0]['scopeSpans'][0]['spans']
+
+    assert [span['name'] for span in spans] == ['command', 'delete']
+    assert spans[1]['traceId'] == tracer.trace_id
+    assert spans[1]['parentSpanId'] == spans[0]['spanId']
+    assert spans[1]['attributes'] == [
+        {'key': 'app', 'value': {'stringValue': 'butt-man-123'}},
+    ]
+
+
+def test_write(tmpdir):
+    """Tracer.write should save the trace in the chosen format."""
+    path = str(tmpdir.join('trace.json'))
+    tracer = Tracer()
+
+    with tracer.span('command'):
+        pass
+
+    tracer.write(path, format='otlp')
+
+    with open(path) as f:
+        assert 'resourceSpans' in json.load(f)
+
+    with pytest.raises(ValueError):
+        tracer.write(path, format='butt')
@@ -0,0 +1,153 @@
+"""
+Tests for the build watcher.
+"""
+import threading
+import time
+
+import mock
+import pytest
+from concurrent.futures import CancelledError
+
+from happy.heroku import BuildError, BuildTimeout
+from happy.polling import Backoff
+from happy.watcher import BuildWatcher
+
+
+def fast():
+    """Returns a polling policy that doesn't wait around."""
+    return Backoff(initial=0.001, maximum=0.001, jitter=0)
+
+
+def done(result):
+    """Returns what checking on a build gives when it's done or not."""
+    return (result, 'succeeded' if result else 'build')
+
+
+@pytest.fixture
+def check():
+    """Returns a mocked build check."""
+    return mock.Mock(return_value=done(True))
+
+
+def test_watch(check):
+    """BuildWatcher should resolve a build's future when it succeeds."""
+    check.side_effect = (done(False), done(False), done(True))
+
+    with BuildWatcher(check, max_rate=1000) as watcher:
+        future = watcher.watch('123', policy=fast())
+
+        assert future.result(timeout=5) is True
+
+    assert check.call_args_list == [
+        mock.call('123', None),
+        mock.call('123', 'build'),
+        mock.call('123', 'build'),
+    ]
+
+
+def test_watch_many(check):
+    """BuildWatcher should poll every build from a single thread."""
+    threads = set()
+
+    def check_build(build_id, status):
+        threads.add(threading.current_thread())
+        return done(True)
+
+    check.side_effect = check_build
+
+    with BuildWatcher(check, max_rate=1000) as watcher:
+        futures = [watcher.watch(str(i), policy=fast()) for i in range(20)]
+
+        assert all(future.result(timeout=5) for future in futures)
+
+    assert len(threads) == 1
+
+
+def test_watch_max_rate(check):
+    """BuildWatcher should space out status checks across all builds."""
+    start = time.time()
+
+    with BuildWatcher(check, max_rate=50) as watcher:
+        futures = [watcher.watch(str(i), policy=fast()) for i in range(6)]
+
+        [future.result(timeout=5) for future in futures]
+
+    assert time.time() - start >= 5 / 50.0
+
+
+def test_watch_build_error(check):
+    """BuildWatcher should pass along build errors."""
+    check.side_effect = BuildError('oh no')
+
+    with BuildWatcher(check, max_rate=1000) as watcher:
+        future = watcher.watch('123')
+
+        with pytest.raises(BuildError):
+            future.result(timeout=5)
+
+
+def test_watch_timeout(check):
+    """BuildWatcher should give up when the policy does."""
+    check.return_value = done(False)
+    policy = mock.Mock()
+    policy.delays.return_value = iter([0.001])
+
+    with BuildWatcher(check, max_rate=1000) as watcher:
+        future = watcher.watch('123', policy=policy)
+
+        with pytest.raises(BuildTimeout):
+            future.result(timeout=5)
+
+    assert check.call_count == 2
+
+
+def test_watch_callback(check):
+    """BuildWatcher should call the callback when the build is done."""
+    called = threading.Event()
+
+    with BuildWatcher(check, max_rate=1000) as watcher:
+        watcher.watch('123', callback=lambda future: called.set())
+
+        assert called.wait(5)
+
+
+def test_close(check):
+    """BuildWatcher.close should cancel builds still being watched."""
+    check.return_value = done(False)
+    watcher = BuildWatcher(check, max_rate=1000)
+
+    future = watcher.watch('123', policy=Backoff(initial=60, jitter=0))
+    watcher.close()
+
+    with pytest.raises(CancelledError):
+        future.result(timeout=5)
+
+    with pytest.raises(RuntimeError):
+        watcher.watch('456')
+
+
+def test_cancel_while_polling(check):
+    """Cancelling a future mid-poll shouldn't stop other builds resolving."""
+    polling = threading.Event()
+    cancelled = threading.Event()
+
+    def check_build(build_id, status):
+        if build_id == 'a':
+            polling.set()
+            assert cancelled.wait(5)
+
+        return done(True)
+
+    check.side_effect = check_build
+
+    with BuildWatcher(check, max_rate=1000) as watcher:
+        first = watcher.watch('a', policy=fast())
+
+        assert polling.wait(5)
+        assert first.cancel()
+        cancelled.set()
+
+        second = watcher.watch('b', policy=fast())
+
+        assert second.result(timeout=5) is True
+        assert watcher._thread.is_alive()